@@ -0,0 +1,514 @@
+# benchmark.py - Offline ingestion and retrieval benchmark (no network, deterministic corpus)
+#
+#   python benchmark.py                          # default corpus sizes, writes benchmark-results.json
+#   python benchmark.py --sizes 50,500 --queries 200 --output before.json
+#   python benchmark.py --compare before.json    # print changes against an earlier run
+#   python benchmark.py --recall                 # recall@k vs memory of compressed vector settings
+#
+# Every corpus size runs in a fresh process against a throwaway local index,
+# with a deterministic fake embedding model in place of OpenAI.
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Windows: peak working set from psutil when installed, else traced Python allocations
+    resource = None
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SIZES = "50,200,1000"
+PAGES_PER_DOC = 10
+PAGE_CHARS = 1800
+BENCH_DIMENSIONS = 256
+
+SYMBOLS = [
+    "MsgSendv", "MsgReceivev", "MsgReply", "ChannelCreate", "ChannelDestroy", "ConnectAttach",
+    "ConnectDetach", "InterruptAttach", "InterruptWait", "ThreadCreate", "SyncMutexLock",
+    "TimerTimeout", "resmgr_attach", "iofunc_read_default", "vdev_read", "vdev_write",
+    "vdev_register", "pulse_attach", "dispatch_create", "mmap_device_memory",
+]
+WORDS = (
+    "the a kernel message channel thread buffer client server pulse driver interrupt memory "
+    "handler request reply blocks returns value error when length copy device virtual guest "
+    "priority timeout connection process resource manager queue state lock shared mapping"
+).split()
+SEMANTIC_QUERIES = [
+    "how does a client send a message to a server",
+    "what happens when the reply buffer is too small",
+    "how are interrupts delivered to a driver thread",
+    "timeout handling for blocking kernel calls",
+    "register a virtual device with the hypervisor",
+]
+
+
+def synthetic_page(rng: random.Random, doc: int, page: int) -> str:
+    """Prose with embedded API identifiers, about PAGE_CHARS long"""
+    sentences = [f"Document {doc} page {page}."]
+    length = len(sentences[0])
+    while length < PAGE_CHARS:
+        words = rng.choices(WORDS, k=rng.randint(8, 18))
+        words.insert(rng.randrange(len(words)), rng.choice(SYMBOLS) + ("()" if rng.random() < 0.3 else ""))
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def generate_corpus(root: str, pages: int, scanned_docs: int, seed: int = 1234) -> Dict[str, List[str]]:
+    """Write TXT files, digital PDFs and image-only (scanned) PDFs; returns paths per kind"""
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    n_docs = max(1, pages // PAGES_PER_DOC)
+    kinds = {"txt": [], "pdf": [], "scanned": []}
+    for doc in range(n_docs):
+        texts = [synthetic_page(rng, doc, p) for p in range(PAGES_PER_DOC)]
+        if doc < scanned_docs:
+            path = os.path.join(root, f"scanned_{doc:04d}.pdf")
+            with fitz.open() as pdf:
+                for text in texts:
+                    page = pdf.new_page()
+                    page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=9)
+                    pixmap = page.get_pixmap(dpi=100)
+                    pdf.delete_page(-1)
+                    pdf.new_page().insert_image(fitz.Rect(0, 0, 595, 842), pixmap=pixmap)
+                pdf.save(path)
+            kinds["scanned"].append(path)
+        elif doc % 2:
+            path = os.path.join(root, f"doc_{doc:04d}.pdf")
+            with fitz.open() as pdf:
+                for text in texts:
+                    page = pdf.new_page()
+                    page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=9)
+                pdf.save(path)
+            kinds["pdf"].append(path)
+        else:
+            path = os.path.join(root, f"doc_{doc:04d}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(texts))
+            kinds["txt"].append(path)
+    return kinds
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "mean_ms": round(float(values.mean()), 3),
+    }
+
+
+def stage_result(seconds: float, items: int, unit: str) -> Dict[str, float]:
+    return {
+        "seconds": round(seconds, 4),
+        unit: items,
+        f"{unit}_per_second": round(items / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def memory_source() -> str:
+    """How peak_rss_mb measures on this platform"""
+    if resource is not None:
+        return "getrusage"
+    try:
+        import psutil  # noqa: F401
+        return "psutil"
+    except ImportError:
+        return "tracemalloc"
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """Peak memory of this process (or of its finished child processes) in MB, None if unknown
+
+    With tracemalloc only Python and numpy allocations are counted, not the
+    whole resident set, and only after start_memory_tracking().
+    """
+    source = memory_source()
+    if source == "getrusage":
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+        return round(resource.getrusage(who).ru_maxrss / scale, 1)
+    if children:
+        return None
+    if source == "psutil":
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 2**20, 1)
+    if tracemalloc.is_tracing():
+        return round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+    return None
+
+
+def start_memory_tracking():
+    if memory_source() == "tracemalloc" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def run_size(pages: int, args: dict) -> dict:
+    """Benchmark one corpus size; runs in its own process so peak memory is per size"""
+    start_memory_tracking()
+    work = tempfile.mkdtemp(prefix=f"rag-bench-{pages}-")
+    # Everything the modules read at import time points into the scratch folder
+    os.environ.update({
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_INDEX_DIR": os.path.join(work, "index"),
+        "LOCAL_INDEX_MODE": args["index_mode"],
+        "LEXICAL_INDEX_DIR": os.path.join(work, "state"),
+        "BUILD_MANIFEST_DIR": os.path.join(work, "state"),
+        "DEDUP_INDEX_PATH": os.path.join(work, "state", "fingerprints.sqlite"),
+        "EMBEDDING_CACHE_PATH": "",
+        "OCR_CACHE_PATH": "",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "offline-benchmark",
+        "MCP_WARMUP": "0",
+    })
+    if args["ocr_workers"]:
+        os.environ["OCR_WORKERS"] = str(args["ocr_workers"])
+
+    from fake_server import DeterministicEmbeddings
+    import ocr
+    import builder
+    import retriever
+    import main
+    from vectorstore import get_vector_store, upsert_vectors
+
+    class BenchEmbeddings(DeterministicEmbeddings):
+        """Deterministic embeddings with an optional simulated request latency"""
+
+        def __init__(self, dimensions: int, latency: float):
+            super().__init__(dimensions)
+            self.latency = latency
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            time.sleep(self.latency)
+            return super().embed_documents(texts)
+
+        def embed_query(self, text: str) -> List[float]:
+            time.sleep(self.latency)
+            return super().embed_query(text)
+
+        async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+            await asyncio.sleep(self.latency)
+            return await asyncio.to_thread(DeterministicEmbeddings.embed_documents, self, texts)
+
+        async def aembed_query(self, text: str) -> List[float]:
+            return (await self.aembed_documents([text]))[0]
+
+    embeddings = BenchEmbeddings(args["dimensions"], args["embed_latency_ms"] / 1000)
+    ocr_available = bool(shutil.which(ocr.TESSERACT_PATH) or os.path.exists(ocr.TESSERACT_PATH))
+    scanned_docs = args["scanned_docs"] if ocr_available else 0
+
+    t = time.perf_counter()
+    corpus = generate_corpus(os.path.join(work, "docs"), pages, scanned_docs, args["seed"])
+    corpus_info = {
+        "pages": pages,
+        "documents": sum(len(paths) for paths in corpus.values()),
+        "txt_files": len(corpus["txt"]),
+        "pdf_files": len(corpus["pdf"]),
+        "scanned_pdf_files": len(corpus["scanned"]),
+        "generate_seconds": round(time.perf_counter() - t, 3),
+    }
+    all_paths = sorted(p for paths in corpus.values() for p in paths)
+    log = io.StringIO()
+
+    # --- Ingestion, one stage at a time ---
+    stages = {}
+    b = builder.DocumentBuilder(all_paths, index_name="stages")
+    b.embeddings = b.batch_embeddings = embeddings
+    with contextlib.redirect_stdout(log):
+        t = time.perf_counter()
+        docs = [d for path in corpus["txt"] + corpus["pdf"] for d in b.iter_file_documents(path)]
+        stages["extract"] = stage_result(time.perf_counter() - t, len(docs), "pages")
+
+        if corpus["scanned"]:
+            t = time.perf_counter()
+            scanned = [d for path in corpus["scanned"] for d in b.iter_file_documents(path)]
+            stages["ocr"] = stage_result(time.perf_counter() - t, len(scanned), "pages")
+            docs.extend(scanned)
+        else:
+            stages["ocr"] = {"skipped": "tesseract not found" if not ocr_available else "no scanned documents"}
+        if b._ocr is not None:
+            b._ocr.close()
+
+        t = time.perf_counter()
+        chunks = list(b._chunk_stage(iter(docs)))
+        stages["chunk"] = stage_result(time.perf_counter() - t, len(chunks), "chunks")
+
+        texts = [c.page_content for c in chunks]
+        batch = builder.EMBED_BATCH_SIZE
+        t = time.perf_counter()
+        vectors = []
+        for start in range(0, len(texts), batch):
+            vectors.extend(embeddings.embed_documents(texts[start:start + batch]))
+        stages["embed"] = stage_result(time.perf_counter() - t, len(texts), "chunks")
+
+        store = get_vector_store("stages", embeddings)
+        t = time.perf_counter()
+        for start in range(0, len(chunks), batch):
+            part = chunks[start:start + batch]
+            upsert_vectors(store, [c.id for c in part], vectors[start:start + batch],
+                           [c.page_content for c in part], [c.metadata for c in part])
+        stages["upsert"] = stage_result(time.perf_counter() - t, len(chunks), "chunks")
+        del docs, chunks, texts, vectors, store
+
+        # --- Ingestion end to end (streaming pipeline, as builder.py runs it) ---
+        b = builder.DocumentBuilder(all_paths, index_name="bench")
+        b.embeddings = b.batch_embeddings = embeddings
+        t = time.perf_counter()
+        b.build_and_upsert()
+        elapsed = time.perf_counter() - t
+    pipeline = b.ingest_stats.as_dict()
+    pipeline["wall_seconds"] = round(elapsed, 3)
+    pipeline["pages_per_second"] = round(pages / elapsed, 1)
+
+    # --- Query latency through the MCP tool functions ---
+    r = retriever.DocumentRetriever("bench")
+    r.embeddings = embeddings
+    main._retrievers[""] = r
+    rng = random.Random(args["seed"])
+    query_sets = {"symbol": SYMBOLS, "semantic": SEMANTIC_QUERIES}
+    tools = {"query_knowledge": main.query_knowledge, "query_knowledge_with_scores": main.query_knowledge_with_scores}
+
+    async def measure() -> dict:
+        results = {}
+        for tool_name, tool in tools.items():
+            results[tool_name] = {}
+            for set_name, queries in query_sets.items():
+                series = {}
+                for cache in ("cold", "warm"):
+                    samples = []
+                    for _ in range(args["queries"]):
+                        query = rng.choice(queries)
+                        if cache == "cold":
+                            r.invalidate_cache()
+                            r.query_embedding_cache.clear()
+                        t = time.perf_counter()
+                        result = await tool(query, k=args["k"])
+                        samples.append(time.perf_counter() - t)
+                        if result and "error" in result[0]:
+                            raise RuntimeError(result[0]["error"])
+                    series[cache] = percentiles(samples)
+                results[tool_name][set_name] = series
+        return results
+
+    query = asyncio.run(measure())
+    shutil.rmtree(work, ignore_errors=True)
+    return {
+        "corpus": corpus_info,
+        "ingest": {"stages": stages, "pipeline": pipeline},
+        "query": query,
+        "memory": {
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(children=True),
+            "source": memory_source(),
+        },
+    }
+
+
+def synthetic_embeddings(rows: int, dimensions: int, clusters: int, seed: int) -> np.ndarray:
+    """Clustered vectors whose variance decays along the dimensions
+
+    Matryoshka-trained models put most of the signal in the leading
+    dimensions; the decaying spectrum imitates that, so truncated settings
+    are not judged on isotropic noise. Use --vectors with real embeddings
+    for numbers that carry over to production.
+    """
+    rng = np.random.default_rng(seed)
+    spectrum = (1.0 + np.arange(dimensions) / 32.0) ** -0.5
+    centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+    data = centers[rng.integers(0, clusters, rows)] + 0.7 * rng.standard_normal((rows, dimensions)).astype(np.float32)
+    return (data * spectrum).astype(np.float32)
+
+
+def run_recall(args: dict) -> dict:
+    """Recall@k, latency and memory per (dimensions, quantization) against exact full-dimension search"""
+    from local_index import LocalVectorStore
+
+    if args["vectors"]:
+        data = np.load(args["vectors"]).astype(np.float32)
+    else:
+        data = synthetic_embeddings(args["recall_rows"] + args["queries"], args["recall_dimensions"], 1000, args["seed"])
+    # Held-out rows serve as queries
+    corpus, queries = data[:-args["queries"]], data[-args["queries"]:]
+    rows, full = corpus.shape
+    k = args["k"]
+
+    def normalize(m: np.ndarray) -> np.ndarray:
+        return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+    truth = [set(np.argsort(-(normalize(corpus) @ q))[:k]) for q in normalize(queries)]
+    dims = [d for d in (full, 512, 256) if d <= full]
+    results = []
+    for dim in dims:
+        # Matryoshka truncation: keep the leading dimensions and renormalise
+        vectors, query_vectors = normalize(corpus[:, :dim]), normalize(queries[:, :dim])
+        settings = [("none", 1)] + [
+            (quantization, factor) for quantization in ("int8", "binary") for factor in args["rescore_factors"]
+        ]
+        for quantization, factor in settings:
+            work = tempfile.mkdtemp(prefix="rag-recall-")
+            store = LocalVectorStore(work, quantization=quantization, rescore_factor=factor)
+            for start in range(0, rows, 20000):
+                batch = vectors[start:start + 20000]
+                ids = [str(i) for i in range(start, start + len(batch))]
+                store.add_vectors(ids, batch, [""] * len(batch), [{} for _ in batch])
+            store.similarity_search_by_vector_with_score(query_vectors[0].tolist(), k=k)
+            samples, hits = [], 0
+            for q, expected in zip(query_vectors, truth):
+                t = time.perf_counter()
+                found = store.similarity_search_by_vector_with_score(q.tolist(), k=k)
+                samples.append(time.perf_counter() - t)
+                hits += len(expected & {int(doc.id) for doc, _ in found})
+            # Bytes per vector the first search stage has to keep in memory
+            scanned = {"none": 4 * dim, "int8": dim + 4, "binary": (dim + 63) // 64 * 8}[quantization]
+            results.append({
+                "dimensions": dim,
+                "quantization": quantization,
+                "rescore_factor": factor if quantization != "none" else None,
+                f"recall@{k}": round(hits / (k * len(truth)), 4),
+                "latency": percentiles(samples),
+                "scanned_bytes_per_vector": scanned,
+                "scanned_gb_per_million": round(scanned * 1e6 / 2**30, 3),
+            })
+            del store
+            shutil.rmtree(work, ignore_errors=True)
+    return {"rows": rows, "full_dimensions": full, "k": k, "settings": results}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def summary_rows(report: dict) -> Dict[str, float]:
+    """Flatten the headline numbers of a report into {label: value}"""
+    rows = {}
+    for run in report["results"]:
+        pages = run["corpus"]["pages"]
+        for stage, data in run["ingest"]["stages"].items():
+            for key, value in data.items():
+                if key.endswith("_per_second") and value is not None:
+                    rows[f"{pages}p ingest {stage} {key}"] = value
+        rows[f"{pages}p ingest pipeline pages_per_second"] = run["ingest"]["pipeline"]["pages_per_second"]
+        for tool, sets in run["query"].items():
+            for set_name, series in sets.items():
+                for cache, stats in series.items():
+                    for key in ("p50_ms", "p95_ms", "p99_ms"):
+                        rows[f"{pages}p {tool} {set_name} {cache} {key}"] = stats[key]
+        if run["memory"]["peak_rss_mb"] is not None:
+            rows[f"{pages}p peak_rss_mb"] = run["memory"]["peak_rss_mb"]
+    return rows
+
+
+def compare(current: dict, baseline: dict):
+    before, after = summary_rows(baseline), summary_rows(current)
+    print(f"\nChanges vs {baseline['meta'].get('commit', '?')}:")
+    for label, value in after.items():
+        if label in before and before[label]:
+            change = (value - before[label]) / before[label] * 100
+            print(f"  {label:<70} {before[label]:>10} -> {value:>10} ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmark")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated corpus sizes in pages")
+    parser.add_argument("--queries", type=int, default=100, help="Queries per tool, query set and cache state")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dimensions", type=int, default=BENCH_DIMENSIONS)
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0,
+                        help="Simulated embedding request latency (0 = measure local work only)")
+    parser.add_argument("--scanned-docs", type=int, default=1,
+                        help="Image-only PDFs per corpus (needs tesseract, skipped otherwise)")
+    parser.add_argument("--ocr-workers", type=int, default=0, help="OCR processes (0 = OCR_WORKERS default)")
+    parser.add_argument("--index-mode", default="exact", choices=["exact", "ivf"])
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    parser.add_argument("--recall", action="store_true",
+                        help="Benchmark compressed vector settings (recall@k vs memory) instead of the pipeline")
+    parser.add_argument("--vectors", help="--recall: .npy matrix of real embeddings (default: synthetic)")
+    parser.add_argument("--recall-rows", type=int, default=100000)
+    parser.add_argument("--recall-dimensions", type=int, default=1536)
+    parser.add_argument("--rescore-factors", default="10,40",
+                        help="--recall: comma-separated candidates rescored per result (LOCAL_RESCORE_FACTOR)")
+    args = parser.parse_args()
+
+    if args.recall:
+        args.queries = min(args.queries, 200)
+        args.rescore_factors = [int(f) for f in args.rescore_factors.split(",") if f.strip()]
+        report = run_recall(vars(args))
+        print(f"{report['rows']} vectors, {report['full_dimensions']} dimensions")
+        for row in report["settings"]:
+            setting = row["quantization"] + (f" x{row['rescore_factor']}" if row["rescore_factor"] else "")
+            print(f"  {row['dimensions']:>5}d {setting:<11} recall@{args.k} {row[f'recall@{args.k}']:.3f}  "
+                  f"p50 {row['latency']['p50_ms']:>7} ms  {row['scanned_bytes_per_vector']:>5} B/vector "
+                  f"({row['scanned_gb_per_million']} GB per million)")
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                       "recall": report}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+        sys.exit(0)
+
+    settings = {
+        key: value for key, value in vars(args).items() if key not in ("sizes", "output", "compare")
+    }
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "settings": settings,
+        },
+        "results": [],
+    }
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        print(f"Benchmarking {size} pages...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            result = executor.submit(run_size, size, settings).result()
+        report["results"].append(result)
+        stages = result["ingest"]["stages"]
+        print(f"  ingest: {result['ingest']['pipeline']['pages_per_second']} pages/sec end to end, "
+              f"embed {stages['embed']['chunks_per_second']} chunks/sec, upsert {stages['upsert']['chunks_per_second']} chunks/sec")
+        for tool, sets in result["query"].items():
+            for set_name, series in sets.items():
+                cold, warm = series["cold"], series["warm"]
+                print(f"  {tool} [{set_name}]: cold p50 {cold['p50_ms']} / p99 {cold['p99_ms']} ms, "
+                      f"warm p50 {warm['p50_ms']} / p99 {warm['p99_ms']} ms")
+        print(f"  peak RSS {result['memory']['peak_rss_mb']} MB ({result['memory']['source']})")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
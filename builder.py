@@ -1,123 +1,225 @@
 # builder.py - Build vector database from PDF documents
-from langchain_community.document_loaders import TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+import asyncio
 import os
 import hashlib
-from typing import List
-import fitz  # PyMuPDF
-from PIL import Image
-import pytesseract
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from dotenv import load_dotenv
+from embedding_cache import get_embedding_cache, make_embeddings
+from vectorstore import (
+    VECTOR_NAMESPACE, VECTOR_STORE_BACKEND, get_vector_store, finalize_vector_store, upsert_vectors,
+    mark_index_updated, partition_name
+)
+from manifest import BuildManifest, file_sha256
+from pipeline import Pipeline
+from ingest_engine import IngestEngine
+from lexical_index import get_lexical_index
+from dedup import get_fingerprint_index, hamming, simhash
+from chunker import CHUNK_TOKENS, Chunker
+from tokens import count_tokens
+from metrics import metrics
 
 # Load environment variables from .env file
 load_dotenv()
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Auto-discover all PDF and TXT files in ghidra_docs folder
+# PDF and TXT files in this folder are ingested (see discover_documents)
 DOCS_DIR = os.path.join(SCRIPT_DIR, "ghidra_docs")
-DOCUMENT_PATHS = []
-if os.path.exists(DOCS_DIR):
-    for file in os.listdir(DOCS_DIR):
-        if file.lower().endswith(('.pdf', '.txt')):
-            DOCUMENT_PATHS.append(os.path.join(DOCS_DIR, file))
-    DOCUMENT_PATHS.sort()  # Sort alphabetically for consistent processing
 
 # Load from environment variables (from .env file)
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "rag-mcp-server")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Validate required API keys
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY not found in environment variables. Please set it in .env file.")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables. Please set it in .env file.")
 
-# Set API keys as environment variables (for langchain)
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+def check_api_keys():
+    """Validate required API keys (on first use, not at import)"""
+    if VECTOR_STORE_BACKEND == "pinecone" and not PINECONE_API_KEY:
+        raise ValueError("PINECONE_API_KEY not found in environment variables. Please set it in .env file.")
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not found in environment variables. Please set it in .env file.")
+    
+    # Set API keys as environment variables (for langchain)
+    if PINECONE_API_KEY:
+        os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
+    os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+
+
+def discover_documents(docs_dir: str = DOCS_DIR) -> List[str]:
+    """All PDF and TXT files in the docs folder, sorted for consistent processing"""
+    if not os.path.exists(docs_dir):
+        return []
+    return sorted(
+        os.path.join(docs_dir, file)
+        for file in os.listdir(docs_dir)
+        if file.lower().endswith(('.pdf', '.txt'))
+    )
+
+
+# Streaming ingestion: max chunks per embedding/upsert batch (batches are also
+# capped by EMBED_BATCH_TOKENS) and upserted batches buffered for bookkeeping
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+# TXT files are read in segments of roughly this many characters
+TEXT_SEGMENT_CHARS = 1_000_000
+
 
-pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH", "C:\\Program Files\\Tesseract-OCR\\tesseract.exe")
+class FileDone:
+    """Pipeline marker that follows the last chunk of a file"""
+    
+    def __init__(self, path: str, error: Exception = None):
+        self.path = path
+        self.error = error
+
+
+def make_id(source: str, page: int, text: str, occurrence: int = 0) -> str:
+    """ID derived from the chunk's whitespace-normalized text, not its position
 
+    Inserting or removing text elsewhere in the file leaves the IDs of
+    unchanged chunks alone; occurrence tells repeated identical chunks
+    on one page apart.
+    """
+    key = f"{source}-{page}-{occurrence}\n{' '.join(text.split())}"
+    return hashlib.sha256(key.encode()).hexdigest()
 
-def make_id(source: str, page: int, chunk_id: int) -> str:
 
-    key = f"{source}-{page}-{chunk_id}"
+def content_id(source: str, text: str) -> str:
+    """ID derived from the chunk text, so distinct notes under one source never collide"""
+    key = f"{source}\n{text}"
     return hashlib.sha256(key.encode()).hexdigest()
 
 
 class DocumentBuilder:
     """Build and manage vector database from PDF documents"""
     
-    def __init__(self, document_paths: List[str] = None, index_name: str = PINECONE_INDEX_NAME):
-        self.document_paths = document_paths or DOCUMENT_PATHS
+    def __init__(
+        self,
+        document_paths: List[str] = None,
+        index_name: str = PINECONE_INDEX_NAME,
+        namespace: str = VECTOR_NAMESPACE,
+    ):
+        check_api_keys()
+        self.document_paths = discover_documents() if document_paths is None else document_paths
         self.index_name = index_name
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=OPENAI_API_KEY
-        )
+        # Corpus/tenant partition of the index; the manifest and lexical index are kept per namespace
+        self.namespace = namespace or None
+        self.partition = partition_name(index_name, self.namespace)
+        self.embeddings = make_embeddings(OPENAI_API_KEY, pooled=True, resilient=True)
+        # Bulk ingestion retries through IngestEngine, which needs to see 429s itself
+        self.batch_embeddings = make_embeddings(OPENAI_API_KEY, max_retries=0)
+        # OCR stack (PyMuPDF, Pillow, Tesseract) is only loaded for PDF ingestion
+        self._ocr = None
+        # Long-lived vector store connection for knowledge writes (see connect)
+        self.vectorstore = None
+        self.lexical = get_lexical_index(self.partition)
+        # SimHash fingerprints of saved notes (None when DEDUP_INDEX_PATH is empty)
+        self.fingerprints = get_fingerprint_index()
+        self.ingest_stats = None
     
-    def extract_text_with_ocr(self, pdf_path: str) -> List[Document]:
-        """Extract text from PDF using OCR (for scanned PDF images)"""
-        documents = []
-        pdf_document = fitz.open(pdf_path)
-        
-        total_pages = len(pdf_document)
-        print(f"Processing {total_pages} pages from {os.path.basename(pdf_path)}...")
-        
-        for page_num in range(total_pages):
-            page = pdf_document[page_num]
-            
-            text = page.get_text()
-            if len(text.strip()) < 100:
-                mat = fitz.Matrix(2.0, 2.0)  # 2x zoom
-                pix = page.get_pixmap(matrix=mat)
-                
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                
-                try:
-                    text = pytesseract.image_to_string(img, lang='eng')
-                except Exception as e:
-                    print(f"OCR failed for page {page_num}: {e}")
-                    text = ""
-            
+    @property
+    def ocr(self):
+        if self._ocr is None:
+            from ocr import PageOcr
+            self._ocr = PageOcr()
+        return self._ocr
+    
+    def iter_pdf_pages(self, pdf_path: str) -> Iterator[Document]:
+        """Yield one Document per non-empty PDF page, OCR'ing scanned pages (see ocr.PageOcr)"""
+        for page_num, text in self.ocr.iter_pages(pdf_path):
             if text.strip():
-                documents.append(Document(
+                yield Document(
                     page_content=text,
                     metadata={
                         "source": pdf_path,
                         "file_name": os.path.basename(pdf_path),
+                        "type": "pdf",
                         "page": page_num,
                         "text_length": len(text)
                     }
-                ))
-        
-        pdf_document.close()
+                )
+    
+    def extract_text_with_ocr(self, pdf_path: str) -> List[Document]:
+        """Extract text from PDF using OCR (for scanned PDF images)"""
+        documents = list(self.iter_pdf_pages(pdf_path))
         print(f"Extracted {len(documents)} pages with content")
         return documents
     
+    def iter_text_segments(self, txt_path: str) -> Iterator[Document]:
+        """Yield a TXT file as paragraph-aligned segments instead of one huge Document"""
+        carry = ""
+        with open(txt_path, "r", encoding="utf-8") as f:
+            while True:
+                block = f.read(TEXT_SEGMENT_CHARS)
+                at_end = len(block) < TEXT_SEGMENT_CHARS
+                text = carry + block
+                cut = len(text) if at_end else text.rfind("\n\n")
+                if cut <= 0:
+                    cut = len(text)
+                segment, carry = text[:cut], text[cut:]
+                if segment.strip():
+                    yield Document(
+                        page_content=segment,
+                        metadata={"source": txt_path, "file_name": os.path.basename(txt_path), "type": "txt"},
+                    )
+                if at_end:
+                    break
+    
+    def iter_file_documents(self, doc_path: str) -> Iterator[Document]:
+        """Stream the pages/segments of one PDF or TXT file"""
+        if doc_path.lower().endswith('.pdf'):
+            yield from self.iter_pdf_pages(doc_path)
+        elif doc_path.lower().endswith('.txt'):
+            yield from self.iter_text_segments(doc_path)
+        else:
+            print(f"Unsupported file type: {doc_path}")
+    
+    def _text_splitter(self) -> Chunker:
+        # Sized in embedding tokens; cuts prefer headings, functions and paragraphs (see chunker.py)
+        return Chunker()
+    
     def chunk_documents(self, documents: List[Document]) -> List[Document]:
         """Split documents into chunks optimized for text-embedding-3-small"""
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,  
-            chunk_overlap=160,
-            separators=["\n\n", "\n", "class ", "def ", "public void", ". "]
-        )
-        splits = text_splitter.split_documents(documents)
+        splits = self._text_splitter().split_documents(documents)
         
-        # Add chunk_id to metadata
-        for i, split in enumerate(splits):
-            split.metadata["chunk_id"] = i
+        # Add chunk_id to metadata, numbered per source so that adding or
+        # removing one file never shifts the IDs of another
+        next_chunk_id = {}
+        for split in splits:
+            source = split.metadata.get("source", "unknown")
+            split.metadata["chunk_id"] = next_chunk_id.get(source, 0)
+            next_chunk_id[source] = split.metadata["chunk_id"] + 1
             if "text_length" not in split.metadata:
                 split.metadata["text_length"] = len(split.page_content)
         
         print(f"Created {len(splits)} chunks")
         return splits
     
+    def load_file(self, doc_path: str) -> List[Document]:
+        """Load one PDF (with OCR fallback) or TXT file"""
+        if doc_path.lower().endswith('.pdf'):
+            docs = self.extract_text_with_ocr(doc_path)
+        elif doc_path.lower().endswith('.txt'):
+            from langchain_community.document_loaders import TextLoader
+            loader = TextLoader(doc_path, encoding='utf-8')
+            docs = loader.load()
+        else:
+            print(f"Unsupported file type: {doc_path}")
+            return []
+        
+        # Check content
+        if docs:
+            total_chars = sum(len(doc.page_content) for doc in docs)
+            if total_chars == 0:
+                print(f"No content extracted from: {doc_path}")
+                return []
+        
+        return docs
+    
     def load_documents(self) -> List[Document]:
         """Load all documents from configured paths"""
         all_docs = []
@@ -130,24 +232,7 @@ class DocumentBuilder:
                 continue
                 
             try:
-                if doc_path.lower().endswith('.pdf'):
-                    docs = self.extract_text_with_ocr(doc_path)
-                        
-                elif doc_path.lower().endswith('.txt'):
-                    loader = TextLoader(doc_path, encoding='utf-8')
-                    docs = loader.load()
-                else:
-                    print(f"Unsupported file type: {doc_path}")
-                    continue
-                
-                # Check content
-                if docs:
-                    total_chars = sum(len(doc.page_content) for doc in docs)
-                    if total_chars == 0:
-                        print(f"No content extracted from: {doc_path}")
-                        continue
-                
-                all_docs.extend(docs)
+                all_docs.extend(self.load_file(doc_path))
             except Exception as e:
                 print(f"Error processing {doc_path}: {e}")
                 continue
@@ -157,48 +242,321 @@ class DocumentBuilder:
         
         return all_docs
     
-    def build_and_upsert(self) -> PineconeVectorStore:
-        """Build vector database: load PDFs, OCR, chunk, embed, and upsert to Pinecone"""
+    def chunk_ids(self, splits: List[Document], seen: Counter = None) -> List[str]:
+        """Content-derived vector IDs for chunks produced by chunk_documents
+
+        seen counts the IDs already handed out, so that streaming callers
+        number repeated chunks of one file consistently across calls.
+        """
+        seen = Counter() if seen is None else seen
+        ids = []
+        for doc in splits:
+            source = doc.metadata.get("source", "unknown")
+            page = doc.metadata.get("page", 0)
+            base = make_id(source, page, doc.page_content)
+            occurrence = seen[base]
+            seen[base] += 1
+            ids.append(base if occurrence == 0 else make_id(source, page, doc.page_content, occurrence))
+        return ids
+    
+    def build_and_upsert(self, incremental: bool = False, prune: bool = False) -> VectorStore:
+        """Build vector database: load PDFs, OCR, chunk, embed, and upsert to the vector store
+
+        With incremental=True, files whose content hash matches the build
+        manifest are skipped, and changed files are diffed chunk by chunk:
+        only chunks whose content-derived ID is new get embedded. In both
+        modes vectors that belonged to rewritten files, or to files that no
+        longer exist on disk, are deleted from the index. Files that still
+        exist but are not part of this run (another --docs-dir, a subset of
+        paths) keep their vectors unless prune=True.
+        """
         print("=" * 60)
-        print("Starting document ingestion pipeline...")
+        print(f"Starting {'incremental' if incremental else 'full'} document ingestion pipeline...")
         print("=" * 60)
         
-        print("\n[1/3] Loading documents...")
-        all_docs = self.load_documents()
-        print(f"Total documents loaded: {len(all_docs)}")
+        manifest = BuildManifest(self.partition)
+        vectorstore = get_vector_store(self.index_name, self.embeddings, namespace=self.namespace)
+        lexical = self.lexical
         
-        print("\n[2/3] Chunking documents...")
-        splits = self.chunk_documents(all_docs)
+        print("\n[1/3] Scanning documents...")
+        print(f"Found {len(self.document_paths)} document(s)")
+        hashes = {}
+        for doc_path in self.document_paths:
+            if not os.path.exists(doc_path):
+                print(f"File not found: {doc_path}")
+                continue
+            hashes[doc_path] = file_sha256(doc_path)
         
-        if not splits:
-            raise ValueError("Cannot create chunks from documents")
+        pending = [p for p in hashes if not (incremental and manifest.is_current(p, hashes[p]))]
+        removed = [p for p in manifest.files if p not in hashes and (prune or not os.path.exists(p))]
+        print(f"{len(hashes) - len(pending)} unchanged, {len(pending)} to process, {len(removed)} removed")
         
-        print(f"\n[3/3] Embedding and upserting {len(splits)} chunks to Pinecone...")
+        deleted = 0
+        for doc_path in removed:
+            stale_ids = manifest.ids_for(doc_path)
+            if stale_ids:
+                vectorstore.delete(ids=stale_ids)
+                lexical.delete(stale_ids)
+                deleted += len(stale_ids)
+            manifest.remove(doc_path)
+        manifest.save()
+        if lexical.dirty:
+            lexical.save()
         
-        ids = [
-            make_id(
-                doc.metadata.get("source", "unknown"),
-                doc.metadata.get("page", 0),
-                doc.metadata.get("chunk_id", i)
-            )
-            for i, doc in enumerate(splits)
-        ]
+        if not pending:
+            if not incremental:
+                raise ValueError("No documents found to process")
+            print("\n✓ Index is up to date, nothing to ingest")
+            return vectorstore
         
-        vectorstore = PineconeVectorStore.from_documents(
-            documents=splits,
-            embedding=self.embeddings,
-            ids=ids,
-            index_name=self.index_name
+        print(f"\n[2/3] Streaming {len(pending)} document(s): extract -> chunk -> embed -> upsert to {VECTOR_STORE_BACKEND} index...")
+        start = time.perf_counter()
+        total_chunks = 0
+        file_ids = {}
+        total_unchanged = 0
+        # Chunk IDs each changed file already has in the index, and the ones this run kept
+        known = {p: set(manifest.ids_for(p)) for p in pending} if incremental else {}
+        kept: Dict[str, List[str]] = {}
+        engine = IngestEngine(
+            embed=self.batch_embeddings.aembed_documents,
+            upsert=lambda ids, vectors, texts, metadatas: upsert_vectors(vectorstore, ids, vectors, texts, metadatas),
+            max_batch_items=EMBED_BATCH_SIZE,
+        )
+        stages = Pipeline(
+            self._extract_stage(pending),
+            [lambda items: self._chunk_stage(items, known, kept), engine.run],
+            queue_sizes=[16, 2 * EMBED_BATCH_SIZE, PIPELINE_QUEUE_SIZE],
         )
+        try:
+            for item in stages:
+                if isinstance(item, FileDone):
+                    ids = file_ids.pop(item.path, [])
+                    unchanged = kept.pop(item.path, [])
+                    ids += unchanged
+                    old_ids = manifest.ids_for(item.path)
+                    if item.error is not None:
+                        # Roll back what this run wrote for the failed file, keep the old version
+                        partial = sorted(set(ids) - set(old_ids))
+                        if partial:
+                            vectorstore.delete(ids=partial)
+                            lexical.delete(partial)
+                        continue
+                    
+                    # Drop vectors the previous version of this file produced but this one did not
+                    stale_ids = sorted(set(old_ids) - set(ids))
+                    if stale_ids:
+                        vectorstore.delete(ids=stale_ids)
+                        lexical.delete(stale_ids)
+                        deleted += len(stale_ids)
+                    if old_ids:
+                        print(f"{os.path.basename(item.path)}: {len(ids) - len(unchanged)} new, "
+                              f"{len(unchanged)} unchanged, {len(stale_ids)} removed chunks")
+                    total_unchanged += len(unchanged)
+                    manifest.record(item.path, hashes[item.path], ids)
+                    manifest.save()
+                    continue
+                
+                ids, texts, metadatas = item
+                lexical.add(ids, texts, metadatas)
+                for doc_id, metadata in zip(ids, metadatas):
+                    file_ids.setdefault(metadata["source"], []).append(doc_id)
+                if total_chunks == 0:
+                    print(f"First {len(ids)} vectors searchable after {time.perf_counter() - start:.1f}s")
+                total_chunks += len(ids)
+        finally:
+            if self._ocr is not None:
+                self._ocr.close()
+            # Saved even after a failure, so it matches what the manifest recorded
+            lexical.save()
+        
+        self.ingest_stats = engine.stats
+        print(f"Throughput: {engine.stats.summary()}")
+        
+        if total_chunks == 0 and not incremental:
+            raise ValueError("Cannot create chunks from documents")
+        
+        print("\n[3/3] Finalizing index...")
+        finalize_vector_store(vectorstore)
+        mark_index_updated()
         
         print("\n" + "=" * 60)
         print("✓ Vector database built successfully!")
-        print(f"✓ Index: {self.index_name}")
-        print(f"✓ Total chunks: {len(splits)}")
+        print(f"✓ Index: {self.index_name}" + (f" (namespace {self.namespace})" if self.namespace else ""))
+        print(f"✓ Total chunks: {total_chunks}")
+        if incremental:
+            print(f"✓ Unchanged chunks kept: {total_unchanged}")
+        print(f"✓ Stale vectors deleted: {deleted}")
+        print(f"✓ Lexical index: {len(lexical)} chunks")
+        cache = get_embedding_cache()
+        if cache is not None:
+            stats = cache.stats()
+            print(f"✓ Embedding cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']} hit rate)")
         print("=" * 60)
         
         return vectorstore
     
+    def _extract_stage(self, paths: List[str]) -> Iterator:
+        """Pipeline source: pages/segments of each file, followed by a FileDone marker"""
+        for n, doc_path in enumerate(paths, 1):
+            print(f"\n--- ({n}/{len(paths)}) {os.path.basename(doc_path)} ---")
+            try:
+                pages = self.iter_file_documents(doc_path)
+                while True:
+                    # Time each page's extraction/OCR, not the wait on the next stage
+                    start = time.perf_counter()
+                    page = next(pages, None)
+                    if page is None:
+                        break
+                    metrics.observe("ingest.extract", time.perf_counter() - start)
+                    yield page
+            except Exception as e:
+                print(f"Error processing {doc_path}: {e}")
+                metrics.inc("ingest.file_errors")
+                yield FileDone(doc_path, error=e)
+                continue
+            metrics.inc("ingest.files")
+            yield FileDone(doc_path)
+    
+    def _chunk_stage(
+        self, items: Iterator, known: Dict[str, Set[str]] = None, kept: Dict[str, List[str]] = None
+    ) -> Iterator:
+        """Split each page as it arrives; chunk_id keeps counting per source
+
+        Chunks whose ID is in known[source] are already in the index: they
+        are recorded in kept[source] instead of being embedded again.
+        """
+        text_splitter = self._text_splitter()
+        known = known or {}
+        next_chunk_id = {}
+        seen = {}
+        for item in items:
+            if isinstance(item, FileDone):
+                yield item
+                continue
+            with metrics.span("ingest.chunk"):
+                splits = text_splitter.split_documents([item])
+            for split in splits:
+                source = split.metadata.get("source", "unknown")
+                split.metadata["chunk_id"] = next_chunk_id.get(source, 0)
+                next_chunk_id[source] = split.metadata["chunk_id"] + 1
+                if "text_length" not in split.metadata:
+                    split.metadata["text_length"] = len(split.page_content)
+                split.id = self.chunk_ids([split], seen.setdefault(source, Counter()))[0]
+                if split.id in known.get(source, ()):
+                    kept.setdefault(source, []).append(split.id)
+                    metrics.inc("ingest.chunks_unchanged")
+                    continue
+                yield split
+    
+    def _manual_chunks(self, text_content: str, source_name: str, metadata: dict = None):
+        """Chunk manually added text; returns (chunks, ids)"""
+        # Prepare metadata
+        doc_metadata = {
+            "source": source_name,
+            "file_name": source_name,
+            "type": "manual_entry",
+            "added_by": "builder",
+            "text_length": len(text_content)
+        }
+        if metadata:
+            doc_metadata.update(metadata)
+        
+        # Create document
+        doc = Document(
+            page_content=text_content,
+            metadata=doc_metadata
+        )
+        
+        # Chunk if text is long (threshold = chunk size in tokens)
+        if count_tokens(text_content) > CHUNK_TOKENS:
+            chunks = self.chunk_documents([doc])
+        else:
+            chunks = [doc]
+            doc.metadata["chunk_id"] = 0
+        
+        # Content-derived IDs: re-saving the same note is idempotent, different notes never overwrite each other
+        return chunks, [content_id(source_name, chunk.page_content) for chunk in chunks]
+    
+    def note_fingerprint(self, text_content: str) -> Optional[int]:
+        """SimHash of a note, or None when near-duplicate suppression is off or the note has no tokens"""
+        if self.fingerprints is None:
+            return None
+        return simhash(text_content)
+    
+    def find_duplicate(
+        self, fingerprint: Optional[int], pending: Iterable[Tuple[int, str, str]] = ()
+    ) -> Optional[dict]:
+        """Response for a note near-identical to one already saved, or None
+
+        pending holds (fingerprint, doc_id, source) of notes that are queued
+        but not written yet (see write_buffer.py); they are checked too.
+        """
+        if fingerprint is None:
+            return None
+        with metrics.span("write.dedup"):
+            match = self.fingerprints.find(self.partition, fingerprint)
+            state = "already saved"
+            for queued, doc_id, source in pending:
+                distance = hamming(fingerprint, queued)
+                if distance <= self.fingerprints.max_distance and (match is None or distance < match[2]):
+                    match, state = (doc_id, source, distance), "queued"
+        if match is None:
+            return None
+        metrics.inc("write.duplicates")
+        doc_id, source, distance = match
+        return {
+            "status": "duplicate",
+            "message": f"Skipped: near-identical to a note {state} from '{source}'",
+            "duplicate_of": doc_id,
+            "source": source,
+            "distance_bits": str(distance)
+        }
+    
+    def remember_note(self, fingerprint: Optional[int], ids: List[str], source_name: str):
+        """Record a written note's fingerprint for later duplicate checks"""
+        if fingerprint is not None:
+            self.fingerprints.add(self.partition, fingerprint, ids[0], source_name)
+    
+    @staticmethod
+    def _added(chunks: List[Document], source_name: str) -> dict:
+        return {
+            "status": "success",
+            "message": f"Added {len(chunks)} chunk(s) from '{source_name}'",
+            "chunks_added": str(len(chunks)),
+            "source": source_name
+        }
+    
+    def connect(self) -> VectorStore:
+        """Open the vector store once and reuse it for every knowledge write"""
+        if self.vectorstore is None:
+            self.vectorstore = get_vector_store(self.index_name, self.embeddings, namespace=self.namespace)
+        return self.vectorstore
+    
+    def upsert_chunks(self, chunks: List[Document], ids: List[str]):
+        """Embed and upsert chunks in one batch, then signal readers"""
+        texts = [chunk.page_content for chunk in chunks]
+        with metrics.span("write.embed"):
+            vectors = self.embeddings.embed_documents(texts)
+        metadatas = [chunk.metadata for chunk in chunks]
+        upsert_vectors(self.connect(), ids, vectors, texts, metadatas, resilient=True)
+        with metrics.span("write.lexical"):
+            self.lexical.add(ids, texts, metadatas)
+            self.lexical.save()
+        mark_index_updated()
+    
+    async def aupsert_chunks(self, chunks: List[Document], ids: List[str]):
+        """Async upsert_chunks: embeds on the shared async HTTP client, upserts on a worker thread"""
+        texts = [chunk.page_content for chunk in chunks]
+        with metrics.span("write.embed"):
+            vectors = await self.embeddings.aembed_documents(texts)
+        vectorstore = await asyncio.to_thread(self.connect)
+        metadatas = [chunk.metadata for chunk in chunks]
+        await asyncio.to_thread(upsert_vectors, vectorstore, ids, vectors, texts, metadatas, resilient=True)
+        with metrics.span("write.lexical"):
+            self.lexical.add(ids, texts, metadatas)
+            await asyncio.to_thread(self.lexical.save)
+        mark_index_updated()
+    
     def add_text_to_db(self, text_content: str, source_name: str = "manual_entry", metadata: dict = None) -> dict:
         """Add text content directly to existing vector database
 
@@ -206,60 +564,71 @@ class DocumentBuilder:
         if not text_content or not text_content.strip():
             return {"status": "error", "message": "Text content is empty"}
         
+        metrics.inc("write.calls")
         try:
-            # Prepare metadata
-            doc_metadata = {
-                "source": source_name,
-                "file_name": source_name,
-                "type": "manual_entry",
-                "added_by": "builder",
-                "text_length": len(text_content)
-            }
-            if metadata:
-                doc_metadata.update(metadata)
-            
-            # Create document
-            doc = Document(
-                page_content=text_content,
-                metadata=doc_metadata
-            )
-            
-            # Chunk if text is long (threshold = chunk_size = 800)
-            if len(text_content) > 800:
-                chunks = self.chunk_documents([doc])
-            else:
-                chunks = [doc]
-                doc.metadata["chunk_id"] = 0
-            
-            # Generate deterministic IDs
-            ids = [
-                make_id(
-                    chunk.metadata.get("source", source_name),
-                    chunk.metadata.get("page", 0),
-                    chunk.metadata.get("chunk_id", i)
-                )
-                for i, chunk in enumerate(chunks)
-            ]
-            
-            # Add to vector store
-            vectorstore = PineconeVectorStore(
-                index_name=self.index_name,
-                embedding=self.embeddings
-            )
-            vectorstore.add_documents(chunks, ids=ids)
-            
-            return {
-                "status": "success",
-                "message": f"Added {len(chunks)} chunk(s) from '{source_name}'",
-                "chunks_added": str(len(chunks)),
-                "source": source_name
-            }
+            with metrics.span("write.total"):
+                fingerprint = self.note_fingerprint(text_content)
+                duplicate = self.find_duplicate(fingerprint)
+                if duplicate:
+                    return duplicate
+                with metrics.span("write.chunk"):
+                    chunks, ids = self._manual_chunks(text_content, source_name, metadata)
+                self.upsert_chunks(chunks, ids)
+                self.remember_note(fingerprint, ids, source_name)
+                return self._added(chunks, source_name)
         except Exception as e:
+            metrics.inc("write.errors")
             return {"status": "error", "message": f"Failed to add: {str(e)}"}
+    
+    async def aadd_text_to_db(self, text_content: str, source_name: str = "manual_entry", metadata: dict = None) -> dict:
+        """Async version of add_text_to_db"""
+        if not text_content or not text_content.strip():
+            return {"status": "error", "message": "Text content is empty"}
+        
+        metrics.inc("write.calls")
+        try:
+            with metrics.span("write.total"):
+                fingerprint = self.note_fingerprint(text_content)
+                duplicate = self.find_duplicate(fingerprint)
+                if duplicate:
+                    return duplicate
+                with metrics.span("write.chunk"):
+                    chunks, ids = self._manual_chunks(text_content, source_name, metadata)
+                await self.aupsert_chunks(chunks, ids)
+                self.remember_note(fingerprint, ids, source_name)
+                return self._added(chunks, source_name)
+        except Exception as e:
+            metrics.inc("write.errors")
+            return {"status": "error", "message": f"Failed to add: {str(e)}"}
+
+
+# Singleton instance
+_builder = None
+_builder_lock = threading.Lock()
 
+def get_builder() -> DocumentBuilder:
+    """Get or create the long-lived builder used for knowledge writes"""
+    global _builder
+    with _builder_lock:
+        if _builder is None:
+            _builder = DocumentBuilder()
+    return _builder
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Build vector database from documents in ghidra_docs")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process new or changed files (tracked in the build manifest)")
+    parser.add_argument("--docs-dir", default=DOCS_DIR,
+                        help="Folder of PDF/TXT files to ingest (default: ghidra_docs)")
+    parser.add_argument("--namespace", default=VECTOR_NAMESPACE,
+                        help="Write into this namespace (one per corpus or tenant; default: VECTOR_NAMESPACE)")
+    parser.add_argument("--prune", action="store_true",
+                        help="Also delete vectors of indexed files that are not in --docs-dir (default: only deleted files)")
+    args = parser.parse_args()
+    
     # Build vector database
-    builder = DocumentBuilder()
-    builder.build_and_upsert()
+    builder = DocumentBuilder(discover_documents(args.docs_dir), namespace=args.namespace)
+    builder.build_and_upsert(incremental=args.incremental, prune=args.prune)
     print("\nDone.")
@@ -0,0 +1,254 @@
+# chunker.py - Token-sized, structure-aware chunking for code listings, decompiler output and manuals
+import os
+import re
+import zlib
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from tokens import count_tokens_batch
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Chunk size and overlap in embedding-model tokens (~800 / 160 characters of prose)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# A chunk is only cut early at a structural boundary once it holds this share of CHUNK_TOKENS
+MIN_FILL = 0.6
+# Content-defined anchors: paragraph/declaration/section starts picked by a hash of the line
+# itself, about one per CHUNK_ANCHOR_EVERY chunks of text, always start a chunk. Chunks never
+# span an anchor, so an edit only re-chunks the text between the anchors around it (0 disables).
+CHUNK_ANCHOR_EVERY = int(os.getenv("CHUNK_ANCHOR_EVERY", "8"))
+
+# Boundary strength of a cut just before a unit
+NONE, HARD, SENTENCE, LINE, PARAGRAPH, DECLARATION, SECTION = range(-1, 6)
+
+# Line patterns, run once over a whole text with a leading newline so that each match
+# starts at the "\n" before its line (a literal prefix keeps the scans fast).
+# Declarations: C/C++/Java/Python keywords at the top level or one indent deep (class members)
+_KEYWORD_DECLARATION = re.compile(
+    r"\n[ \t]{0,4}(?:(?:public|private|protected|static|final|abstract|extern|inline|virtual)[ \t]+)*"
+    r"(?:class|interface|enum|struct|union|typedef|namespace|template|def|async[ \t]+def|function)\b"
+)
+# C-style function signatures, e.g. "undefined4 FUN_00401000(int param_1)" or "void __cdecl foo(void) {",
+# checked only on lines found by _SIGNATURE_END
+_SIGNATURE_END = re.compile(r"\)[ \t]*\{?[ \t]*(?=\n)")
+_SIGNATURE = re.compile(r"\n[ \t]{0,4}(?:[A-Za-z_][\w:<>]*[ \t*&]+){1,4}[A-Za-z_][\w:~]*[ \t]*\([^;\n]*\)[ \t]*\{?[ \t]*(?=\n)")
+# Decompiler banners and headings in manuals ("3.2.1 Message passing", "Chapter 4", "APPENDIX A")
+_SECTION = re.compile(
+    r"\n(?:/\*[ \t]*(?:Function|FUNCTION)\b|//[ \t]*Function\b|/\*{5,}|={5,}|-{5,}"
+    r"|\d+(?:\.\d+)*\.?[ \t]+[A-Z]\S*(?:[ \t]+\S+){0,10}[ \t]*(?=\n)"
+    r"|(?:Chapter|CHAPTER|Appendix|APPENDIX)[ \t]+\w+"
+    r"|[A-Z][A-Z0-9 ,:()/-]{3,60}(?=\n))"
+)
+# Closing a top-level block or class member ("}" or "};") ends a function or class
+_BLOCK_END = re.compile(r"\n[ \t]{0,4}\}[; \t]*(?=\n)")
+_SENTENCE_END = re.compile(r"[.;:!?][ \t]+")
+
+
+def _sentences(line: str) -> List[str]:
+    cuts = [0] + [m.end() for m in _SENTENCE_END.finditer(line)] + [len(line)]
+    return [line[a:b] for a, b in zip(cuts, cuts[1:]) if b > a]
+
+
+class Chunker:
+    """Greedy linear-pass chunker sized in tokens
+
+    The text is split into lines once (lines over the budget into
+    sentences, then at whitespace), every line is tokenized once, and
+    structural boundaries are found with one regex scan per pattern.
+    Chunks are then packed greedily with prefix sums over the line token
+    counts: when a chunk is full it is cut at the strongest boundary after
+    MIN_FILL of the budget (section/decompiler banner > declaration >
+    paragraph > line), so functions and sections start chunks whenever
+    possible. Overlap is carried over only for cuts inside a section.
+
+    Content-defined anchors (see CHUNK_ANCHOR_EVERY) split the text into
+    regions that are packed independently, so chunk boundaries - and the
+    content-derived chunk IDs built on them - stay put outside an edited
+    region.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = CHUNK_TOKENS,
+        overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+        anchor_every: int = CHUNK_ANCHOR_EVERY,
+    ):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = int(chunk_tokens * MIN_FILL)
+        self.anchor_every = anchor_every
+
+    def _lines(self, text: str) -> Tuple[List[str], List[int], List[int]]:
+        """Lines of text with their token counts and boundary strengths"""
+        lines = text.splitlines(keepends=True)
+        blank = list(map(str.isspace, lines))
+        after_blank = [True] + blank[:-1]
+        # Blank lines are never cut points; they stay with the text before them
+        strengths = [NONE if b else (PARAGRAPH if a else LINE) for b, a in zip(blank, after_blank)]
+
+        starts = list(accumulate(map(len, lines), initial=0))
+        padded = "\n" + text + "\n"
+
+        def line_index(match) -> int:
+            # The match starts at the newline before its line, which is that line's offset in text
+            return bisect_left(starts, match.start())
+
+        for m in _KEYWORD_DECLARATION.finditer(padded):
+            strengths[line_index(m)] = DECLARATION
+        for m in _SIGNATURE_END.finditer(padded):
+            line_start = padded.rfind("\n", 0, m.start())
+            if _SIGNATURE.match(padded, line_start, m.end() + 1):
+                strengths[bisect_left(starts, line_start)] = DECLARATION
+        for m in _SECTION.finditer(padded):
+            i = line_index(m)
+            if after_blank[i]:
+                strengths[i] = SECTION
+        for m in _BLOCK_END.finditer(padded):
+            # The next non-blank line after a closing brace starts a new top-level item
+            i = line_index(m) + 1
+            while i < len(lines) and blank[i]:
+                i += 1
+            if i < len(lines):
+                strengths[i] = SECTION
+
+        # Lines that are surely over the budget (tokens are rarely under 2 characters)
+        # are split into sentences before tokenizing, so their text is only counted once
+        long_lines = [i for i, line in enumerate(lines) if len(line) > 2 * self.chunk_tokens]
+        if long_lines:
+            lines, strengths = self._split_sentences(lines, strengths, long_lines)
+        tokens = count_tokens_batch(lines)
+
+        long_lines = [i for i, n in enumerate(tokens) if n > self.chunk_tokens]
+        if long_lines:
+            lines, tokens, strengths = self._split_long(lines, tokens, strengths, long_lines)
+        return lines, tokens, strengths
+
+    def _split_sentences(self, lines: List[str], strengths: List[int], long_lines: List[int]):
+        """Break lines at sentence ends; the first piece keeps the line's boundary strength"""
+        out_lines, out_strengths = [], []
+        prev = 0
+        for i in long_lines:
+            out_lines += lines[prev:i]
+            out_strengths += strengths[prev:i]
+            prev = i + 1
+            sentences = _sentences(lines[i])
+            out_lines += sentences
+            out_strengths += [strengths[i]] + [SENTENCE] * (len(sentences) - 1)
+        out_lines += lines[prev:]
+        out_strengths += strengths[prev:]
+        return out_lines, out_strengths
+
+    def _split_long(self, lines: List[str], tokens: List[int], strengths: List[int], long_lines: List[int]):
+        """Break lines over the budget at sentence ends, then at whitespace (pieces stay contiguous)"""
+        out_lines, out_tokens, out_strengths = [], [], []
+        prev = 0
+        for i in long_lines:
+            out_lines += lines[prev:i]
+            out_tokens += tokens[prev:i]
+            out_strengths += strengths[prev:i]
+            prev = i + 1
+
+            sentences = _sentences(lines[i])
+            for j, (sentence, count) in enumerate(zip(sentences, count_tokens_batch(sentences))):
+                first = strengths[i] if j == 0 else SENTENCE
+                if count <= self.chunk_tokens:
+                    out_lines.append(sentence)
+                    out_tokens.append(count)
+                    out_strengths.append(first)
+                    continue
+                # Hard split, sized by this sentence's own characters-per-token ratio
+                width = max(1, int(len(sentence) * self.chunk_tokens * 0.9 / count))
+                start = 0
+                while start < len(sentence):
+                    end = min(len(sentence), start + width)
+                    if end < len(sentence):
+                        space = sentence.rfind(" ", start + width // 2, end)
+                        end = space + 1 if space > 0 else end
+                    piece = sentence[start:end]
+                    out_lines.append(piece)
+                    out_tokens.append(count_tokens_batch([piece])[0])
+                    out_strengths.append(first if start == 0 else HARD)
+                    start = end
+        out_lines += lines[prev:]
+        out_tokens += tokens[prev:]
+        out_strengths += strengths[prev:]
+        return out_lines, out_tokens, out_strengths
+
+    def _anchors(self, lines: List[str], strengths: List[int], cum: List[int]) -> List[int]:
+        """Line indices that always start a chunk, chosen by content alone
+
+        A candidate boundary becomes an anchor when the hash of its line
+        falls under the share of the anchor spacing covered since the
+        previous candidate, so anchors average one per anchor_every chunks
+        whether paragraphs are short or long.
+        """
+        if self.anchor_every <= 0:
+            return []
+        scale = 0xFFFFFFFF / (self.anchor_every * self.chunk_tokens)
+        anchors = []
+        prev = 0
+        for i, strength in enumerate(strengths):
+            if strength < PARAGRAPH:
+                continue
+            if i and zlib.crc32(lines[i].strip().encode("utf-8")) < (cum[i] - cum[prev]) * scale:
+                anchors.append(i)
+            prev = i
+        return anchors
+
+    def split_with_tokens(self, text: str) -> List[Tuple[str, int]]:
+        """Split text into (chunk, token count) pairs"""
+        lines, tokens, strengths = self._lines(text)
+        n = len(lines)
+        if not n:
+            return []
+        cum = list(accumulate(tokens, initial=0))
+        chunks = []
+        bounds = [0] + self._anchors(lines, strengths, cum) + [n]
+        for start, stop in zip(bounds, bounds[1:]):
+            self._pack(lines, strengths, cum, start, stop, chunks)
+        return chunks
+
+    def _pack(self, lines: List[str], strengths: List[int], cum: List[int], start: int, stop: int, chunks: list):
+        """Greedily pack lines[start:stop] into chunks (appended to chunks)"""
+        chunk_tokens, min_tokens, overlap_tokens = self.chunk_tokens, self.min_tokens, self.overlap_tokens
+        while start < stop:
+            # Largest end with cum[end] - cum[start] <= budget (at least one line)
+            end = max(start + 1, bisect_right(cum, cum[start] + chunk_tokens, start, stop + 1) - 1)
+            cut = min(end, stop)
+            if end < stop:
+                # Strongest boundary once the chunk is MIN_FILL full; ties go to the fullest chunk
+                lo = max(start + 1, bisect_left(cum, cum[start] + min_tokens, start, end))
+                window = strengths[lo:end + 1]
+                if window:
+                    best = max(window)
+                    cut = lo + len(window) - 1 - window[::-1].index(best)
+
+            chunk = "".join(lines[start:cut]).strip()
+            if chunk:
+                chunks.append((chunk, cum[cut] - cum[start]))
+            if cut >= stop:
+                break
+
+            # Carry trailing lines over, unless the next chunk opens a new declaration or section
+            next_start = cut
+            if strengths[cut] < DECLARATION:
+                next_start = max(start + 1, bisect_left(cum, cum[cut] - overlap_tokens, start, cut))
+            start = next_start
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self.split_with_tokens(text)]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Chunk documents; each chunk keeps its parent's metadata plus its token count"""
+        splits = []
+        for doc in documents:
+            for text, tokens in self.split_with_tokens(doc.page_content):
+                splits.append(Document(page_content=text, metadata={**doc.metadata, "tokens": tokens}))
+        return splits
@@ -0,0 +1,238 @@
+# concurrency.py - Single-flight request coalescing, bounded concurrency gates and request deadlines
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from metrics import metrics
+
+# Absolute time.monotonic() deadline of the request being served (None = no deadline)
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time while waiting for the backend"""
+
+
+class Overloaded(RuntimeError):
+    """The backend queue is full; the request is refused instead of queued"""
+
+
+@contextmanager
+def request_deadline(seconds: float):
+    """Give the enclosed work `seconds` to finish (0 = no limit); an enclosing, earlier deadline wins
+
+    The deadline lives in a context variable, so it follows the request
+    into asyncio tasks and asyncio.to_thread calls.
+    """
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds > 0 else None
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Seconds left before the current request's deadline (default when there is none)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    return deadline - time.monotonic()
+
+
+class ConcurrencyGate:
+    """At most `limit` calls at once; up to `max_queue` more wait in FIFO order
+
+    A waiter gives up at its request deadline (or after max_wait seconds
+    when no deadline is set) with DeadlineExceeded, and a call that finds
+    the queue full fails at once with Overloaded, so a burst cannot pile
+    up unbounded work behind a rate-limited provider. The same gate serves
+    threads (slot) and coroutines (aslot). Queue depth and active calls
+    are published as gauges, the time spent waiting as a histogram.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait: Optional[float] = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _publish(self):
+        metrics.set_gauge(f"gate.{self.name}.queued", len(self._waiters))
+        metrics.set_gauge(f"gate.{self.name}.active", self.active)
+
+    def _timeout(self) -> Optional[float]:
+        timeout = remaining(self.max_wait)
+        if timeout is not None and timeout <= 0:
+            metrics.inc(f"gate.{self.name}.deadline_exceeded")
+            raise DeadlineExceeded(f"Deadline exceeded before calling the {self.name} backend")
+        return timeout
+
+    def _enter(self) -> Optional[Future]:
+        """Take a free slot (None) or join the queue (a future resolved when a slot is handed over)"""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self._publish()
+                return None
+            if len(self._waiters) >= self.max_queue:
+                metrics.inc(f"gate.{self.name}.rejected")
+                raise Overloaded(
+                    f"The {self.name} backend is overloaded ({self.active} calls running, "
+                    f"{len(self._waiters)} queued); try again shortly"
+                )
+            waiter = Future()
+            self._waiters.append(waiter)
+            self._publish()
+            return waiter
+
+    def _abandon(self, waiter: Future) -> bool:
+        """Leave the queue; True if the slot was handed over meanwhile (the caller then owns it)"""
+        with self._lock:
+            if waiter.done():
+                return True
+            self._waiters.remove(waiter)
+            self._publish()
+            return False
+
+    def _release(self):
+        with self._lock:
+            if self._waiters:
+                # The slot passes straight to the oldest waiter; active stays the same
+                self._waiters.popleft().set_result(None)
+            else:
+                self.active -= 1
+            self._publish()
+
+    def _expired(self, waited: float):
+        metrics.inc(f"gate.{self.name}.deadline_exceeded")
+        return DeadlineExceeded(f"Deadline exceeded after waiting {waited:.1f}s for the {self.name} backend")
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot for the enclosed call (blocking wait)"""
+        timeout = self._timeout()
+        start = time.perf_counter()
+        waiter = self._enter()
+        if waiter is not None:
+            try:
+                waiter.result(timeout=timeout)
+            except FutureTimeout:
+                if not self._abandon(waiter):
+                    raise self._expired(time.perf_counter() - start) from None
+        metrics.observe(f"gate.{self.name}.wait", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold one slot for the enclosed call (awaits without blocking the event loop)"""
+        timeout = self._timeout()
+        start = time.perf_counter()
+        waiter = self._enter()
+        if waiter is not None:
+            try:
+                # shield: a timeout or cancellation must not cancel the shared waiter future
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter)), timeout)
+            except BaseException as e:
+                if not self._abandon(waiter):
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise self._expired(time.perf_counter() - start) from None
+                    raise
+                if not isinstance(e, asyncio.TimeoutError):
+                    # Cancelled right after the slot was handed over: pass it on
+                    self._release()
+                    raise
+        metrics.observe(f"gate.{self.name}.wait", time.perf_counter() - start)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+class _LeaderCancelled(Exception):
+    """The caller computing a shared result was cancelled; a waiting caller takes over"""
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight computation
+
+    The first caller (the leader) runs the function; callers arriving
+    before it finishes wait for its result or exception instead of
+    repeating the work. Nothing is kept once the call completes - caching
+    finished results is the job of the caches in front of this.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                metrics.inc(f"singleflight.{self.name}.shared")
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._finish(key, future, error=e)
+                    raise
+                self._finish(key, future, result)
+                return result
+            try:
+                return future.result(timeout=remaining())
+            except FutureTimeout:
+                raise DeadlineExceeded(f"Deadline exceeded waiting for a shared {self.name} call") from None
+            except _LeaderCancelled:
+                continue
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future, leader = self._join(key)
+            if leader:
+                try:
+                    result = await fn()
+                except asyncio.CancelledError:
+                    self._finish(key, future, error=_LeaderCancelled())
+                    raise
+                except BaseException as e:
+                    self._finish(key, future, error=e)
+                    raise
+                self._finish(key, future, result)
+                return result
+            try:
+                return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"Deadline exceeded waiting for a shared {self.name} call") from None
+            except _LeaderCancelled:
+                continue
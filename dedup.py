@@ -0,0 +1,141 @@
+# dedup.py - SimHash fingerprints that catch near-duplicate knowledge notes before they are embedded
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from lexical_index import tokenize
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Set DEDUP_INDEX_PATH to an empty string to disable near-duplicate suppression
+DEDUP_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH", os.path.join(SCRIPT_DIR, ".cache", "fingerprints.sqlite"))
+FINGERPRINT_BITS = 64
+# Lookups probe 8 bands of 8 bits, which finds every match up to 7 bits apart
+BANDS = 8
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+# Notes whose fingerprints differ in at most this many bits count as duplicates.
+# 4 catches re-saves with small edits; rewordings of short notes drift further,
+# and going higher starts to merge different findings about the same API.
+DEDUP_MAX_DISTANCE = min(BANDS - 1, int(os.getenv("DEDUP_MAX_DISTANCE", "4")))
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash over code-aware tokens, weighted by term frequency
+
+    Word order and small edits move the fingerprint by a few bits, while
+    unrelated notes land about 32 bits apart. None for a text without
+    tokens (punctuation, scripts the tokenizer drops): such notes all
+    share one fingerprint and must not be compared.
+    """
+    counts = Counter(tokenize(text))
+    if not counts:
+        return None
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little") for t in counts],
+        dtype=np.uint64,
+    )
+    bits = (hashes[:, None] >> np.arange(FINGERPRINT_BITS, dtype=np.uint64)) & np.uint64(1)
+    weights = np.array(list(counts.values()), dtype=np.int64) @ (2 * bits.astype(np.int64) - 1)
+    return sum(1 << bit for bit in np.flatnonzero(weights > 0).tolist())
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _bands(fingerprint: int) -> Tuple[int, ...]:
+    mask = (1 << BAND_BITS) - 1
+    return tuple(fingerprint >> (i * BAND_BITS) & mask for i in range(BANDS))
+
+
+def _signed(fingerprint: int) -> int:
+    # SQLite integers are signed 64-bit
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+class FingerprintIndex:
+    """SQLite table of note fingerprints per index, banded for near-neighbour lookups"""
+
+    def __init__(self, path: str = DEDUP_INDEX_PATH, max_distance: int = DEDUP_MAX_DISTANCE):
+        self.path = path
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                index_name TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                fingerprint INTEGER NOT NULL,
+                %s,
+                created REAL NOT NULL,
+                PRIMARY KEY (index_name, doc_id)
+            );
+            %s
+            """ % (
+                ",\n".join(f"band{i} INTEGER NOT NULL" for i in range(BANDS)),
+                "\n".join(
+                    f"CREATE INDEX IF NOT EXISTS idx_fp_band{i} ON fingerprints (index_name, band{i});"
+                    for i in range(BANDS)
+                ),
+            )
+        )
+        self._conn.commit()
+
+    def find(self, index_name: str, fingerprint: int) -> Optional[Tuple[str, str, int]]:
+        """Closest stored note within max_distance bits as (doc_id, source, distance)"""
+        # Two fingerprints within BANDS - 1 bits agree exactly on at least one band
+        bands = " OR ".join(f"band{i} = ?" for i in range(BANDS))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT doc_id, source, fingerprint FROM fingerprints WHERE index_name = ? AND ({bands})",
+                (index_name, *_bands(fingerprint)),
+            ).fetchall()
+        best = None
+        for doc_id, source, stored in rows:
+            distance = hamming(fingerprint, stored & ((1 << 64) - 1))
+            if distance <= self.max_distance and (best is None or distance < best[2]):
+                best = (doc_id, source, distance)
+        return best
+
+    def add(self, index_name: str, fingerprint: int, doc_id: str, source: str):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, {', '.join('?' * BANDS)}, ?)",
+                (index_name, doc_id, source, _signed(fingerprint), *_bands(fingerprint), time.time()),
+            )
+            self._conn.commit()
+
+    def count(self, index_name: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM fingerprints WHERE index_name = ?", (index_name,)
+            ).fetchone()[0]
+
+
+# Shared instance (one SQLite connection per process)
+_index = None
+
+
+def get_fingerprint_index() -> Optional[FingerprintIndex]:
+    """Get or create the fingerprint index, or None when disabled"""
+    global _index
+    if not DEDUP_INDEX_PATH:
+        return None
+    if _index is None:
+        _index = FingerprintIndex()
+    return _index
@@ -0,0 +1,327 @@
+# embedding_cache.py - Persistent content-addressed embedding cache shared by builder and retriever
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+from metrics import metrics
+from tokens import count_tokens_batch
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Matryoshka-style shortened embeddings via the API's `dimensions` option (0 = native 1536).
+# Changing it needs a full rebuild: the index dimension must match the query embeddings.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+# Set EMBEDDING_CACHE_PATH to an empty string to disable the cache
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(SCRIPT_DIR, ".cache", "embeddings.sqlite")
+)
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+# Embedding requests of up to this many texts may be hedged (see resilience.py)
+HEDGE_MAX_TEXTS = 8
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache keyed by (model, dimensions, sha256 of text)
+
+    Entries carry a last-used timestamp; once the stored vectors exceed
+    max_bytes the least recently used entries are evicted. The stored size
+    is counted once at startup and kept as a running total, so writes do
+    not scan the table.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_mb: int = EMBEDDING_CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+            """
+        )
+        self._conn.commit()
+        self.total_bytes = self._size()
+
+    def _size(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, dimensions: int, hashes: List[str]) -> Dict[str, List[float]]:
+        """Return cached vectors for the given text hashes and refresh their LRU stamp"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})",
+                    [model, dimensions, *batch],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND dimensions = ? AND text_hash = ?",
+                    [(now, model, dimensions, h) for h in found],
+                )
+                self._conn.commit()
+            self.hits += sum(1 for h in hashes if h in found)
+            self.misses += sum(1 for h in hashes if h not in found)
+        return found
+
+    def put_many(self, model: str, dimensions: int, items: Dict[str, List[float]]):
+        """Store vectors by text hash, then evict LRU entries past the size bound"""
+        if not items:
+            return
+        now = time.time()
+        rows = [(model, dimensions, h, np.asarray(v, dtype=np.float32).tobytes(), now) for h, v in items.items()]
+        with self._lock:
+            # Replaced entries give their old size back (primary-key lookups, not a scan)
+            replaced = 0
+            hashes = list(items)
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings "
+                    f"WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})",
+                    [model, dimensions, *batch],
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+            self.total_bytes += sum(len(row[3]) for row in rows) - replaced
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Other processes (builder.py, more replicas) write to the same file: recount before deleting
+        self.total_bytes = self._size()
+        if self.total_bytes <= self.max_bytes:
+            return
+        # Drop down to 90% of the bound so eviction is not triggered on every write
+        excess = self.total_bytes - int(self.max_bytes * 0.9)
+        freed, victims = 0, []
+        oldest = self._conn.execute("SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used")
+        for rowid, size in oldest:
+            if freed >= excess:
+                break
+            victims.append((rowid,))
+            freed += size
+        oldest.close()
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", victims)
+        self._conn.commit()
+        self.total_bytes -= freed
+        self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, str]:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": str(count),
+            "hits": str(self.hits),
+            "misses": str(self.misses),
+            "evictions": str(self.evictions),
+            "hit_rate": f"{self.hits / lookups:.2%}" if lookups else "n/a",
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that consults an EmbeddingCache before calling the model
+
+    The async methods run the SQLite lookups and writes on a worker thread,
+    off the server's event loop.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str, dimensions: int = 0):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        # 0 means the model's native dimension
+        self.dimensions = dimensions or 0
+
+    def _lookup(self, texts: List[str]):
+        hashes = [text_hash(t) for t in texts]
+        cached = self.cache.get_many(self.model, self.dimensions, hashes)
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+        return hashes, cached, missing
+
+    def _store(self, cached: dict, missing: dict, vectors: List[List[float]]):
+        fresh = dict(zip(missing.keys(), vectors))
+        self.cache.put_many(self.model, self.dimensions, fresh)
+        cached.update(fresh)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, cached, missing = self._lookup(texts)
+        if missing:
+            self._store(cached, missing, self.embeddings.embed_documents(list(missing.values())))
+        return [cached[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes, cached, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            await asyncio.to_thread(self._store, cached, missing, vectors)
+        return [cached[h] for h in hashes]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class MeteredEmbeddings(Embeddings):
+    """Records latency, texts and tokens of every request that reaches the embedding model"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    @staticmethod
+    def _count(texts: List[str]):
+        metrics.inc("embed.requests")
+        metrics.inc("embed.texts", len(texts))
+        metrics.inc("embed.tokens", sum(count_tokens_batch(texts)))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._count(texts)
+        with metrics.span("embed.request"):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self._count([text])
+        with metrics.span("embed.request"):
+            return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._count(texts)
+        with metrics.span("embed.request"):
+            return await self.embeddings.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self._count([text])
+        with metrics.span("embed.request"):
+            return await self.embeddings.aembed_query(text)
+
+
+class ResilientEmbeddings(Embeddings):
+    """Runs every request that misses the cache through an upstream policy (see resilience.Upstream)
+
+    Requests of up to HEDGE_MAX_TEXTS texts (queries, notes) may be hedged;
+    a duplicate of a bulk batch would cost as much as the batch.
+    """
+
+    def __init__(self, embeddings: Embeddings, upstream):
+        self.embeddings = embeddings
+        self.upstream = upstream
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.upstream.call(lambda: self.embeddings.embed_documents(texts), hedge=len(texts) <= HEDGE_MAX_TEXTS)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.upstream.call(lambda: self.embeddings.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.upstream.acall(
+            lambda: self.embeddings.aembed_documents(texts), hedge=len(texts) <= HEDGE_MAX_TEXTS
+        )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.upstream.acall(lambda: self.embeddings.aembed_query(text))
+
+
+# Shared cache instance (one SQLite connection per process)
+_cache = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Get or create the embedding cache, or None when disabled"""
+    global _cache
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
+
+
+def make_embeddings(
+    openai_api_key: str,
+    model: str = EMBEDDING_MODEL,
+    pooled: bool = False,
+    dimensions: int = EMBEDDING_DIMENSIONS,
+    resilient: bool = False,
+    **kwargs,
+) -> Embeddings:
+    """Create the OpenAI embedding model, wrapped with the persistent cache when enabled
+
+    pooled=True routes requests through the process-wide HTTP clients (see
+    http_clients.py). dimensions > 0 requests shortened embeddings.
+    resilient=True adds timeouts, retries, hedging and the "openai" circuit
+    breaker (the OpenAI client's own retries are then turned off and its
+    timeout set to the policy's). Extra
+    keyword arguments (e.g. max_retries) are passed to OpenAIEmbeddings.
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    if pooled:
+        from http_clients import get_async_http_client, get_http_client
+        kwargs.setdefault("http_client", get_http_client())
+        kwargs.setdefault("http_async_client", get_async_http_client())
+    if dimensions:
+        kwargs["dimensions"] = dimensions
+    if resilient:
+        from resilience import get_upstream
+        upstream = get_upstream("openai")
+        kwargs.setdefault("max_retries", 0)
+        # A timed-out or losing attempt then ends at the client instead of holding a worker thread
+        kwargs.setdefault("timeout", upstream.timeout)
+    embeddings = MeteredEmbeddings(OpenAIEmbeddings(
+        model=model,
+        openai_api_key=openai_api_key,
+        **kwargs
+    ))
+    if resilient:
+        embeddings = ResilientEmbeddings(embeddings, upstream)
+    cache = get_embedding_cache()
+    if cache is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, cache, model, dimensions)
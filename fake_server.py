@@ -0,0 +1,333 @@
+# fake_server.py - Local stand-in for the OpenAI embeddings API and a Pinecone index
+#
+# Lets the ingestion engine and retriever run without network access:
+#   python fake_server.py --port 8765 --rate-limit-every 20
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 PINECONE_HOST=http://127.0.0.1:8765 python builder.py
+#
+# Latency and faults for resilience testing (can be changed at runtime with POST /_faults):
+#   python fake_server.py --latency 0.02 --slow-rate 0.05 --slow-latency 1.0 --error-rate 0.1
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+FAKE_DIMENSIONS = 1536
+
+
+def deterministic_embedding(text: str, dimensions: int = FAKE_DIMENSIONS) -> List[float]:
+    """Unit vector seeded by the text hash; identical texts always get identical vectors
+
+    Each word also contributes its own seeded vector, so texts that share
+    words are closer than unrelated texts and search results are meaningful.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in text.lower().split() or [""]:
+        seed = int.from_bytes(hashlib.sha256(word.encode("utf-8")).digest()[:8], "little")
+        vector += np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class DeterministicEmbeddings(Embeddings):
+    """Offline embedding model with the same interface as OpenAIEmbeddings"""
+
+    def __init__(self, dimensions: int = FAKE_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [deterministic_embedding(t, self.dimensions) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return deterministic_embedding(text, self.dimensions)
+
+
+# Settings accepted by POST /_faults
+FAULT_SETTINGS = ("latency", "slow_rate", "slow_latency", "error_rate", "down", "rate_limit_every", "retry_after")
+
+
+class FakeState:
+    """In-memory vectors per namespace plus fault-injection settings
+
+    Every request waits `latency` seconds, a `slow_rate` fraction of them
+    `slow_latency` seconds instead (a latency tail), and an `error_rate`
+    fraction fails with 503. While `down` every request fails with 503.
+    """
+
+    def __init__(
+        self,
+        dimensions: int,
+        rate_limit_every: int = 0,
+        retry_after: float = 1.0,
+        latency: float = 0.0,
+        slow_rate: float = 0.0,
+        slow_latency: float = 1.0,
+        error_rate: float = 0.0,
+        seed: int = None,
+    ):
+        self.dimensions = dimensions
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.down = False
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.rate_limited = 0
+        self.faults = 0
+        self.namespaces = {}
+        self.lock = threading.Lock()
+
+    def configure(self, settings: dict) -> dict:
+        with self.lock:
+            for key, value in settings.items():
+                if key not in FAULT_SETTINGS:
+                    raise ValueError(f"Unknown fault setting '{key}', expected one of {FAULT_SETTINGS}")
+                setattr(self, key, type(getattr(self, key))(value))
+            return {key: getattr(self, key) for key in FAULT_SETTINGS}
+
+    def next_fault(self):
+        """(delay in seconds, whether the request fails) for the next request"""
+        with self.lock:
+            slow = self.random.random() < self.slow_rate
+            failed = self.down or self.random.random() < self.error_rate
+            if failed:
+                self.faults += 1
+        return (self.slow_latency if slow else self.latency), failed
+
+    def next_request_is_limited(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            limited = bool(self.rate_limit_every) and self.requests % self.rate_limit_every == 0
+            self.rate_limited += limited
+            return limited
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    state: FakeState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        try:
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on this request (timed out, or a hedge won)
+            pass
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _rate_limited(self) -> bool:
+        if self.state.next_request_is_limited():
+            self._send(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                # Integer seconds: urllib3 (Pinecone client) rejects fractional values
+                {"Retry-After": str(max(1, math.ceil(self.state.retry_after)))},
+            )
+            return True
+        return False
+
+    def _faulted(self) -> bool:
+        delay, failed = self.state.next_fault()
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            self._send(503, {"error": {"message": "Injected fault", "type": "server_error", "code": "unavailable"}})
+            return True
+        return False
+
+    def do_GET(self):
+        if self._faulted():
+            return
+        if self.path.startswith("/describe_index_stats"):
+            return self._describe()
+        if self.path.startswith("/vectors/fetch"):
+            return self._fetch(parse_qs(urlparse(self.path).query))
+        if self.path.startswith("/vectors/list"):
+            return self._list(parse_qs(urlparse(self.path).query))
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path == "/_faults":
+            try:
+                return self._send(200, self.state.configure(self._body()))
+            except (TypeError, ValueError) as e:
+                return self._send(400, {"error": str(e)})
+        if self._faulted() or self._rate_limited():
+            return
+        body = self._body()
+        if self.path.endswith("/embeddings"):
+            return self._embeddings(body)
+        if self.path == "/vectors/upsert":
+            return self._upsert(body)
+        if self.path == "/query":
+            return self._query(body)
+        if self.path == "/vectors/delete":
+            return self._delete(body)
+        if self.path == "/describe_index_stats":
+            return self._describe()
+        self._send(404, {"error": "not found"})
+
+    # OpenAI: POST /v1/embeddings
+    def _embeddings(self, body: dict):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or self.state.dimensions
+        data = []
+        tokens = 0
+        for i, text in enumerate(inputs):
+            if isinstance(text, list):
+                # Token IDs (langchain sends these when checking context length)
+                tokens += len(text)
+                text = " ".join(str(t) for t in text)
+            else:
+                tokens += len(text.split())
+            data.append({"object": "embedding", "index": i, "embedding": deterministic_embedding(text, dimensions)})
+        self._send(200, {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    # Pinecone data plane
+    def _upsert(self, body: dict):
+        with self.state.lock:
+            namespace = self.state.namespaces.setdefault(body.get("namespace", ""), {})
+            for vector in body.get("vectors", []):
+                namespace[vector["id"]] = (np.asarray(vector["values"], dtype=np.float32), vector.get("metadata", {}))
+        self._send(200, {"upsertedCount": len(body.get("vectors", []))})
+
+    def _query(self, body: dict):
+        namespace = self.state.namespaces.get(body.get("namespace", ""), {})
+        with self.state.lock:
+            items = list(namespace.items())
+        matches = []
+        if items:
+            query = np.asarray(body["vector"], dtype=np.float32)
+            matrix = np.vstack([v for _, (v, _) in items])
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+            scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+            for i in np.argsort(-scores)[: body.get("topK", 10)]:
+                doc_id, (values, metadata) = items[i]
+                match = {"id": doc_id, "score": float(scores[i])}
+                if body.get("includeMetadata"):
+                    match["metadata"] = metadata
+                if body.get("includeValues"):
+                    match["values"] = values.tolist()
+                matches.append(match)
+        self._send(200, {"matches": matches, "namespace": body.get("namespace", "")})
+
+    def _fetch(self, params: dict):
+        name = params.get("namespace", [""])[0]
+        namespace = self.state.namespaces.get(name, {})
+        with self.state.lock:
+            found = {i: namespace[i] for i in params.get("ids", []) if i in namespace}
+        vectors = {
+            doc_id: {"id": doc_id, "values": values.tolist(), "metadata": metadata}
+            for doc_id, (values, metadata) in found.items()
+        }
+        self._send(200, {"vectors": vectors, "namespace": name})
+
+    def _list(self, params: dict):
+        """IDs in sorted order, paginated (the token is the next position)"""
+        name = params.get("namespace", [""])[0]
+        prefix = params.get("prefix", [""])[0]
+        limit = int(params.get("limit", ["100"])[0])
+        start = int(params.get("paginationToken", ["0"])[0])
+        with self.state.lock:
+            ids = sorted(i for i in self.state.namespaces.get(name, {}) if i.startswith(prefix))
+        page = ids[start:start + limit]
+        body = {"vectors": [{"id": doc_id} for doc_id in page], "namespace": name, "usage": {"readUnits": 1}}
+        if start + limit < len(ids):
+            body["pagination"] = {"next": str(start + limit)}
+        self._send(200, body)
+
+    def _delete(self, body: dict):
+        namespace = self.state.namespaces.get(body.get("namespace", ""), {})
+        with self.state.lock:
+            if body.get("deleteAll"):
+                namespace.clear()
+            for doc_id in body.get("ids", []):
+                namespace.pop(doc_id, None)
+        self._send(200, {})
+
+    def _describe(self):
+        with self.state.lock:
+            namespaces = {name: {"vectorCount": len(vectors)} for name, vectors in self.state.namespaces.items()}
+        self._send(200, {
+            "namespaces": namespaces,
+            "dimension": self.state.dimensions,
+            "indexFullness": 0.0,
+            "totalVectorCount": sum(n["vectorCount"] for n in namespaces.values()),
+        })
+
+
+def start_fake_server(
+    port: int = 0,
+    dimensions: int = FAKE_DIMENSIONS,
+    rate_limit_every: int = 0,
+    retry_after: float = 1.0,
+    **faults,
+) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread; returns the server (see server.server_port)
+
+    Extra keyword arguments are FakeState fault settings (latency, slow_rate,
+    slow_latency, error_rate, seed); server.state changes them later.
+    """
+    state = FakeState(dimensions, rate_limit_every, retry_after, **faults)
+    handler = type("Handler", (FakeHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI embeddings + Pinecone index server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=FAKE_DIMENSIONS)
+    parser.add_argument("--rate-limit-every", type=int, default=0,
+                        help="Answer every Nth request with 429 + Retry-After (0 = never)")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests that take --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for reproducible fault patterns")
+    args = parser.parse_args()
+
+    server = start_fake_server(
+        args.port, args.dimensions, args.rate_limit_every, args.retry_after,
+        latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency,
+        error_rate=args.error_rate, seed=args.seed,
+    )
+    print(f"Fake server listening on http://127.0.0.1:{server.server_port}")
+    print(f"  OPENAI_BASE_URL=http://127.0.0.1:{server.server_port}/v1")
+    print(f"  PINECONE_HOST=http://127.0.0.1:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
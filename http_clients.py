@@ -0,0 +1,42 @@
+# http_clients.py - Shared, pooled HTTP clients for the OpenAI API
+import os
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Connection pool size and request timeout (seconds) shared by every tool call
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "16"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+
+# One client of each kind per process, so concurrent calls reuse warm connections
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+
+
+def get_http_client() -> httpx.Client:
+    """Get or create the shared synchronous client"""
+    global _client
+    if _client is None:
+        _client = httpx.Client(limits=_limits(), timeout=HTTP_TIMEOUT)
+    return _client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Get or create the shared async client
+
+    Its connections belong to the event loop that first uses it, so it is
+    meant for the long-lived server loop, not for short asyncio.run() calls.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(limits=_limits(), timeout=HTTP_TIMEOUT)
+    return _async_client
@@ -0,0 +1,326 @@
+# ingest_engine.py - Concurrent, rate-limit-aware batch embedding and upsert engine
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from dotenv import load_dotenv
+from metrics import metrics
+from tokens import count_tokens
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Token budget per embeddings request (OpenAI allows 300k tokens / 2048 inputs)
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "20000"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+UPSERT_MAX_CONCURRENCY = int(os.getenv("UPSERT_MAX_CONCURRENCY", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("INGEST_MAX_RETRIES", "6"))
+# Seconds one embed/upsert request may take before it is abandoned and retried (0 = no limit)
+INGEST_CALL_TIMEOUT = float(os.getenv("INGEST_CALL_TIMEOUT", "120"))
+
+MAX_BATCH_ITEMS = 2048
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def error_status(exc: BaseException) -> Tuple[Optional[int], Optional[float]]:
+    """Return (HTTP status, Retry-After seconds) for OpenAI, Pinecone or httpx errors"""
+    response = getattr(exc, "response", None)
+    status = (
+        getattr(exc, "status_code", None)
+        or getattr(exc, "status", None)
+        or getattr(response, "status_code", None)
+    )
+    headers = getattr(exc, "headers", None) or getattr(response, "headers", None) or {}
+    retry_after = None
+    try:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value is not None:
+            retry_after = float(value)
+    except (AttributeError, TypeError, ValueError):
+        retry_after = None
+    try:
+        status = int(status) if status is not None else None
+    except (TypeError, ValueError):
+        status = None
+    return status, retry_after
+
+
+def is_retryable(exc: BaseException, status: Optional[int]) -> bool:
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError, asyncio.TimeoutError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError and friends carry no status
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout")
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that halves on 429 and grows back by one after a run of successes"""
+
+    def __init__(self, name: str, max_limit: int):
+        self.name = name
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._resume_at = 0.0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            while self.in_flight >= self.limit:
+                await self._cond.wait()
+            self.in_flight += 1
+        # A 429 pauses every request on this limiter, not just the one that got it
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self._successes += 1
+        if self.limit < self.max_limit and self._successes >= self.limit:
+            self.limit += 1
+            self._successes = 0
+
+    def on_rate_limit(self, retry_after: Optional[float]):
+        self.limit = max(1, self.limit // 2)
+        self._successes = 0
+        if retry_after:
+            self._resume_at = max(self._resume_at, time.monotonic() + retry_after)
+
+
+class IngestStats:
+    """Counters for one engine run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.chunks = 0
+        self.tokens = 0
+        self.embed_requests = 0
+        self.upsert_requests = 0
+        self.rate_limited = 0
+        self.retries = 0
+        self.embed_seconds = 0.0
+        self.upsert_seconds = 0.0
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self) -> Dict[str, float]:
+        elapsed = self.elapsed or 1e-9
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "embed_requests": self.embed_requests,
+            "upsert_requests": self.upsert_requests,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "chunks_per_second": round(self.chunks / elapsed, 1),
+            "tokens_per_minute": round(self.tokens / elapsed * 60),
+            "avg_embed_latency_ms": round(1000 * self.embed_seconds / max(1, self.embed_requests), 1),
+            "avg_upsert_latency_ms": round(1000 * self.upsert_seconds / max(1, self.upsert_requests), 1),
+        }
+
+    def summary(self) -> str:
+        d = self.as_dict()
+        return (
+            f"{d['chunks']} chunks / {d['tokens']} tokens in {d['elapsed_seconds']:.1f}s "
+            f"({d['chunks_per_second']} chunks/sec, {d['tokens_per_minute']} tokens/min); "
+            f"{d['embed_requests']} embed requests (avg {d['avg_embed_latency_ms']} ms), "
+            f"{d['upsert_requests']} upserts (avg {d['avg_upsert_latency_ms']} ms), "
+            f"{d['rate_limited']} rate-limited, {d['retries']} retries"
+        )
+
+
+class IngestEngine:
+    """Embed and upsert chunks in token-sized batches with several requests in flight
+
+    run() is a pipeline stage: it consumes chunk Documents (doc.id set) and
+    marker objects with a `path` attribute, and yields (ids, texts, metadatas)
+    for every upserted batch. A marker is yielded once every chunk whose
+    metadata["source"] equals marker.path has been upserted.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+        upsert: Callable[[List[str], List[List[float]], List[str], List[dict]], None],
+        batch_tokens: int = EMBED_BATCH_TOKENS,
+        max_batch_items: int = MAX_BATCH_ITEMS,
+        embed_concurrency: int = EMBED_MAX_CONCURRENCY,
+        upsert_concurrency: int = UPSERT_MAX_CONCURRENCY,
+        max_retries: int = INGEST_MAX_RETRIES,
+    ):
+        self.embed = embed
+        self.upsert = upsert
+        self.batch_tokens = batch_tokens
+        self.max_batch_items = min(max_batch_items, MAX_BATCH_ITEMS)
+        self.embed_concurrency = embed_concurrency
+        self.upsert_concurrency = upsert_concurrency
+        self.max_retries = max_retries
+        self.stats = IngestStats()
+
+    async def _call(self, limiter: AdaptiveLimiter, fn: Callable[[], Awaitable]):
+        """Run fn under the limiter, retrying 429/5xx/transient/timed-out calls with jittered backoff"""
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(fn(), INGEST_CALL_TIMEOUT or None)
+            except Exception as e:
+                status, retry_after = error_status(e)
+                if not is_retryable(e, status) or attempt == self.max_retries:
+                    raise
+                if status == 429:
+                    self.stats.rate_limited += 1
+                    metrics.inc("ingest.rate_limited")
+                    limiter.on_rate_limit(retry_after)
+                self.stats.retries += 1
+                metrics.inc("ingest.retries")
+            else:
+                limiter.on_success()
+                elapsed = time.perf_counter() - start
+                metrics.observe(f"ingest.{limiter.name}", elapsed)
+                if limiter.name == "embed":
+                    self.stats.embed_requests += 1
+                    self.stats.embed_seconds += elapsed
+                else:
+                    self.stats.upsert_requests += 1
+                    self.stats.upsert_seconds += elapsed
+                return result
+            finally:
+                await limiter.release()
+
+            if retry_after is None:
+                retry_after = min(60.0, 0.5 * 2 ** attempt)
+            await asyncio.sleep(retry_after * (0.5 + random.random()))
+
+    async def _main(self, items: Iterator, out: queue.Queue):
+        loop = asyncio.get_running_loop()
+        embed_limiter = AdaptiveLimiter("embed", self.embed_concurrency)
+        upsert_limiter = AdaptiveLimiter("upsert", self.upsert_concurrency)
+        # Bound read-ahead: at most this many batches exist at once
+        batch_slots = asyncio.Semaphore(self.embed_concurrency + self.upsert_concurrency)
+
+        tasks = set()
+        errors = []
+        outstanding = Counter()
+        waiting = {}
+        batch: List[Document] = []
+        batch_tokens = 0
+
+        def emit_ready():
+            open_sources = {doc.metadata.get("source") for doc in batch}
+            for path in list(waiting):
+                if outstanding[path] == 0 and path not in open_sources:
+                    out.put(waiting.pop(path))
+
+        async def process(docs: List[Document], tokens: int):
+            try:
+                ids = [doc.id for doc in docs]
+                texts = [doc.page_content for doc in docs]
+                metadatas = [doc.metadata for doc in docs]
+                vectors = await self._call(embed_limiter, lambda: self.embed(texts))
+                await self._call(
+                    upsert_limiter, lambda: asyncio.to_thread(self.upsert, ids, vectors, texts, metadatas)
+                )
+                self.stats.chunks += len(docs)
+                self.stats.tokens += tokens
+                metrics.inc("ingest.chunks", len(docs))
+                metrics.inc("ingest.tokens", tokens)
+                out.put((ids, texts, metadatas))
+                for source in {m.get("source") for m in metadatas}:
+                    outstanding[source] -= 1
+                emit_ready()
+            except Exception as e:
+                # Surfaced by the main loop; the failed file's marker is never emitted
+                errors.append(e)
+            finally:
+                batch_slots.release()
+
+        async def dispatch():
+            nonlocal batch, batch_tokens
+            docs, tokens = batch, batch_tokens
+            batch, batch_tokens = [], 0
+            await batch_slots.acquire()
+            for source in {doc.metadata.get("source") for doc in docs}:
+                outstanding[source] += 1
+            task = asyncio.create_task(process(docs, tokens))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        iterator = iter(items)
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, iterator, _DONE)
+                if item is _DONE:
+                    break
+                if errors:
+                    raise errors[0]
+                if not isinstance(item, Document):
+                    waiting[item.path] = item
+                    emit_ready()
+                    continue
+                # Chunks from chunker.py carry their token count
+                tokens = item.metadata.get("tokens") or count_tokens(item.page_content)
+                if batch and (batch_tokens + tokens > self.batch_tokens or len(batch) >= self.max_batch_items):
+                    await dispatch()
+                batch.append(item)
+                batch_tokens += tokens
+            if batch:
+                await dispatch()
+            await asyncio.gather(*tasks)
+            if errors:
+                raise errors[0]
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        emit_ready()
+
+    def run(self, items: Iterator) -> Iterator:
+        """Pipeline stage: drive the asyncio engine on its own thread and yield its output"""
+        self.stats = IngestStats()
+        out = queue.Queue()
+
+        def worker():
+            try:
+                asyncio.run(self._main(items, out))
+            except BaseException as e:
+                out.put(_Failure(e))
+            finally:
+                self.stats.finished = time.perf_counter()
+                out.put(_DONE)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        while True:
+            item = out.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                thread.join()
+                raise item.exc
+            yield item
+        thread.join()
@@ -0,0 +1,467 @@
+# lexical_index.py - BM25 inverted index with a code-aware tokenizer for exact-symbol lookups
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from vectorstore import condition_holds
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", os.path.join(SCRIPT_DIR, ".cache"))
+
+LEXICAL_FORMAT_VERSION = 1
+# Changed chunks kept in the delta log before it is merged into the .npz file
+LEXICAL_MERGE_CHUNKS = int(os.getenv("LEXICAL_MERGE_CHUNKS", "2000"))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+# Pieces of an identifier: "MsgSendv" -> Msg, Sendv; "HTTPServer" -> HTTP, Server
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+# A query word that looks like code: snake_case, camelCase, digits or a wildcard/call suffix
+_SYMBOL = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\*|\(\))?$")
+
+
+def split_identifier(word: str) -> List[str]:
+    """Split snake_case and camelCase identifiers into lower-case parts"""
+    return [part.lower() for piece in word.split("_") for part in _CAMEL.findall(piece)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words plus the parts of compound identifiers
+
+    "vdev_read" -> vdev_read, vdev, read and "ChannelCreate" -> channelcreate,
+    channel, create, so both the exact symbol and its pieces are searchable.
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        full = word.strip("_").lower()
+        if not full:
+            continue
+        tokens.append(full)
+        parts = [p for p in split_identifier(word) if len(p) > 1]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def is_symbol_query(query: str) -> bool:
+    """True for short queries made of identifiers like MsgSendv, vdev_* or ChannelCreate()"""
+    words = query.split()
+    if not words or len(words) > 3:
+        return False
+    for word in words:
+        if not _SYMBOL.match(word):
+            return False
+        bare = word.rstrip("*()")
+        if not ("_" in bare or word.endswith(("*", "()")) or len(split_identifier(bare)) > 1):
+            return False
+    return True
+
+
+def _matches(metadata: dict, filter: Optional[Dict[str, Any]]) -> bool:
+    if not filter:
+        return True
+    return all(condition_holds(metadata.get(key), condition) for key, condition in filter.items())
+
+
+class _Segment:
+    """Read-optimised chunks in CSR form, as stored in the .npz file
+
+    Postings of term i are rows[offsets[i]:offsets[i + 1]] with matching
+    term frequencies. Deleted chunks are only masked out (alive) until the
+    next merge rewrites the segment.
+    """
+
+    def __init__(self, ids: List[str], texts: List[str], metadatas: List[dict], vocab: List[str],
+                 offsets: np.ndarray, rows: np.ndarray, tfs: np.ndarray, lengths: np.ndarray):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.row_of = {doc_id: row for row, doc_id in enumerate(ids)}
+        self.terms = {term: i for i, term in enumerate(vocab)}
+        self.vocab = vocab
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs.astype(np.float64)
+        self.lengths = lengths.astype(np.float64)
+        self.alive = np.ones(len(ids), dtype=bool)
+        self.count = len(ids)
+        self.total_length = float(self.lengths.sum())
+
+    @classmethod
+    def empty(cls) -> "_Segment":
+        return cls([], [], [], [], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32),
+                   np.zeros(0, dtype=np.uint16), np.zeros(0, dtype=np.int32))
+
+    @classmethod
+    def read(cls, path: str) -> Optional["_Segment"]:
+        with np.load(path) as data:
+            if int(data["version"][0]) != LEXICAL_FORMAT_VERSION:
+                return None
+            vocab = bytes(data["vocab"]).decode("utf-8")
+            docs = json.loads(bytes(data["docs"]).decode("utf-8"))
+            return cls(
+                [doc[0] for doc in docs], [doc[1] for doc in docs], [doc[2] for doc in docs],
+                vocab.split("\n") if vocab else [],
+                data["offsets"], data["postings"], data["tfs"], data["lengths"],
+            )
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        docs = [[doc_id, text, metadata] for doc_id, text, metadata in zip(self.ids, self.texts, self.metadatas)]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                version=np.array([LEXICAL_FORMAT_VERSION]),
+                vocab=np.frombuffer("\n".join(self.vocab).encode("utf-8"), dtype=np.uint8),
+                offsets=self.offsets,
+                postings=self.rows.astype(np.int32),
+                tfs=np.minimum(self.tfs, np.iinfo(np.uint16).max).astype(np.uint16),
+                lengths=self.lengths.astype(np.int32),
+                docs=np.frombuffer(json.dumps(docs).encode("utf-8"), dtype=np.uint8),
+            )
+        os.replace(tmp_path, path)
+
+    def has(self, doc_id: str) -> bool:
+        row = self.row_of.get(doc_id)
+        return row is not None and bool(self.alive[row])
+
+    def kill(self, doc_id: str) -> bool:
+        row = self.row_of.get(doc_id)
+        if row is None or not self.alive[row]:
+            return False
+        self.alive[row] = False
+        self.count -= 1
+        self.total_length -= float(self.lengths[row])
+        return True
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, term frequencies) of the live chunks containing term"""
+        i = self.terms.get(term)
+        if i is None:
+            return self.rows[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        rows, tfs = self.rows[start:end], self.tfs[start:end]
+        if self.count < len(self.ids):
+            live = self.alive[rows]
+            rows, tfs = rows[live], tfs[live]
+        return rows, tfs
+
+
+# Everything load() sets up; a background refresh swaps these in from a freshly read index
+_STATE = (
+    "main", "delta", "delta_lengths", "delta_postings", "delta_length", "changes", "_unsaved", "_mtime", "_log_offset",
+)
+
+
+class LexicalIndex:
+    """In-memory BM25 index over chunk texts: a CSR main segment plus a small delta
+
+    The main segment keeps the numpy arrays of the compressed .npz file
+    (see _Segment), so a query scores each term's postings with vectorised
+    operations. Chunks added or deleted since the last merge live in a
+    small dict-based delta that save() persists by appending to a JSON-lines
+    log next to the .npz; once it holds merge_chunks changes (or on merge())
+    it is folded into a rewritten .npz. Chunk texts and metadata are stored
+    too, so a lexical hit is returned without touching the vector store.
+    """
+
+    def __init__(self, path: str, merge_chunks: int = LEXICAL_MERGE_CHUNKS):
+        self.path = path
+        self.delta_path = path + ".delta"
+        self.merge_chunks = max(1, merge_chunks)
+        self._lock = threading.RLock()
+        self._refreshing = False
+        self.load()
+
+    def __len__(self) -> int:
+        return self.main.count + len(self.delta)
+
+    @property
+    def dirty(self) -> bool:
+        """Changes not yet written to the delta log"""
+        return bool(self._unsaved)
+
+    def _reset_delta(self):
+        self.delta: Dict[str, Tuple[str, dict]] = {}
+        self.delta_lengths: Dict[str, int] = {}
+        self.delta_postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.delta_length = 0
+        # Changes since the last merge (deletions of main-segment chunks included)
+        self.changes = 0
+        self._unsaved: List[dict] = []
+
+    def _add(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        self._delete(ids)
+        for doc_id, text, metadata in zip(ids, texts, metadatas):
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                self.delta_postings[term][doc_id] = tf
+            length = sum(counts.values())
+            self.delta[doc_id] = (text, dict(metadata))
+            self.delta_lengths[doc_id] = length
+            self.delta_length += length
+            self.changes += 1
+
+    def _delete(self, ids: Iterable[str]) -> List[str]:
+        deleted = []
+        for doc_id in ids:
+            entry = self.delta.pop(doc_id, None)
+            if entry is not None:
+                for term in set(tokenize(entry[0])):
+                    posting = self.delta_postings.get(term)
+                    if posting is not None:
+                        posting.pop(doc_id, None)
+                        if not posting:
+                            del self.delta_postings[term]
+                self.delta_length -= self.delta_lengths.pop(doc_id)
+                deleted.append(doc_id)
+            elif self.main.kill(doc_id):
+                self.changes += 1
+                deleted.append(doc_id)
+        return deleted
+
+    def add(self, ids: List[str], texts: List[str], metadatas: List[dict]):
+        """Index chunks, replacing any chunk with the same ID"""
+        with self._lock:
+            self._add(ids, texts, metadatas)
+            self._unsaved.append({"add": [[i, t, dict(m)] for i, t, m in zip(ids, texts, metadatas)]})
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            deleted = self._delete(ids)
+            if deleted:
+                self._unsaved.append({"delete": deleted})
+
+    def search(self, query: str, k: int = 5, filter: Dict[str, Any] = None) -> List[Tuple[Document, float]]:
+        """Top-k chunks by BM25 score as (Document, score) pairs"""
+        with self._lock:
+            main = self.main
+            n_docs = len(self)
+            if not n_docs:
+                return []
+            avg_length = (main.total_length + self.delta_length) / n_docs or 1.0
+            rows, weights = [], []
+            delta_scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                term_rows, tfs = main.postings(term)
+                posting = self.delta_postings.get(term) or {}
+                df = len(term_rows) + len(posting)
+                if not df:
+                    continue
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                if len(term_rows):
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * main.lengths[term_rows] / avg_length)
+                    rows.append(term_rows)
+                    weights.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+                for doc_id, tf in posting.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.delta_lengths[doc_id] / avg_length)
+                    delta_scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+            hits = []
+            if rows:
+                if len(rows) == 1:
+                    # Postings of one term hold each chunk once
+                    candidates, scores = rows[0], weights[0]
+                else:
+                    candidates, inverse = np.unique(np.concatenate(rows), return_inverse=True)
+                    scores = np.bincount(inverse, weights=np.concatenate(weights))
+                if filter:
+                    order = np.argsort(-scores, kind="stable")
+                else:
+                    top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+                    order = top[np.argsort(-scores[top], kind="stable")]
+                for i in order.tolist():
+                    row = int(candidates[i])
+                    if filter and not _matches(main.metadatas[row], filter):
+                        continue
+                    hits.append((float(scores[i]), main.ids[row], main.texts[row], main.metadatas[row]))
+                    if len(hits) >= k:
+                        break
+            for doc_id, score in delta_scores.items():
+                text, metadata = self.delta[doc_id]
+                if _matches(metadata, filter):
+                    hits.append((score, doc_id, text, metadata))
+            top = heapq.nlargest(k, hits, key=lambda hit: hit[0])
+            return [
+                (Document(id=doc_id, page_content=text, metadata=dict(metadata)), score)
+                for score, doc_id, text, metadata in top
+            ]
+
+    def save(self):
+        """Persist pending changes: append them to the delta log, or merge once the delta is large"""
+        with self._lock:
+            if self.changes >= self.merge_chunks or (self._unsaved and not os.path.exists(self.path)):
+                self.merge()
+                return
+            if not self._unsaved:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.delta_path)), exist_ok=True)
+            with open(self.delta_path, "a", encoding="utf-8") as f:
+                for change in self._unsaved:
+                    f.write(json.dumps(change, ensure_ascii=False) + "\n")
+                self._log_offset = f.tell()
+            self._unsaved = []
+
+    def merge(self):
+        """Fold the delta and deletions into a new .npz file and start an empty delta log"""
+        with self._lock:
+            if not self.changes and os.path.exists(self.path):
+                if self._unsaved:
+                    self._unsaved = []
+                return
+            main = self.main
+            keep = np.flatnonzero(main.alive)
+            new_row = np.cumsum(main.alive) - 1
+            ids = [main.ids[row] for row in keep.tolist()] + list(self.delta)
+            texts = [main.texts[row] for row in keep.tolist()] + [text for text, _ in self.delta.values()]
+            metadatas = [main.metadatas[row] for row in keep.tolist()] + [m for _, m in self.delta.values()]
+            lengths = np.concatenate([
+                main.lengths[keep], np.asarray([self.delta_lengths[d] for d in self.delta], dtype=np.float64)
+            ])
+
+            # (term, row, tf) triples of the surviving main postings and of the delta
+            vocab = sorted(set(main.vocab) | set(self.delta_postings))
+            term_index = {term: i for i, term in enumerate(vocab)}
+            old_terms = np.asarray([term_index[t] for t in main.vocab], dtype=np.int64)
+            main_terms = np.repeat(old_terms, np.diff(main.offsets))
+            live = main.alive[main.rows]
+            delta_row = {doc_id: len(keep) + i for i, doc_id in enumerate(self.delta)}
+            delta_terms, delta_rows, delta_tfs = [], [], []
+            for term, posting in self.delta_postings.items():
+                delta_terms.extend([term_index[term]] * len(posting))
+                delta_rows.extend(map(delta_row.__getitem__, posting))
+                delta_tfs.extend(posting.values())
+            terms = np.concatenate([main_terms[live], np.array(delta_terms, dtype=np.int64)])
+            rows = np.concatenate([new_row[main.rows[live]], np.array(delta_rows, dtype=np.int64)])
+            tfs = np.concatenate([main.tfs[live], np.array(delta_tfs, dtype=np.float64)])
+            order = np.lexsort((rows, terms))
+            counts = np.bincount(terms, minlength=len(vocab))
+            used = counts > 0
+            offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+            np.cumsum(counts[used], out=offsets[1:])
+
+            segment = _Segment(
+                ids, texts, metadatas, [term for term, u in zip(vocab, used.tolist()) if u],
+                offsets, rows[order].astype(np.int32), tfs[order], lengths,
+            )
+            segment.write(self.path)
+            # The merged file holds everything the log did
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+            self.main = segment
+            self._reset_delta()
+            self._mtime = os.stat(self.path).st_mtime_ns
+            self._log_offset = 0
+
+    def _replay(self):
+        """Apply delta log entries written after the last one this process has seen"""
+        try:
+            with open(self.delta_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line still being appended by another process is picked up next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            change = json.loads(line)
+            for doc_id, text, metadata in change.get("add", ()):
+                self._add([doc_id], [text], [metadata])
+            self._delete(change.get("delete", ()))
+        self._log_offset += end
+
+    def load(self):
+        with self._lock:
+            self.main = _Segment.empty()
+            self._reset_delta()
+            self._mtime = None
+            self._log_offset = 0
+            if os.path.exists(self.path):
+                self._mtime = os.stat(self.path).st_mtime_ns
+                self.main = _Segment.read(self.path) or _Segment.empty()
+            self._replay()
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.delta_path)
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self, reload: bool):
+        if not reload:
+            with self._lock:
+                self._replay()
+            return
+        # Read the new index first, so searches keep using the current one meanwhile
+        fresh = LexicalIndex(self.path, self.merge_chunks)
+        with self._lock:
+            if not self.dirty:
+                for name in _STATE:
+                    setattr(self, name, getattr(fresh, name))
+
+    def _refresh_in_background(self, reload: bool):
+        try:
+            self._refresh(reload)
+        except Exception as e:
+            print(f"Lexical index refresh failed: {e}", file=sys.stderr)
+        finally:
+            self._refreshing = False
+
+    def refresh(self, wait: bool = True):
+        """Pick up another process's writes (e.g. builder.py): reload a new .npz, replay a longer log
+
+        wait=False (for callers on the event loop) only checks the files and
+        leaves the reading to a background thread; searches are answered
+        from the current index until the new one is swapped in.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if self.dirty:
+            return
+        log_size = self._log_size()
+        reload = mtime != self._mtime or log_size < self._log_offset
+        if not reload and log_size == self._log_offset:
+            return
+        if wait:
+            self._refresh(reload)
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_in_background, args=(reload,), daemon=True).start()
+
+
+# One shared instance per index, so the builder and the retriever see the same postings
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def lexical_index_path(index_name: str) -> str:
+    return os.path.join(LEXICAL_INDEX_DIR, f"lexical-{index_name}.npz")
+
+
+def get_lexical_index(index_name: str) -> LexicalIndex:
+    """Get or load the lexical index for a vector index"""
+    with _indexes_lock:
+        if index_name not in _indexes:
+            _indexes[index_name] = LexicalIndex(lexical_index_path(index_name))
+        return _indexes[index_name]
@@ -0,0 +1,705 @@
+# local_index.py - Embedded vector index (memory-mapped float32 matrix + SQLite sidecar)
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from vectorstore import condition_holds
+
+VECTORS_FILE = "vectors.f32"
+SIDECAR_FILE = "chunks.sqlite"
+CENTROIDS_FILE = "ivf_centroids.npy"
+# Compressed codes used for the first search stage (see LocalVectorStore)
+CODE_FILES = {"int8": "vectors.i8", "binary": "vectors.b1"}
+SCALES_FILE = "scales.f32"
+QUANTIZATIONS = ("none", "int8", "binary")
+# Codes are scanned and encoded in blocks whose float32 temporaries stay around this size
+# (cache-sized blocks make the int8 -> float32 scan about as fast as a float32 scan)
+SCAN_BLOCK_BYTES = 8 * 2**20
+
+# Below this many live vectors an IVF probe is not worth it, exact search is used
+IVF_MIN_ROWS = 20000
+# Metadata fields that can be filtered on (plain JSON keys)
+_FIELD = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Set bits per byte value, for numpy versions without np.bitwise_count
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def encode(kind: str, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Compressed codes of normalised vectors: (int8 codes, per-row scales) or (sign bits, None)"""
+    if kind == "int8":
+        scales = np.abs(matrix).max(axis=1)
+        scales[scales == 0] = 1.0
+        codes = np.rint(matrix * (127.0 / scales[:, None])).astype(np.int8)
+        return codes, (scales / 127.0).astype(np.float32)
+    # Sign bits, padded to whole 64-bit words so rows can be XORed as uint64
+    width = (matrix.shape[1] + 63) // 64 * 8
+    bits = np.packbits(matrix > 0, axis=1)
+    codes = np.zeros((len(matrix), width), dtype=np.uint8)
+    codes[:, :bits.shape[1]] = bits
+    return codes, None
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits per row of a uint64 matrix"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[words.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def _write_rows(path: str, rows: np.ndarray, data: np.ndarray):
+    """Write data[i] at row rows[i] of a raw row-major file, one write per run of consecutive rows"""
+    width = data[0].nbytes if len(data) else 0
+    order = np.argsort(rows, kind="stable")
+    rows, data = rows[order], data[order]
+    # Start of each run of consecutive rows
+    breaks = np.flatnonzero(np.diff(rows) != 1) + 1
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        for run in np.split(np.arange(len(rows)), breaks):
+            if len(run):
+                f.seek(int(rows[run[0]]) * width)
+                f.write(np.ascontiguousarray(data[run[0]:run[-1] + 1]).tobytes())
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store for single-user or air-gapped setups
+
+    Vectors are L2-normalised and appended to a raw float32 file that is
+    memory-mapped for search, so scores are cosine similarities like the
+    Pinecone index. Text, metadata and IDs live in a SQLite sidecar keyed by
+    row number. Search is exact (one matrix-vector product) or, in "ivf"
+    mode, restricted to the nprobe closest k-means lists.
+
+    With quantization "int8" (1 byte per dimension plus a per-row scale) or
+    "binary" (1 bit per dimension), search is two-stage: the compressed
+    codes are scanned for rescore_factor * k candidates, which are then
+    rescored exactly against the memory-mapped float32 vectors. Only the
+    codes need to stay resident; the float file is touched for the
+    candidates alone.
+
+    Metadata filters are answered from per-field columns (one dictionary
+    code per row) with CSR posting lists of rows per value, built on first
+    use, so a filtered search only scores the rows that match.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedding: Optional[Embeddings] = None,
+        mode: str = "exact",
+        nlist: int = 0,
+        nprobe: int = 8,
+        quantization: str = "none",
+        rescore_factor: int = 40,
+    ):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        self.index_dir = index_dir
+        self._embedding = embedding
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._vectors_path = os.path.join(index_dir, VECTORS_FILE)
+        self._centroids_path = os.path.join(index_dir, CENTROIDS_FILE)
+        self._conn = sqlite3.connect(
+            os.path.join(index_dir, SIDECAR_FILE), check_same_thread=False
+        )
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                list INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._conn.commit()
+        self._load()
+
+    # ------------------------------------------------------------------
+    # State loading
+    # ------------------------------------------------------------------
+
+    def _load(self):
+        """(Re)load the memory map, live-row mask and IVF lists from disk"""
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+        self.dim = int(row[0]) if row else None
+        self._rows = 0
+        self._vectors = None
+        if self.dim and os.path.exists(self._vectors_path):
+            self._rows = os.path.getsize(self._vectors_path) // (4 * self.dim)
+            if self._rows:
+                self._vectors = np.memmap(
+                    self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim)
+                )
+
+        self._alive = np.zeros(self._rows, dtype=bool)
+        live_rows = np.fromiter(
+            (r for (r,) in self._conn.execute("SELECT row FROM chunks")), dtype=np.int64
+        )
+        self._alive[live_rows[live_rows < self._rows]] = True
+
+        self._centroids = None
+        if os.path.exists(self._centroids_path):
+            self._centroids = np.load(self._centroids_path)
+        # kind -> (codes memmap, scales memmap or None), opened on first use
+        self._codes: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]] = {}
+        self._lists_dirty = True
+        # field -> (row codes, values, value -> code) and field -> (rows ordered by code, offsets)
+        self._columns: Dict[str, Tuple[np.ndarray, list, dict]] = {}
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync(self):
+        """Pick up writes committed by another process (e.g. a builder run)"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._load()
+
+    def _remap(self):
+        self._rows = os.path.getsize(self._vectors_path) // (4 * self.dim)
+        self._vectors = np.memmap(
+            self._vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim)
+        )
+        if len(self._alive) < self._rows:
+            self._alive = np.concatenate(
+                [self._alive, np.zeros(self._rows - len(self._alive), dtype=bool)]
+            )
+        self._codes = {}
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    def stats(self) -> Dict[str, str]:
+        """Vector count, dimension and on-disk size (values are strings for MCP)"""
+        with self._lock:
+            self._sync()
+            live = len(self)
+            return {
+                "vectors": str(live),
+                "dimension": str(self.dim or "unknown"),
+                "namespaces": "none",
+                "tombstoned_rows": str(self._rows - live),
+                "search_mode": self.mode,
+                "quantization": self.quantization,
+                "vector_file_mb": f"{self._rows * (self.dim or 0) * 4 / 2**20:.1f}",
+                "code_file_mb": f"{self._code_bytes() / 2**20:.1f}",
+            }
+
+    def _code_bytes(self) -> int:
+        """Size of the compressed codes the first search stage scans"""
+        if self.quantization == "none":
+            return 0
+        paths = [os.path.join(self.index_dir, CODE_FILES[self.quantization])]
+        if self.quantization == "int8":
+            paths.append(os.path.join(self.index_dir, SCALES_FILE))
+        return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32)
+
+    def add_vectors(
+        self,
+        ids: List[str],
+        vectors: List[List[float]],
+        texts: List[str],
+        metadatas: Optional[List[dict]] = None,
+    ) -> List[str]:
+        """Upsert precomputed embeddings; existing IDs are overwritten in place"""
+        if not ids:
+            return []
+        metadatas = metadatas or [{} for _ in ids]
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+
+        with self._lock:
+            self._sync()
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),)
+                )
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(
+                    f"Embedding dimension {matrix.shape[1]} does not match index dimension {self.dim}"
+                )
+
+            # Last write wins for duplicate IDs inside one batch
+            latest = {doc_id: i for i, doc_id in enumerate(ids)}
+            positions = sorted(latest.values())
+            existing = self._lookup_rows([ids[i] for i in positions])
+
+            lists = self._assign_lists(matrix[positions]) if self._centroids is not None else None
+            next_row = self._rows
+            records = []
+            for n, i in enumerate(positions):
+                row = existing.get(ids[i])
+                if row is None:
+                    row = next_row
+                    next_row += 1
+                records.append((
+                    row,
+                    ids[i],
+                    texts[i],
+                    json.dumps(metadatas[i], ensure_ascii=False),
+                    int(lists[n]) if lists is not None else None,
+                ))
+            rows = np.array([r[0] for r in records], dtype=np.int64)
+            # Code files are brought up to date before the vector file grows
+            kinds = [kind for kind in CODE_FILES if kind == self.quantization or os.path.exists(self._code_path(kind))]
+            for kind in kinds:
+                self._ensure_codes(kind)
+            _write_rows(self._vectors_path, rows, matrix[positions])
+            for kind in kinds:
+                codes, scales = encode(kind, matrix[positions])
+                _write_rows(self._code_path(kind), rows, codes)
+                if scales is not None:
+                    _write_rows(os.path.join(self.index_dir, SCALES_FILE), rows, scales[:, None])
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (row, id, text, metadata, list) VALUES (?, ?, ?, ?, ?)",
+                records,
+            )
+            self._conn.commit()
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+            self._remap()
+            self._alive[[r[0] for r in records]] = True
+            self._lists_dirty = True
+            for field in self._columns:
+                self._update_column(field, [(r[0], metadatas[i].get(field)) for r, i in zip(records, positions)])
+        return list(ids)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Embed texts with the configured embedding model and upsert them"""
+        if self._embedding is None:
+            raise ValueError("LocalVectorStore needs an embedding model to add texts")
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_vectors(ids, vectors, texts, metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete vectors by ID (rows are tombstoned until compact())"""
+        if not ids:
+            return False
+        with self._lock:
+            self._sync()
+            rows = list(self._lookup_rows(ids).values())
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+            self._conn.commit()
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if rows:
+                self._alive[rows] = False
+                self._lists_dirty = True
+        return True
+
+    def compact(self):
+        """Rewrite the vector file without tombstoned rows"""
+        with self._lock:
+            self._sync()
+            if self._vectors is None:
+                return
+            live = np.flatnonzero(self._alive)
+            if len(live) == self._rows:
+                return
+            tmp_path = self._vectors_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(live), 65536):
+                    f.write(np.asarray(self._vectors[live[start:start + 65536]]).tobytes())
+            # Rows move down, so renumber in ascending order to avoid PK collisions
+            self._conn.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new, int(old)) for new, old in enumerate(live) if new != old],
+            )
+            self._conn.commit()
+            self._vectors = None
+            os.replace(tmp_path, self._vectors_path)
+            # Codes are re-encoded from the compacted vectors on next use
+            self._remove_codes()
+            self._load()
+
+    def _lookup_rows(self, ids: List[str]) -> dict:
+        found = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for doc_id, row in self._conn.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({placeholders})", batch
+            ):
+                found[doc_id] = row
+        return found
+
+    # ------------------------------------------------------------------
+    # IVF (approximate) mode
+    # ------------------------------------------------------------------
+
+    def _assign_lists(self, matrix: np.ndarray) -> np.ndarray:
+        return np.argmax(matrix @ self._centroids.T, axis=1)
+
+    def build_ivf(self, nlist: int = 0, iterations: int = 10, sample_size: int = 100000):
+        """Train k-means centroids and assign every live row to its list"""
+        with self._lock:
+            self._sync()
+            live = np.flatnonzero(self._alive)
+            if len(live) == 0:
+                return
+            nlist = nlist or self.nlist or max(1, int(np.sqrt(len(live))))
+            nlist = min(nlist, len(live))
+
+            rng = np.random.default_rng(0)
+            sample = live if len(live) <= sample_size else rng.choice(live, sample_size, replace=False)
+            data = np.asarray(self._vectors[np.sort(sample)])
+            centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assign = np.argmax(data @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = data[assign == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = self._normalize(centroids)
+
+            self._centroids = centroids
+            np.save(self._centroids_path, centroids)
+            updates = []
+            for start in range(0, len(live), 65536):
+                rows = live[start:start + 65536]
+                lists = self._assign_lists(np.asarray(self._vectors[rows]))
+                updates.extend((int(l), int(r)) for l, r in zip(lists, rows))
+            self._conn.executemany("UPDATE chunks SET list = ? WHERE row = ?", updates)
+            self._conn.commit()
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._lists_dirty = True
+            print(f"Trained IVF index with {nlist} lists over {len(live)} vectors")
+
+    def _ivf_candidates(self, query: np.ndarray) -> np.ndarray:
+        if self._lists_dirty:
+            pairs = np.array(
+                self._conn.execute("SELECT row, list FROM chunks WHERE list IS NOT NULL").fetchall(),
+                dtype=np.int64,
+            ).reshape(-1, 2)
+            order = np.argsort(pairs[:, 1], kind="stable")
+            self._list_rows = pairs[order, 0]
+            self._list_offsets = np.searchsorted(
+                pairs[order, 1], np.arange(len(self._centroids) + 1)
+            )
+            self._lists_dirty = False
+        nprobe = min(self.nprobe, len(self._centroids))
+        probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self._list_rows[self._list_offsets[c]:self._list_offsets[c + 1]] for c in probes]
+        )
+
+    # ------------------------------------------------------------------
+    # Metadata filters
+    # ------------------------------------------------------------------
+
+    def _column(self, field: str) -> Tuple[np.ndarray, list, dict]:
+        """Dictionary-encoded column of one metadata field (code -1 = missing)"""
+        if field not in self._columns:
+            if not _FIELD.match(field):
+                raise ValueError(f"Cannot filter on metadata field '{field}'")
+            self._columns[field] = (np.full(self._rows, -1, dtype=np.int32), [], {})
+            self._update_column(field, self._conn.execute(
+                f"SELECT row, json_extract(metadata, '$.{field}') FROM chunks"
+            ))
+        return self._columns[field]
+
+    def _update_column(self, field: str, pairs: Iterable[Tuple[int, Any]]):
+        codes, values, lookup = self._columns[field]
+        if len(codes) < self._rows:
+            codes = np.concatenate([codes, np.full(self._rows - len(codes), -1, dtype=np.int32)])
+            self._columns[field] = (codes, values, lookup)
+        for row, value in pairs:
+            if not isinstance(value, (str, int, float)) or row >= len(codes):
+                continue
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(values)
+                values.append(value)
+            codes[row] = code
+        self._postings.pop(field, None)
+
+    def _value_rows(self, field: str, codes: List[int]) -> np.ndarray:
+        """Sorted rows whose field has one of the given codes (tombstones included)"""
+        column = self._columns[field][0]
+        if field not in self._postings:
+            order = np.argsort(column, kind="stable")
+            offsets = np.searchsorted(column[order], np.arange(len(self._columns[field][1]) + 1))
+            self._postings[field] = (order, offsets)
+        order, offsets = self._postings[field]
+        if not codes:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in codes])
+        return rows if len(codes) == 1 else np.sort(rows)
+
+    def _filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        """Live rows matching every condition of a Pinecone-style filter"""
+        matches = []
+        for field, condition in filter.items():
+            _, values, _ = self._column(field)
+            codes = [code for code, value in enumerate(values) if condition_holds(value, condition)]
+            matches.append(self._value_rows(field, codes))
+        # Intersect from the most selective condition up
+        matches.sort(key=len)
+        matched = matches[0]
+        for rows in matches[1:]:
+            if not len(matched):
+                break
+            matched = matched[np.isin(matched, rows, assume_unique=True)]
+        return matched[self._alive[matched]]
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def _search(self, embedding: List[float], k: int, filter: Dict[str, Any] = None) -> List[Tuple[int, float]]:
+        with self._lock:
+            self._sync()
+            if self._vectors is None or k <= 0:
+                return []
+            query = self._normalize(np.asarray([embedding], dtype=np.float32))[0]
+
+            if filter:
+                # Only the matching rows are scored
+                return self._rank(query, self._filter_rows(filter), k)
+
+            use_ivf = (
+                self.mode == "ivf"
+                and self._centroids is not None
+                and int(self._alive.sum()) >= IVF_MIN_ROWS
+            )
+            if use_ivf:
+                rows = self._ivf_candidates(query)
+                return self._rank(query, np.sort(rows[self._alive[rows]]), k)
+            return self._rank(query, None, k)
+
+    def _rank(self, query: np.ndarray, rows: Optional[np.ndarray], k: int) -> List[Tuple[int, float]]:
+        """Top-k (row, cosine) among sorted live rows (None = every live row)
+
+        Without quantization every row is scored exactly. Otherwise the codes
+        are scanned first and only the best rescore_factor * k candidates are
+        rescored against the float32 vectors.
+        """
+        n = self._rows if rows is None else len(rows)
+        candidates = k * self.rescore_factor
+        if self.quantization == "none" or n <= candidates:
+            if rows is None:
+                scores = np.asarray(self._vectors) @ query
+                scores[~self._alive] = -np.inf
+            else:
+                scores = np.asarray(self._vectors[rows]) @ query
+            return self._top_k(scores, rows, k)
+
+        approximate = self._approximate_scores(query, rows)
+        if rows is None:
+            approximate[~self._alive] = -np.inf
+        shortlist = np.sort(np.array([row for row, _ in self._top_k(approximate, rows, candidates)], dtype=np.int64))
+        return self._top_k(np.asarray(self._vectors[shortlist]) @ query, shortlist, k)
+
+    # ------------------------------------------------------------------
+    # Compressed codes (two-stage search)
+    # ------------------------------------------------------------------
+
+    def _code_path(self, kind: str) -> str:
+        return os.path.join(self.index_dir, CODE_FILES[kind])
+
+    def _remove_codes(self):
+        self._codes = {}
+        for path in [self._code_path(kind) for kind in CODE_FILES] + [os.path.join(self.index_dir, SCALES_FILE)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _ensure_codes(self, kind: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Memory-mapped codes (and int8 scales) for every row, encoding rows the code file lacks
+
+        Indexes built without quantization, or rows written by a process
+        that does not maintain this code file, are caught up here.
+        """
+        if kind in self._codes:
+            return self._codes[kind]
+        path = self._code_path(kind)
+        scales_path = os.path.join(self.index_dir, SCALES_FILE)
+        dtype = np.int8 if kind == "int8" else np.uint8
+        width = self.dim if kind == "int8" else (self.dim + 63) // 64 * 8
+        done = os.path.getsize(path) // width if os.path.exists(path) else 0
+        if kind == "int8":
+            done = min(done, os.path.getsize(scales_path) // 4 if os.path.exists(scales_path) else 0)
+        if done > self._rows:
+            # Left over from before a compaction: start again
+            done = 0
+        block_rows = max(256, SCAN_BLOCK_BYTES // (4 * self.dim))
+        for start in range(done, self._rows, block_rows):
+            stop = min(start + block_rows, self._rows)
+            codes, scales = encode(kind, np.asarray(self._vectors[start:stop]))
+            _write_rows(path, np.arange(start, stop), codes)
+            if scales is not None:
+                _write_rows(scales_path, np.arange(start, stop), scales[:, None])
+        codes = scales = None
+        if self._rows:
+            codes = np.memmap(path, dtype=dtype, mode="r", shape=(self._rows, width))
+            if kind == "int8":
+                scales = np.memmap(scales_path, dtype=np.float32, mode="r", shape=(self._rows,))
+        self._codes[kind] = (codes, scales)
+        return codes, scales
+
+    def _approximate_scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """First-stage scores from the codes, block by block (higher is closer)"""
+        codes, scales = self._ensure_codes(self.quantization)
+        n = self._rows if rows is None else len(rows)
+        scores = np.empty(n, dtype=np.float32)
+        if self.quantization == "binary":
+            # Hamming distance between sign bits, 64 dimensions per XOR
+            query_words = encode("binary", query[None, :])[0][0].view(np.uint64)
+        block_rows = max(256, SCAN_BLOCK_BYTES // (4 * codes.shape[1]))
+        for start in range(0, n, block_rows):
+            stop = min(start + block_rows, n)
+            part = slice(start, stop) if rows is None else rows[start:stop]
+            block = np.asarray(codes[part])
+            if self.quantization == "int8":
+                scores[start:stop] = (block.astype(np.float32) @ query) * scales[part]
+            else:
+                scores[start:stop] = -_popcount(block.view(np.uint64) ^ query_words)
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, rows: Optional[np.ndarray], k: int) -> List[Tuple[int, float]]:
+        """(row, score) pairs of the k best scores; rows maps score positions to rows (None = identity)"""
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = rows[top] if rows is not None else top
+        return [(int(r), float(scores[t])) for r, t in zip(hits, top)]
+
+    def _fetch_rows(self, rows: List[int]) -> dict:
+        placeholders = ",".join("?" * len(rows))
+        return {
+            row: (doc_id, text, json.loads(metadata))
+            for row, doc_id, text, metadata in self._conn.execute(
+                f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({placeholders})", rows
+            )
+        }
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        hits = self._search(embedding, k, kwargs.get("filter"))
+        if not hits:
+            return []
+        with self._lock:
+            records = self._fetch_rows([row for row, _ in hits])
+        results = []
+        for row, score in hits:
+            if row in records:
+                doc_id, text, metadata = records[row]
+                results.append((Document(id=doc_id, page_content=text, metadata=metadata), score))
+        return results
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        if self._embedding is None:
+            raise ValueError("LocalVectorStore needs an embedding model to search by text")
+        return self.similarity_search_by_vector_with_score(
+            self._embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        with self._lock:
+            rows = self._lookup_rows(list(ids))
+            if not rows:
+                return []
+            records = self._fetch_rows(list(rows.values()))
+        return [
+            Document(id=doc_id, page_content=text, metadata=metadata)
+            for doc_id, text, metadata in records.values()
+        ]
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored (unit-length) vectors by ID; unknown IDs are left out"""
+        with self._lock:
+            self._sync()
+            rows = self._lookup_rows(list(ids))
+            if not rows:
+                return {}
+            ordered = sorted(rows.items(), key=lambda item: item[1])
+            matrix = np.asarray(self._vectors[[row for _, row in ordered]])
+        return {doc_id: vector for (doc_id, _), vector in zip(ordered, matrix)}
+
+    def iter_records(self, batch_size: int = 8192) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[dict]]]:
+        """Every live record in row order, as batches of (ids, unit vectors, texts, metadatas)"""
+        with self._lock:
+            self._sync()
+            records = self._conn.execute("SELECT row, id, text, metadata FROM chunks ORDER BY row").fetchall()
+            vectors = self._vectors
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            rows = [row for row, _, _, _ in batch]
+            yield (
+                [doc_id for _, doc_id, _, _ in batch],
+                np.asarray(vectors[rows]),
+                [text for _, _, text, _ in batch],
+                [json.loads(metadata) for _, _, _, metadata in batch],
+            )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        index_dir: str = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        if index_dir is None:
+            raise ValueError("index_dir is required for LocalVectorStore")
+        store = cls(index_dir=index_dir, embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
@@ -4,10 +4,17 @@ FastMCP quickstart example.
 cd to the `examples/snippets/clients` directory and run:
     uv run server fastmcp_quickstart stdio
 """
+import time
+_START = time.perf_counter()
+
+import asyncio
+import os
+import sys
+import threading
 from typing import List, Dict
+from dotenv import load_dotenv
 from mcp.server.fastmcp import FastMCP
-from builder import DocumentBuilder
-from retriever import get_retriever
+from metrics import METRICS_PORT, metrics, start_metrics_server
 from prompts import (
    prompt_analyze_current_function,
 prompt_analyze_current_file,
@@ -15,6 +22,75 @@ prompt_refactor_current_function,
 prompt_refactor_entire_file
 )
 
+# Load environment variables from .env file
+load_dotenv()
+
+# Connect the retriever on a background thread right after startup (0 = on first query)
+MCP_WARMUP = os.getenv("MCP_WARMUP", "1") == "1"
+
+
+def log_startup(phase: str):
+    """Startup timing on stderr (stdout carries the MCP stdio protocol)"""
+    print(f"[startup] {phase}: {(time.perf_counter() - _START) * 1000:.0f} ms", file=sys.stderr, flush=True)
+
+
+log_startup("imports")
+
+# The retrieval and write stacks (LangChain, OpenAI/Pinecone clients, OCR) are
+# imported on first use, so the server answers tools/list without loading them
+_retrievers = {}
+_write_buffer = None
+
+
+def _load_retriever(namespace: str = ""):
+    from retriever import get_retriever
+    return get_retriever(namespace or None)
+
+
+def _load_write_buffer():
+    from write_buffer import get_write_buffer
+    return get_write_buffer()
+
+
+async def get_retriever(namespace: str = ""):
+    """Retriever singleton per namespace, built off the event loop on first use"""
+    retriever = _retrievers.get(namespace)
+    if retriever is None:
+        retriever = _retrievers[namespace] = await asyncio.to_thread(_load_retriever, namespace)
+    return retriever
+
+
+def search_filter(source: str, file_name: str, type: str, page_from: int, page_to: int):
+    """Metadata filter from the query tool arguments (empty string / -1 = no condition)"""
+    from vectorstore import build_filter
+    return build_filter(
+        source=source or None,
+        file_name=file_name or None,
+        type=type or None,
+        page_from=page_from if page_from >= 0 else None,
+        page_to=page_to if page_to >= 0 else None,
+    )
+
+
+async def get_write_buffer():
+    """Write buffer singleton, built off the event loop on first use"""
+    global _write_buffer
+    if _write_buffer is None:
+        _write_buffer = await asyncio.to_thread(_load_write_buffer)
+    return _write_buffer
+
+
+def warm_up():
+    """Import the retrieval stack and open the vector store before the first query"""
+    try:
+        retriever = _load_retriever()
+        log_startup("warm-up: retriever ready")
+        retriever.connect()
+        log_startup("warm-up: vector store connected")
+    except Exception as e:
+        print(f"[startup] warm-up failed (will retry on first query): {e}", file=sys.stderr, flush=True)
+
+
 # Create an MCP server
 mcp = FastMCP("Demo")
 
@@ -34,62 +110,176 @@ def format_response(text: str) -> str:
     return f"*** This is response: {text} ***"
 
 @mcp.tool()
-def query_knowledge(query: str, k: int = 5) -> List[Dict[str, str]]:
+@metrics.timed("tool.query_knowledge")
+async def query_knowledge(
+    query: str,
+    k: int = 5,
+    mode: str = "",
+    source: str = "",
+    file_name: str = "",
+    type: str = "",
+    page_from: int = -1,
+    page_to: int = -1,
+    namespace: str = "",
+    max_tokens: int = 0,
+    snippets: bool = False,
+    diversity: float = 0.0,
+) -> List[Dict[str, str]]:
     """Query the knowledge base for relevant chunks
+
+    mode: "auto" (default; exact symbols such as MsgSendv or vdev_* use the keyword index only),
+    "hybrid" (keyword + semantic), "vector" (semantic only) or "lexical" (keyword only).
+    Optional filters, applied inside the index: source (file path or note source name), file_name,
+    type ("pdf", "txt", "manual_entry"), page_from/page_to (0-based, inclusive), and namespace
+    (the corpus/tenant partition to search; default partition when empty).
+    Overlapping or consecutive chunks of the same page come back as one result ("chunks" = how many).
+    max_tokens caps the response size (0 = server default): the best results are kept whole and the
+    next one is cut to the lines that mention the query. snippets=True returns only those lines.
+    diversity (0-1, default 0 = pure relevance) picks the k results from a larger pool by maximal
+    marginal relevance, so near-duplicate chunks and notes give way to other content; 0.3-0.5 works well.
     """
     try:
         # Limit k to avoid overload
         k = min(max(1, k), 20)
         
-        retriever = get_retriever()
-        results = retriever.query(query, k=k)
+        retriever = await get_retriever(namespace)
+        filter = search_filter(source, file_name, type, page_from, page_to)
+        results = await retriever.aquery(
+            query, k=k, mode=mode, filter=filter, max_tokens=max(0, max_tokens), snippets=snippets,
+            diversity=min(max(0.0, diversity), 1.0),
+        )
         
         return results
     except Exception as e:
         return [{"error": f"Failed to query knowledge base: {str(e)}"}]
 
 @mcp.tool()
-def query_knowledge_with_scores(query: str, k: int = 5) -> List[Dict[str, str]]:
+@metrics.timed("tool.query_knowledge_with_scores")
+async def query_knowledge_with_scores(
+    query: str,
+    k: int = 5,
+    mode: str = "",
+    source: str = "",
+    file_name: str = "",
+    type: str = "",
+    page_from: int = -1,
+    page_to: int = -1,
+    namespace: str = "",
+    max_tokens: int = 0,
+    snippets: bool = False,
+    diversity: float = 0.0,
+) -> List[Dict[str, str]]:
     """Query the knowledge base with similarity scores
+
+    mode, the filters, namespace, max_tokens, snippets and diversity are the same as for query_knowledge. Scores are cosine
+    similarity (vector), BM25 (lexical/symbol lookups) or reciprocal-rank-fusion scores (hybrid).
     """
     try:
         # Limit k to avoid overload
         k = min(max(1, k), 20)
         
-        retriever = get_retriever()
-        results = retriever.query_with_scores(query, k=k)
+        retriever = await get_retriever(namespace)
+        filter = search_filter(source, file_name, type, page_from, page_to)
+        results = await retriever.aquery_with_scores(
+            query, k=k, mode=mode, filter=filter, max_tokens=max(0, max_tokens), snippets=snippets,
+            diversity=min(max(0.0, diversity), 1.0),
+        )
         
         return results
     except Exception as e:
         return [{"error": f"Failed to query knowledge base: {str(e)}"}]
 
 @mcp.tool()
-def add_knowledge_text(text: str, source_name: str = "manual_entry") -> Dict[str, str]:
+@metrics.timed("tool.query_knowledge_batch")
+async def query_knowledge_batch(
+    queries: List[str],
+    k: int = 5,
+    mode: str = "",
+    source: str = "",
+    file_name: str = "",
+    type: str = "",
+    page_from: int = -1,
+    page_to: int = -1,
+    namespace: str = "",
+    max_tokens: int = 0,
+    snippets: bool = False,
+    diversity: float = 0.0,
+) -> Dict[str, List[Dict[str, str]]]:
+    """Query the knowledge base for many queries at once (e.g. every API used in a file)
+
+    Returns results with similarity scores grouped per query. Duplicate queries are answered once.
+    mode, the filters, namespace, snippets and diversity are the same as for query_knowledge; max_tokens is
+    the budget for the whole response, shared between the queries.
+    """
+    try:
+        # Limit batch size and k to avoid overload
+        queries = queries[:100]
+        k = min(max(1, k), 20)
+        
+        retriever = await get_retriever(namespace)
+        filter = search_filter(source, file_name, type, page_from, page_to)
+        results = await retriever.aquery_batch(
+            queries, k=k, mode=mode, filter=filter, max_tokens=max(0, max_tokens), snippets=snippets,
+            diversity=min(max(0.0, diversity), 1.0),
+        )
+        
+        return results
+    except Exception as e:
+        return {"error": [{"error": f"Failed to query knowledge base: {str(e)}"}]}
+
+@mcp.tool()
+@metrics.timed("tool.add_knowledge_text")
+async def add_knowledge_text(text: str, source_name: str = "manual_entry") -> Dict[str, str]:
     """Add text content directly to knowledge base (for conclusions, notes, analysis results)
     """
     try:
         if not text or not text.strip():
             return {"status": "error", "message": "Text content is empty"}
         
-        builder = DocumentBuilder()
-        result = builder.add_text_to_db(text_content=text, source_name=source_name)
+        # Buffered: notes are embedded and upserted together (see flush_knowledge)
+        write_buffer = await get_write_buffer()
+        result = await write_buffer.add(text_content=text, source_name=source_name)
         
         return result
     except Exception as e:
         return {"status": "error", "message": f"Failed to add text: {str(e)}"}
 
 @mcp.tool()
-def get_knowledge_info() -> Dict[str, str]:
-    """Get information about the knowledge base (index name, status)
+@metrics.timed("tool.flush_knowledge")
+async def flush_knowledge() -> Dict[str, str]:
+    """Write all buffered knowledge notes now (call before querying notes you just added)
+    """
+    try:
+        write_buffer = await get_write_buffer()
+        return await write_buffer.flush()
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to flush: {str(e)}"}
+
+@mcp.tool()
+async def get_knowledge_info(namespace: str = "") -> Dict[str, str]:
+    """Get information about the knowledge base (index name, status, vector count, dimension, namespaces, caches)
 
     """
     try:
-        retriever = get_retriever()
-        info = retriever.get_db_info()
+        retriever = await get_retriever(namespace)
+        info = await asyncio.to_thread(retriever.get_db_info)
+        if _write_buffer is not None:
+            for key, value in _write_buffer.stats().items():
+                info[f"write_buffer_{key}"] = value
         return info
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@mcp.tool()
+async def get_knowledge_metrics(format: str = "json") -> Dict[str, str]:
+    """Latency percentiles per stage and tool (ms) plus counters (calls, cache hits, tokens embedded, vectors written)
+
+    format="prometheus" returns the Prometheus text exposition under "metrics".
+    """
+    if format == "prometheus":
+        return {"status": "success", "metrics": metrics.to_prometheus()}
+    return metrics.snapshot()
+
 
 # Add a dynamic greeting resource
 # @mcp.resource("greeting://{name}")
@@ -132,6 +322,17 @@ def refactor_entire_file() -> str:
     return prompt_refactor_entire_file()
 
 
+log_startup("tools registered")
+
+
 # Entry point for MCP server
 if __name__ == "__main__":
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    if MCP_WARMUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
     mcp.run()
+    # Flush queued notes while the interpreter is still fully up; atexit is the fallback
+    if _write_buffer is not None:
+        from write_buffer import flush_on_shutdown
+        flush_on_shutdown()
@@ -0,0 +1,65 @@
+# manifest.py - Track ingested files (path -> content hash -> vector IDs) for incremental builds
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_DIR = os.getenv("BUILD_MANIFEST_DIR", os.path.join(SCRIPT_DIR, ".cache"))
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    """Hash file contents in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """JSON manifest of the files already ingested into one index"""
+
+    def __init__(self, index_name: str, path: str = None):
+        self.index_name = index_name
+        self.path = path or os.path.join(MANIFEST_DIR, f"manifest-{index_name}.json")
+        self.files: Dict[str, dict] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+
+    def get(self, path: str) -> Optional[dict]:
+        return self.files.get(path)
+
+    def is_current(self, path: str, sha256: str) -> bool:
+        entry = self.files.get(path)
+        return entry is not None and entry["sha256"] == sha256
+
+    def ids_for(self, path: str) -> List[str]:
+        entry = self.files.get(path)
+        return list(entry["ids"]) if entry else []
+
+    def record(self, path: str, sha256: str, ids: List[str]):
+        self.files[path] = {"sha256": sha256, "ids": list(ids)}
+
+    def remove(self, path: str):
+        self.files.pop(path, None)
+
+    def save(self):
+        """Write atomically so an interrupted build never leaves a torn manifest"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "index_name": self.index_name, "files": self.files},
+                f,
+            )
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,192 @@
+# metrics.py - In-process latency histograms, counters and Prometheus text export
+import asyncio
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Serve Prometheus text on http://0.0.0.0:METRICS_PORT/metrics (0 = disabled)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PREFIX = "rag"
+
+# Histogram bucket upper bounds in seconds (Prometheus convention)
+BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; quantiles are interpolated within buckets"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+class MetricsRegistry:
+    """Named histograms (timing spans), counters and gauges shared by the whole process"""
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        """Current level of something (e.g. queue depth); the last value set wins"""
+        with self._lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def span(self, name: str):
+        """Time a block into the histogram `name` (recorded even if the block raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        """Decorator form of span() for sync and async functions"""
+        def decorator(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> Dict[str, str]:
+        """Flat {metric: value} strings (MCP-friendly); latencies in milliseconds"""
+        with self._lock:
+            info = {"uptime_seconds": f"{time.time() - self.started:.0f}"}
+            for name in sorted(self.counters):
+                value = self.counters[name]
+                info[name] = str(int(value)) if float(value).is_integer() else f"{value:.3f}"
+            for name in sorted(self.gauges):
+                value = self.gauges[name]
+                info[name] = str(int(value)) if float(value).is_integer() else f"{value:.3f}"
+            for name in sorted(self.histograms):
+                h = self.histograms[name]
+                info[f"{name}.count"] = str(h.count)
+                info[f"{name}.mean_ms"] = f"{1000 * h.total / h.count:.3f}" if h.count else "0"
+                for q in (0.5, 0.95, 0.99):
+                    info[f"{name}.p{int(q * 100)}_ms"] = f"{1000 * h.quantile(q):.3f}"
+                info[f"{name}.max_ms"] = f"{1000 * h.max:.3f}"
+            return info
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (counters, gauges and cumulative histograms)"""
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = _metric_name(name) + "_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self.counters[name]}")
+            for name in sorted(self.gauges):
+                metric = _metric_name(name)
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {self.gauges[name]}")
+            for name in sorted(self.histograms):
+                h = self.histograms[name]
+                metric = _metric_name(name) + "_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, n in zip(BUCKETS, h.counts):
+                    cumulative += n
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+                lines.append(f"{metric}_sum {h.total}")
+                lines.append(f"{metric}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    cleaned = "".join(c if c.isalnum() else "_" for c in name)
+    return f"{METRICS_PREFIX}_{cleaned}"
+
+
+# Shared registry
+metrics = MetricsRegistry()
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> ThreadingHTTPServer:
+    """Serve metrics.to_prometheus() at /metrics on a background thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Prometheus metrics on http://0.0.0.0:{server.server_port}/metrics", file=sys.stderr)
+    return server
@@ -0,0 +1,317 @@
+# ocr.py - Parallel page-level OCR for scanned PDFs with a persistent OCR result cache
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+import pytesseract
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TESSERACT_PATH = os.getenv("TESSERACT_PATH", "C:\\Program Files\\Tesseract-OCR\\tesseract.exe")
+pytesseract.pytesseract.tesseract_cmd = TESSERACT_PATH
+
+# Number of OCR worker processes (1 = run in-process)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+# Set OCR_CACHE_PATH to an empty string to disable the cache
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", os.path.join(SCRIPT_DIR, ".cache", "ocr.sqlite"))
+
+OCR_LANG = "eng"
+# Image regions are rendered at their source resolution, clamped to this range:
+# rendering above the source DPI adds pixels but no detail, and Tesseract's cost
+# grows with pixel count (the cap matches the previous fixed 2x zoom, ~144 DPI)
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "100"))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", "150"))
+# Images covering less of the page than this (icons, logos, bullets) are not OCR'd
+OCR_MIN_IMAGE_AREA = float(os.getenv("OCR_MIN_IMAGE_AREA", "0.02"))
+# An image region with at least this much text layer on top of it is already searchable
+MIN_REGION_TEXT_CHARS = 20
+# A page with no text or images but this many vector paths is treated as outlined text
+MIN_VECTOR_PATHS = 10
+
+# A region to OCR: (x0, y0, x1, y1) in page points and the render resolution
+Region = Tuple[Tuple[float, float, float, float], int]
+
+
+class OcrCache:
+    """SQLite cache of OCR text keyed by a hash of the rendered pixmap"""
+
+    def __init__(self, path: str = OCR_CACHE_PATH, readonly: bool = False):
+        self.path = path
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS ocr (
+                pixmap_hash TEXT PRIMARY KEY,
+                text TEXT NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def get(self, pixmap_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM ocr WHERE pixmap_hash = ?", (pixmap_hash,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_many(self, items: List[Tuple[str, str]]):
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO ocr (pixmap_hash, text) VALUES (?, ?)", items)
+            self._conn.commit()
+
+
+def pixmap_hash(pix: "fitz.Pixmap", lang: str = OCR_LANG) -> str:
+    digest = hashlib.sha256(f"{lang}:{pix.width}x{pix.height}x{pix.n}:".encode())
+    digest.update(pix.samples)
+    return digest.hexdigest()
+
+
+def _merge_regions(regions: List[Region]) -> List[Region]:
+    """Union overlapping image rectangles so tiled or stacked images are OCR'd once"""
+    merged = []
+    for rect, dpi in sorted(regions):
+        rect = fitz.Rect(rect)
+        for i, (other, other_dpi) in enumerate(merged):
+            if rect.intersects(other):
+                merged[i] = (other | rect, max(dpi, other_dpi))
+                break
+        else:
+            merged.append((rect, dpi))
+    if len(merged) < len(regions):
+        return _merge_regions([(tuple(r), d) for r, d in merged])
+    return [(tuple(r), d) for r, d in merged]
+
+
+def classify_page(page: "fitz.Page") -> Tuple[str, List[Region], list]:
+    """Split a page into its text layer and the image-only regions that need OCR
+
+    Uses the text layer and image placement info only (no rendering), and
+    returns (text, regions, text blocks). Images that are small or already
+    have text on top of them (searchable scans, backgrounds) are skipped; a
+    page with neither text nor images but with vector drawings (outlined
+    fonts) is OCR'd whole.
+    """
+    text = page.get_text()
+    page_area = abs(page.rect) or 1.0
+    images = [
+        (info, fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info()
+    ]
+    images = [(info, bbox) for info, bbox in images if abs(bbox) >= OCR_MIN_IMAGE_AREA * page_area]
+    # Block positions are only needed to test image coverage and to order OCR output
+    blocks = []
+    if images and text.strip():
+        blocks = [b for b in page.get_text("blocks") if b[6] == 0 and b[4].strip()]
+
+    regions = []
+    for info, bbox in images:
+        covered = sum(
+            len(b[4].strip()) for b in blocks
+            if bbox.contains(fitz.Point((b[0] + b[2]) / 2, (b[1] + b[3]) / 2))
+        )
+        if covered >= MIN_REGION_TEXT_CHARS:
+            continue
+        # Effective resolution of the placed image (rotation-independent)
+        placed = abs(fitz.Rect(info["bbox"])) or 1.0
+        source_dpi = 72 * (info["width"] * info["height"] / placed) ** 0.5
+        dpi = int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, source_dpi)))
+        regions.append((tuple(bbox), dpi))
+
+    if not text.strip() and not images and len(page.get_cdrawings()) >= MIN_VECTOR_PATHS:
+        regions.append((tuple(page.rect), OCR_MIN_DPI))
+    return text, _merge_regions(regions), blocks
+
+
+def merge_page_text(text: str, blocks: list, ocr_results: List[Tuple[Tuple[float, ...], str]]) -> str:
+    """Interleave text-layer blocks and OCR'd regions in reading order (top-down, left-right)"""
+    ocr_results = [(rect, t) for rect, t in ocr_results if t.strip()]
+    if not ocr_results:
+        return text
+    if not blocks:
+        return "\n".join(t.strip() for _, t in ocr_results) + "\n"
+    pieces = [((b[1], b[0]), b[4].strip()) for b in blocks]
+    pieces += [((rect[1], rect[0]), t.strip()) for rect, t in ocr_results]
+    return "\n".join(t for _, t in sorted(pieces, key=lambda p: p[0])) + "\n"
+
+
+# ----------------------------------------------------------------------
+# Worker side (runs in each pool process; keeps its own open documents)
+# ----------------------------------------------------------------------
+
+_worker_cache = None
+_worker_docs = {}
+
+
+def _init_worker(cache_path: str):
+    global _worker_cache
+    _worker_cache = None
+    if cache_path and os.path.exists(cache_path):
+        try:
+            _worker_cache = OcrCache(cache_path, readonly=True)
+        except sqlite3.Error:
+            _worker_cache = None
+
+
+def _ocr_page(task: Tuple[str, int, List[Region]]) -> Tuple[int, list, List[Tuple[str, str]], int]:
+    """Render and OCR the image regions of one page in grayscale
+
+    Returns (page_num, [(rect, text)], fresh (pixmap hash, text) pairs, cache hits).
+    """
+    pdf_path, page_num, regions = task
+    doc = _worker_docs.get(pdf_path)
+    if doc is None:
+        # Only the current file is kept open per worker
+        for old in _worker_docs.values():
+            old.close()
+        _worker_docs.clear()
+        doc = _worker_docs[pdf_path] = fitz.open(pdf_path)
+
+    page = doc[page_num]
+    results, fresh, hits = [], [], 0
+    for rect, dpi in regions:
+        zoom = dpi / 72
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=fitz.Rect(rect), colorspace=fitz.csGRAY, alpha=False)
+        key = pixmap_hash(pix)
+
+        if _worker_cache is not None:
+            cached = _worker_cache.get(key)
+            if cached is not None:
+                results.append((rect, cached))
+                hits += 1
+                continue
+
+        img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+        try:
+            text = pytesseract.image_to_string(img, lang=OCR_LANG)
+        except Exception as e:
+            print(f"OCR failed for page {page_num}: {e}")
+            continue
+        results.append((rect, text))
+        fresh.append((key, text))
+    return page_num, results, fresh, hits
+
+
+# ----------------------------------------------------------------------
+# Parent side
+# ----------------------------------------------------------------------
+
+class PageOcr:
+    """Extract per-page text from PDFs, OCR'ing scanned pages across a process pool"""
+
+    def __init__(self, workers: int = OCR_WORKERS, cache_path: str = OCR_CACHE_PATH):
+        self.workers = max(1, workers)
+        self.cache_path = cache_path
+        self.cache = OcrCache(cache_path) if cache_path else None
+        self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: MuPDF's global state is not fork-safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.cache_path,),
+            )
+        return self._executor
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def iter_pages(self, pdf_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page_num, text) for every page, in page order, as pages complete
+
+        Pages are classified from their text layer and image placements
+        (see classify_page). Text pages are passed straight through; pages
+        with image-only regions have just those regions OCR'd in the pool,
+        keeping at most a few pages per worker in flight so memory stays
+        bounded on very large files.
+        """
+        file_name = os.path.basename(pdf_path)
+        start = time.perf_counter()
+        max_in_flight = self.workers * 4
+        window = deque()
+        fresh = []
+        stats = {"scanned": 0, "regions": 0, "hits": 0}
+
+        def resolve(page_num, pending, text, blocks):
+            if pending is None:
+                return page_num, text
+            _, results, new, hits = pending.result() if isinstance(pending, Future) else pending
+            stats["hits"] += hits
+            fresh.extend(new)
+            if self.cache is not None and len(fresh) >= 32:
+                self.cache.put_many(fresh)
+                fresh.clear()
+            return page_num, merge_page_text(text, blocks, results)
+
+        if self.workers == 1:
+            _init_worker(self.cache_path)
+
+        with fitz.open(pdf_path) as pdf_document:
+            total_pages = len(pdf_document)
+            print(f"Processing {total_pages} pages from {file_name}...")
+
+            for page_num in range(total_pages):
+                text, regions, blocks = classify_page(pdf_document[page_num])
+                if regions:
+                    stats["scanned"] += 1
+                    stats["regions"] += len(regions)
+                    task = (pdf_path, page_num, regions)
+                    if self.workers == 1:
+                        pending = _ocr_page(task)
+                    else:
+                        pending = self._pool().submit(_ocr_page, task)
+                    window.append((page_num, pending, text, blocks))
+                    if stats["scanned"] % 50 == 0:
+                        elapsed = time.perf_counter() - start
+                        print(f"  {page_num + 1}/{total_pages} pages, {stats['scanned']} OCR'd "
+                              f"({(page_num + 1) / elapsed:.1f} pages/sec)")
+                else:
+                    window.append((page_num, None, text, None))
+
+                while window and (
+                    len(window) > max_in_flight
+                    or not isinstance(window[0][1], Future)
+                    or window[0][1].done()
+                ):
+                    yield resolve(*window.popleft())
+
+        while window:
+            yield resolve(*window.popleft())
+        if self.cache is not None:
+            self.cache.put_many(fresh)
+
+        elapsed = time.perf_counter() - start
+        rate = total_pages / elapsed if elapsed > 0 else float("inf")
+        print(
+            f"{file_name}: {total_pages} pages in {elapsed:.1f}s ({rate:.1f} pages/sec), "
+            f"{stats['scanned']} OCR'd in {stats['regions']} region(s) "
+            f"({stats['hits']} from cache, {self.workers} worker(s))"
+        )
+
+    def extract_pages(self, pdf_path: str) -> List[Tuple[int, str]]:
+        """Return (page_num, text) for every page, in page order"""
+        return list(self.iter_pages(pdf_path))
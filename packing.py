@@ -0,0 +1,208 @@
+# packing.py - Merge overlapping hits and pack query results into a token budget
+import os
+import re
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from lexical_index import tokenize
+from tokens import count_tokens, count_tokens_batch
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Default token budget for one query's results (0 = no budget, whole merged chunks)
+QUERY_MAX_TOKENS = int(os.getenv("QUERY_MAX_TOKENS", "0"))
+# Size of a query-focused snippet when snippets are requested
+SNIPPET_TOKENS = int(os.getenv("SNIPPET_TOKENS", "120"))
+# A result that no longer fits is cut down to a snippet only if at least this much budget is left
+MIN_SNIPPET_TOKENS = 32
+# Rough cost of a result's keys and punctuation (rank, score, source, page) in the response
+RESULT_OVERHEAD_TOKENS = 8
+# Characters of a chunk's start looked up in the previous chunk to find their overlap
+OVERLAP_PROBE_CHARS = 48
+ELLIPSIS = "..."
+# Lines longer than this are split into sentences for snippets
+SNIPPET_LINE_CHARS = 200
+_SENTENCE_END = re.compile(r"(?<=[.;:!?])[ \t]+")
+
+
+def overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (0 if none)
+
+    Chunks carry their overlap as whole lines, so the probe usually
+    matches on the first try.
+    """
+    probe = b[:OVERLAP_PROBE_CHARS]
+    if not probe:
+        return 0
+    start = max(0, len(a) - len(b))
+    while True:
+        i = a.find(probe, start)
+        if i < 0:
+            return 0
+        if b.startswith(a[i:]):
+            return len(a) - i
+        start = i + 1
+
+
+class Span:
+    """Run of overlapping chunks from one source page
+
+    Chunks are joined on shared text only: incremental builds keep the
+    chunk_id of unchanged chunks, so it does not say which chunks are
+    neighbours in the current file.
+    """
+
+    def __init__(self, doc: Document, score: float, rank: int):
+        self.metadata = doc.metadata
+        self.text = doc.page_content
+        self.score = score
+        self.rank = rank
+        self.chunks = 1
+
+    def absorb(self, text: str, score: float, rank: int, chunks: int = 1) -> bool:
+        """Join text if it repeats, contains, continues or precedes this span; False if it is elsewhere"""
+        if self.text in text:
+            self.text = text
+        elif text not in self.text:
+            after = overlap(self.text, text)
+            before = 0 if after else overlap(text, self.text)
+            if after:
+                self.text += text[after:]
+            elif before:
+                self.text = text + self.text[before:]
+            else:
+                return False
+        self.score = max(self.score, score)
+        self.rank = min(self.rank, rank)
+        self.chunks += chunks
+        return True
+
+
+def _join(spans: List[Span]) -> List[Span]:
+    """Join spans that overlap each other once a later hit has bridged them"""
+    i = 0
+    while i < len(spans):
+        for j in range(i + 1, len(spans)):
+            other = spans[j]
+            if spans[i].absorb(other.text, other.score, other.rank, other.chunks):
+                del spans[j]
+                break
+        else:
+            i += 1
+    return spans
+
+
+def merge_results(results: List[Tuple[Document, float]]) -> List[Span]:
+    """Merge hits from the same source/page whose texts overlap
+
+    Spans are returned in the order of their best-ranked hit.
+    """
+    pages: Dict[Tuple[str, str], List[Span]] = {}
+    for rank, (doc, score) in enumerate(results):
+        key = (str(doc.metadata.get("source", "unknown")), str(doc.metadata.get("page", "unknown")))
+        page = pages.setdefault(key, [])
+        if not any(span.absorb(doc.page_content, score, rank) for span in page):
+            page.append(Span(doc, score, rank))
+
+    spans = [span for page in pages.values() for span in _join(page)]
+    spans.sort(key=lambda span: span.rank)
+    return spans
+
+
+def _units(text: str) -> List[Tuple[str, str]]:
+    """(separator, piece) pairs: non-blank lines, long lines broken after sentence ends"""
+    units = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        pieces = _SENTENCE_END.split(line) if len(line) > SNIPPET_LINE_CHARS else [line]
+        units += [("\n" if j == 0 else " ", piece) for j, piece in enumerate(pieces) if piece.strip()]
+    return units
+
+
+def snippet(text: str, query: str, max_tokens: int) -> str:
+    """Contiguous run of lines/sentences within max_tokens that mentions the most query terms
+
+    Units are scored by the query terms (code-aware, see lexical_index.tokenize)
+    they contain and the best window is found with two pointers over their
+    token counts. Cut ends are marked with an ellipsis.
+    """
+    units = _units(text)
+    if not units:
+        return ""
+    terms = set(tokenize(query))
+    hits = [len(terms.intersection(tokenize(piece))) for _, piece in units]
+    tokens = count_tokens_batch([piece for _, piece in units])
+    budget = max(1, max_tokens - 2)
+
+    best, best_start, best_end = -1, 0, 0
+    start = used = found = 0
+    for end in range(len(units)):
+        used += tokens[end]
+        found += hits[end]
+        while used > budget and start < end:
+            used -= tokens[start]
+            found -= hits[start]
+            start += 1
+        if found > best:
+            best, best_start, best_end = found, start, end + 1
+
+    window = units[best_start:best_end]
+    out = window[0][1] + "".join(sep + piece for sep, piece in window[1:])
+    truncated = False
+    if tokens[best_start] > budget:
+        # A single unit over the budget: keep its head, cut at a space
+        out = out[:out.rfind(" ", 0, budget * 4) if " " in out[:budget * 4] else budget * 4]
+        truncated = True
+    if best_start > 0:
+        out = ELLIPSIS + " " + out
+    if best_end < len(units) or truncated:
+        out = out + " " + ELLIPSIS
+    return out
+
+
+def pack_results(
+    results: List[Tuple[Document, float]],
+    query: str = "",
+    max_tokens: int = 0,
+    snippets: bool = False,
+    with_scores: bool = False,
+) -> List[Dict[str, str]]:
+    """Merge ranked hits and fit them into max_tokens (0 = no budget); values are MCP strings
+
+    Spans are taken in rank order. With snippets each span is cut to a
+    query-focused snippet of SNIPPET_TOKENS; a span that no longer fits the
+    remaining budget is cut to a snippet of what is left, and smaller spans
+    further down may still fill the rest.
+    """
+    remaining = max_tokens if max_tokens > 0 else None
+    packed = []
+    for span in merge_results(results):
+        content = span.text
+        if snippets and query:
+            content = snippet(content, query, SNIPPET_TOKENS)
+        if remaining is not None:
+            source = str(span.metadata.get("source", "unknown"))
+            cost = RESULT_OVERHEAD_TOKENS + count_tokens(source)
+            tokens = count_tokens(content)
+            if cost + tokens > remaining:
+                if remaining - cost < MIN_SNIPPET_TOKENS:
+                    continue
+                content = snippet(content, query, remaining - cost)
+                tokens = count_tokens(content)
+            remaining -= cost + tokens
+
+        result = {"rank": str(len(packed) + 1)}
+        if with_scores:
+            result["score"] = f"{span.score:.4f}"
+        result.update({
+            "content": content,
+            "source": str(span.metadata.get("source", "unknown")),
+            "page": str(span.metadata.get("page", "unknown")),
+        })
+        if span.chunks > 1:
+            result["chunks"] = str(span.chunks)
+        packed.append(result)
+    return packed
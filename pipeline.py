@@ -0,0 +1,87 @@
+# pipeline.py - Run generator stages concurrently, connected by bounded queues
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+class Pipeline:
+    """Chain of generator stages, each running in its own thread
+
+    Every stage is a function that takes an iterator of items and yields
+    items for the next stage. Stages are joined by bounded queues, so a
+    slow stage applies back-pressure instead of letting memory grow, and
+    all stages make progress at the same time. Iterating the pipeline
+    yields the output of the last stage; an exception in any stage stops
+    the others and is re-raised in the consumer.
+    """
+
+    def __init__(
+        self,
+        source: Iterable,
+        stages: List[Callable[[Iterator], Iterable]],
+        queue_sizes: List[int] = None,
+    ):
+        self.source = source
+        self.stages = stages
+        # Capacity of the queue in front of each stage, plus the output queue
+        self.queue_sizes = queue_sizes or [8] * (len(stages) + 1)
+        if len(self.queue_sizes) != len(stages) + 1:
+            raise ValueError("queue_sizes needs one entry per stage plus one for the output")
+        self._stop = threading.Event()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, q: queue.Queue) -> Iterator:
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                # Forward upstream failures unchanged
+                raise item.exc
+            yield item
+
+    def _run_stage(self, items: Iterable, out: queue.Queue):
+        try:
+            for item in items:
+                if not self._put(out, item):
+                    return
+            self._put(out, _DONE)
+        except BaseException as e:
+            self._put(out, _StageError(e))
+
+    def __iter__(self) -> Iterator:
+        # queues[i] feeds stages[i]; the last queue feeds the consumer
+        queues = [queue.Queue(maxsize=size) for size in self.queue_sizes]
+        threads = [threading.Thread(target=self._run_stage, args=(iter(self.source), queues[0]), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(stage(self._drain(queues[i])), queues[i + 1]), daemon=True
+            ))
+        for thread in threads:
+            thread.start()
+        try:
+            yield from self._drain(queues[-1])
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
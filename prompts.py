@@ -13,7 +13,7 @@ Analyze the current function opened in the MCP reverse tool using the workflow b
 2. INTERNAL RAG LOOKUP (PRIORITY)
 ------------------------------------------------------------
 When reasoning about APIs, patterns, or behaviors:
-- First retrieve supporting information from the **internal knowledge base** via `query_knowledge_with_scores`.
+- First retrieve supporting information from the **internal knowledge base** via `query_knowledge_with_scores` (use `query_knowledge_batch` when looking up several APIs at once).
 - Only if internal data is insufficient, use external domain knowledge and clearly mark it as **[External Reference]**.
 
 Do NOT include any RAG text in the output.
@@ -42,7 +42,7 @@ Do NOT output:
 ------------------------------------------------------------
 4. KNOWLEDGE BASE UPDATE
 ------------------------------------------------------------
-Save the final distilled findings using `add_knowledge_text`.
+Save the final distilled findings using `add_knowledge_text` (writes are buffered; call `flush_knowledge` before querying them back).
 
 Format:
 "Analysis of [function name]/[file name]: [your findings]"
@@ -65,7 +65,8 @@ Perform a comprehensive security analysis of the current file opened in the reve
 2. INTERNAL RAG LOOKUP (STRICT PRIORITY)
 ------------------------------------------------------------
 When analyzing semantics or security behavior:
-- Prefer internal knowledge via `query_knowledge_with_scores`.
+- Prefer internal knowledge via `query_knowledge_batch`: collect the function names, APIs and patterns of interest across the whole file (or a large group of functions) and send them as ONE list of queries, instead of one `query_knowledge_with_scores` call per function.
+- Use `query_knowledge_with_scores` only for an individual follow-up lookup.
 - External knowledge may be used only when necessary, and must be marked **[External Reference]**.
 
 No RAG text should appear in the final output.
@@ -92,7 +93,7 @@ Provide:
 ------------------------------------------------------------
 5. KNOWLEDGE BASE UPDATE
 ------------------------------------------------------------
-Store results using `add_knowledge_text`.
+Store results using `add_knowledge_text` (writes are buffered; call `flush_knowledge` before querying them back).
 
 Formats:
 - "Analysis of [function name]/[filename]: [findings]"
@@ -132,7 +133,7 @@ C) **Short comments**, including:
    - Basic security observations  
      (unchecked memcpy, missing validation, unsafe parsing, HV boundary issues)
 
-If necessary, internally call `query_knowledge_with_scores` for additional context.
+If necessary, internally call `query_knowledge_with_scores` for additional context (or `query_knowledge_batch` for several APIs at once).
 
 Rules:
 - Internal RAG is top priority.
@@ -191,7 +192,7 @@ C) Short, meaningful comments explaining:
    - workflow  
    - simple security risks  
 
-Claude may internally use `query_knowledge_with_scores` if needed.
+Claude may internally use `query_knowledge_batch` if needed, sending the APIs of all functions as one list of queries rather than one call per function.
 
 Rules:
 - Internal RAG > external references  
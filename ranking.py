@@ -0,0 +1,64 @@
+# ranking.py - Combine and re-rank search results
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Standard RRF damping constant: ranks beyond the first few contribute little
+RRF_K = 60
+
+
+def result_key(doc: Document) -> str:
+    """Identity of a chunk across result lists (vector ID, else source/page/chunk)"""
+    if doc.id:
+        return doc.id
+    metadata = doc.metadata
+    return f"{metadata.get('source')}|{metadata.get('page')}|{metadata.get('chunk_id')}|{hash(doc.page_content)}"
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Tuple[Document, float]]],
+    k: int,
+    rrf_k: int = RRF_K,
+) -> List[Tuple[Document, float]]:
+    """Fuse ranked lists by summing 1 / (rrf_k + rank); returns (Document, fused score) pairs"""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, 1):
+            key = result_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+    return [(docs[key], score) for key, score in ranked]
+
+
+def maximal_marginal_relevance(query: np.ndarray, candidates: np.ndarray, k: int, diversity: float) -> List[int]:
+    """Indices of k candidates picked greedily by maximal marginal relevance
+
+    Each pick maximizes (1 - diversity) * cos(query, c) - diversity * max cos(c, picked),
+    so diversity 0 keeps the relevance order and 1 only avoids redundancy.
+    The similarity matrix is computed once; each step updates the running
+    max similarity to the picked set with one vectorized maximum.
+    """
+    n = len(candidates)
+    if n == 0 or k <= 0:
+        return []
+    vectors = np.asarray(candidates, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    query = np.asarray(query, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = (1.0 - diversity) * (vectors @ query)
+    similarity = diversity * (vectors @ vectors.T)
+    picked = [int(np.argmax(relevance))]
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    redundancy = similarity[picked[0]].copy()
+    for _ in range(min(k, n) - 1):
+        i = int(np.argmax(np.where(available, relevance - redundancy, -np.inf)))
+        picked.append(i)
+        available[i] = False
+        np.maximum(redundancy, similarity[i], out=redundancy)
+    return picked
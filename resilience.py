@@ -0,0 +1,367 @@
+# resilience.py - Timeouts, jittered retries, hedged requests and circuit breakers for remote calls
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from concurrency import remaining
+from ingest_engine import error_status, is_retryable
+from metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Per-attempt timeout (seconds) and retries of failed idempotent calls (429, 5xx, timeouts, resets)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+# Jittered exponential backoff between retries, unless the server sends Retry-After
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+# Send a duplicate read when the first one is slower than the upstream's recent p95 (0 = off)
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "1") == "1"
+HEDGE_QUANTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.02
+LATENCY_WINDOW = 256
+# Consecutive failed attempts that open the breaker, and seconds before it lets a trial call through
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "15"))
+# Worker threads for synchronous calls (attempts and hedges run here so they can time out)
+UPSTREAM_THREADS = 32
+# Synchronous attempts of one upstream that may run at once, including timed-out or losing
+# ones that are still finishing; past this, calls fail fast instead of queueing behind them
+UPSTREAM_MAX_RUNNING = int(os.getenv("UPSTREAM_MAX_RUNNING", "16"))
+
+
+class UpstreamUnavailable(RuntimeError):
+    """The upstream is failing: the breaker is open or every attempt failed"""
+
+
+class UpstreamTimeout(TimeoutError):
+    """One attempt took longer than the per-call timeout"""
+
+
+class LatencyWindow:
+    """Recent successful call latencies; the hedge delay is their p95"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples = deque(maxlen=size)
+        self._quantile = None
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            # Recomputed lazily, at most every 16 samples
+            if len(self.samples) % 16 == 0:
+                self._quantile = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < HEDGE_MIN_SAMPLES:
+                return None
+            if self._quantile is None:
+                ordered = sorted(self.samples)
+                self._quantile = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+            return self._quantile
+
+
+class CircuitBreaker:
+    """Closed -> open after `failures` consecutive failed attempts -> half-open after `cooldown`
+
+    While open every call fails fast; half-open lets one trial call through
+    and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.name = name
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self.state != "closed":
+                metrics.set_gauge(f"upstream.{self.name}.breaker_open", 0)
+            self.state = "closed"
+            self.consecutive = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            self._trial = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                metrics.inc(f"upstream.{self.name}.breaker_opened")
+                metrics.set_gauge(f"upstream.{self.name}.breaker_open", 1)
+
+    def release(self):
+        """The trial call ended without a verdict (e.g. cancelled)"""
+        with self._lock:
+            self._trial = False
+
+
+_executor = ThreadPoolExecutor(max_workers=UPSTREAM_THREADS, thread_name_prefix="upstream")
+
+
+class Upstream:
+    """Resilience policy for one remote dependency (e.g. "openai", "pinecone")
+
+    call()/acall() run an idempotent function with a per-attempt timeout
+    (capped by the request deadline), retry retryable failures with
+    jittered backoff, and - when hedge=True - send one duplicate attempt if
+    the first is still running after the upstream's recent p95 latency,
+    keeping whichever answers first. Failed attempts feed a circuit breaker
+    that makes calls fail fast with UpstreamUnavailable while it is open, so
+    callers can fall back to local data.
+
+    A blocking attempt cannot be stopped once abandoned, so call() also
+    fails fast while max_running attempts of this upstream still hold
+    worker threads.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = UPSTREAM_TIMEOUT,
+        max_retries: int = UPSTREAM_MAX_RETRIES,
+        hedge: bool = UPSTREAM_HEDGE,
+        breaker: CircuitBreaker = None,
+        max_running: int = UPSTREAM_MAX_RUNNING,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker(name)
+        self.latency = LatencyWindow()
+        self.max_running = max(1, max_running)
+        self.running = 0
+        self._running_lock = threading.Lock()
+
+    def hedge_delay(self) -> Optional[float]:
+        p95 = self.latency.quantile(HEDGE_QUANTILE) if self.hedge else None
+        return None if p95 is None else max(HEDGE_MIN_DELAY, p95)
+
+    def _attempt_timeout(self) -> float:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise UpstreamTimeout(f"Deadline exceeded before calling {self.name}")
+        return self.timeout if left is None else min(self.timeout, left)
+
+    def _admit(self):
+        if not self.breaker.allow():
+            metrics.inc(f"upstream.{self.name}.short_circuited")
+            raise UpstreamUnavailable(f"{self.name} is unavailable (circuit open after repeated failures)")
+
+    def _backoff(self, attempt: int, error: BaseException) -> Optional[float]:
+        """Delay before the next attempt, or None when there is no time or attempt left"""
+        if attempt >= self.max_retries:
+            return None
+        _, retry_after = error_status(error)
+        delay = retry_after if retry_after is not None else min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+        delay *= 0.5 + random.random()
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        return delay
+
+    def _settle(self, error: Optional[BaseException], start: float) -> bool:
+        """Record one attempt's outcome; True if the error is worth retrying"""
+        if error is None:
+            elapsed = time.perf_counter() - start
+            self.latency.observe(elapsed)
+            metrics.observe(f"upstream.{self.name}", elapsed)
+            self.breaker.success()
+            return False
+        status, _ = error_status(error)
+        if not is_retryable(error, status):
+            # The upstream answered (e.g. 400): healthy, but retrying will not help
+            self.breaker.success()
+            return False
+        metrics.inc(f"upstream.{self.name}.failures")
+        if isinstance(error, TimeoutError):
+            metrics.inc(f"upstream.{self.name}.timeouts")
+        self.breaker.failure()
+        return True
+
+    def _unavailable(self, error: BaseException) -> UpstreamUnavailable:
+        return UpstreamUnavailable(f"{self.name} is unavailable: {type(error).__name__}: {error}")
+
+    def call(self, fn: Callable[[], Any], hedge: bool = True) -> Any:
+        """Run a blocking, idempotent fn under this policy"""
+        for attempt in range(self.max_retries + 1):
+            timeout = self._attempt_timeout()
+            self._admit()
+            start = time.perf_counter()
+            try:
+                result = self._attempt(fn, timeout, hedge)
+            except UpstreamUnavailable:
+                # No worker for the attempt: nothing was sent, so the breaker gets no verdict
+                self.breaker.release()
+                raise
+            except BaseException as e:
+                if not isinstance(e, Exception):
+                    self.breaker.release()
+                    raise
+                if not self._settle(e, start):
+                    raise
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise self._unavailable(e) from e
+                metrics.inc(f"upstream.{self.name}.retries")
+                time.sleep(delay)
+                continue
+            self._settle(None, start)
+            return result
+
+    def _submit(self, fn: Callable[[], Any]) -> Optional[Future]:
+        """Start fn on a worker thread, or None while max_running attempts are still running"""
+        with self._running_lock:
+            if self.running >= self.max_running:
+                return None
+            self.running += 1
+        try:
+            # copy_context: the request deadline and metrics context follow the call into the worker
+            future = _executor.submit(contextvars.copy_context().run, fn)
+        except RuntimeError:
+            # Interpreter shutdown (e.g. the write buffer's exit flush) refuses new work: run inline
+            future = Future()
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: Future):
+        with self._running_lock:
+            self.running -= 1
+
+    def _attempt(self, fn: Callable[[], Any], timeout: float, hedge: bool) -> Any:
+        deadline = time.monotonic() + timeout
+        first = self._submit(fn)
+        if first is None:
+            metrics.inc(f"upstream.{self.name}.saturated")
+            raise UpstreamUnavailable(
+                f"{self.name} is unavailable ({self.running} earlier calls are still running)"
+            )
+        pending = {first}
+        hedged = None
+        delay = self.hedge_delay() if hedge else None
+        if delay is not None and delay < timeout:
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                # Without a free slot the first attempt simply runs on alone
+                hedged = self._submit(fn)
+                if hedged is not None:
+                    metrics.inc(f"upstream.{self.name}.hedges")
+                    pending.add(hedged)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=deadline - time.monotonic(), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        metrics.inc(f"upstream.{self.name}.hedge_wins")
+                    # A blocking call cannot be cancelled once started; the loser just finishes
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise UpstreamTimeout(f"{self.name} call timed out after {timeout:.1f}s")
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        """Run an idempotent coroutine factory under this policy"""
+        for attempt in range(self.max_retries + 1):
+            timeout = self._attempt_timeout()
+            self._admit()
+            start = time.perf_counter()
+            try:
+                result = await self._aattempt(fn, timeout, hedge)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if not self._settle(e, start):
+                    raise
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise self._unavailable(e) from e
+                metrics.inc(f"upstream.{self.name}.retries")
+                await asyncio.sleep(delay)
+                continue
+            self._settle(None, start)
+            return result
+
+    async def _aattempt(self, fn: Callable[[], Awaitable[Any]], timeout: float, hedge: bool) -> Any:
+        deadline = time.monotonic() + timeout
+        pending = {asyncio.ensure_future(fn())}
+        hedged = None
+        delay = self.hedge_delay() if hedge else None
+        try:
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    metrics.inc(f"upstream.{self.name}.hedges")
+                    hedged = asyncio.ensure_future(fn())
+                    pending.add(hedged)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=deadline - time.monotonic(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            metrics.inc(f"upstream.{self.name}.hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            raise UpstreamTimeout(f"{self.name} call timed out after {timeout:.1f}s")
+        finally:
+            # The losing duplicate (or a timed-out attempt) is not needed any more
+            for task in pending:
+                task.cancel()
+
+
+# One policy per remote dependency, shared by the whole process
+_upstreams: Dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name: str) -> Upstream:
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+        if upstream is None:
+            upstream = _upstreams[name] = Upstream(name)
+        return upstream
@@ -1,9 +1,24 @@
 # retriever.py - Query and retrieve from vector database
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
+import asyncio
 import os
-from typing import List, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Dict, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
 from dotenv import load_dotenv
+from embedding_cache import get_embedding_cache, make_embeddings
+from vectorstore import (
+    VECTOR_NAMESPACE, VECTOR_STORE_BACKEND, fetch_vectors, get_vector_store, index_generation, index_stats,
+    partition_name,
+)
+from metrics import metrics
+from concurrency import ConcurrencyGate, SingleFlight, request_deadline
+from resilience import UpstreamUnavailable, get_upstream
+from query_cache import LRUCache, embedding_key, freeze
+from lexical_index import get_lexical_index, is_symbol_query
+from ranking import maximal_marginal_relevance, reciprocal_rank_fusion
+from packing import QUERY_MAX_TOKENS, pack_results
 
 # Load environment variables from .env file
 load_dotenv()
@@ -13,80 +28,494 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "rag-mcp-server")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Validate required API keys
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY not found in environment variables. Please set it in .env file.")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment variables. Please set it in .env file.")
+# In-process query caches: entries per cache and time-to-live in seconds (0 = no expiry)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "600"))
+# Concurrent vector searches per query_batch call
+QUERY_BATCH_WORKERS = int(os.getenv("QUERY_BATCH_WORKERS", "8"))
+# auto: symbol lookups (MsgSendv, vdev_*) skip embeddings, other queries are hybrid
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "auto").lower()
+RETRIEVAL_MODES = ("auto", "hybrid", "vector", "lexical")
+# Hybrid mode fuses this many candidates per requested result from each ranker
+HYBRID_CANDIDATES_FACTOR = 4
+# Outbound embedding and vector-store calls in flight at once (per process, shared by all
+# namespaces), calls that may queue behind them, and the deadline of one query in seconds
+# (0 = none): a burst queues instead of tripping provider rate limits, and a full queue or
+# a passed deadline fails that query fast instead of slowing everyone down
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+VECTOR_CONCURRENCY = int(os.getenv("VECTOR_CONCURRENCY", "8"))
+BACKEND_MAX_QUEUE = int(os.getenv("BACKEND_MAX_QUEUE", "64"))
+QUERY_DEADLINE = float(os.getenv("QUERY_DEADLINE", "30"))
+# Diversified (MMR) queries re-rank this many candidates per requested result
+MMR_CANDIDATES_FACTOR = 4
 
-# Set API keys as environment variables (for langchain)
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
+
+# Identical concurrent embeddings/searches run once (single-flight), behind the gates
+_flights = SingleFlight("query")
+_embed_gate = ConcurrencyGate("embed", EMBED_CONCURRENCY, BACKEND_MAX_QUEUE, QUERY_DEADLINE or None)
+_vector_gate = ConcurrencyGate("vector", VECTOR_CONCURRENCY, BACKEND_MAX_QUEUE, QUERY_DEADLINE or None)
+
+
+def check_api_keys():
+    """Validate required API keys (on first use, not at import)"""
+    if VECTOR_STORE_BACKEND == "pinecone" and not PINECONE_API_KEY:
+        raise ValueError("PINECONE_API_KEY not found in environment variables. Please set it in .env file.")
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY not found in environment variables. Please set it in .env file.")
+    
+    # Set API keys as environment variables (for langchain)
+    if PINECONE_API_KEY:
+        os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
+    os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
 
 class DocumentRetriever:
-    """Handle queries and similarity search from vector database"""
+    """Handle queries and similarity search from vector database
+
+    One retriever serves one namespace of the index. Metadata filters
+    (see vectorstore.build_filter) are passed down to the vector store
+    and the lexical index, not applied to the results afterwards.
+
+    Embedding and Pinecone calls run under the resilience policies of
+    resilience.py. While either upstream is unavailable (circuit open or
+    retries exhausted) queries are answered from the lexical index alone.
+    """
     
-    def __init__(self, index_name: str = PINECONE_INDEX_NAME):
+    def __init__(self, index_name: str = PINECONE_INDEX_NAME, namespace: str = VECTOR_NAMESPACE):
+        check_api_keys()
         self.index_name = index_name
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-small",
-            openai_api_key=OPENAI_API_KEY
-        )
+        self.namespace = namespace or None
+        self.partition = partition_name(index_name, self.namespace)
+        self.embeddings = make_embeddings(OPENAI_API_KEY, pooled=True, resilient=True)
+        # The local index is in-process and needs no timeouts, retries or breaker
+        self.remote = get_upstream("pinecone") if VECTOR_STORE_BACKEND == "pinecone" else None
         self.vectorstore = None
+        self._connect_lock = threading.Lock()
+        # query text -> embedding, and (embedding, k, filters) -> results
+        self.query_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.result_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self._cache_generation = index_generation()
+        # BM25 index over the same chunks, for exact identifiers and hybrid ranking
+        self.lexical = get_lexical_index(self.partition)
     
     def connect(self):
-        """Connect to existing Pinecone vector database"""
-        if self.vectorstore is None:
-            self.vectorstore = PineconeVectorStore(
-                index_name=self.index_name,
-                embedding=self.embeddings
-            )
+        """Connect to existing vector database (Pinecone or local index)"""
+        with self._connect_lock:
+            if self.vectorstore is None:
+                self.vectorstore = get_vector_store(self.index_name, self.embeddings, namespace=self.namespace)
         return self.vectorstore
     
-    def query(self, query: str, k: int = 5) -> List[Dict[str, str]]:
-        """Query to get k most relevant chunks
+    def invalidate_cache(self):
+        """Drop cached search results (query embeddings stay valid)"""
+        self.result_cache.clear()
+        self._cache_generation = index_generation()
+    
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the in-process query embedding cache
+
+        Concurrent misses for the same query share one embedding request.
         """
+        embedding = self.query_embedding_cache.get(query)
+        metrics.inc("query.embedding_cache_hits" if embedding is not None else "query.embedding_cache_misses")
+        if embedding is None:
+            embedding = _flights.do(("embed", query), lambda: self._embed(query))
+        return embedding
+    
+    def _embed(self, query: str) -> List[float]:
+        with _embed_gate.slot(), metrics.span("query.embed"):
+            embedding = self.embeddings.embed_query(query)
+        self.query_embedding_cache.put(query, embedding)
+        return embedding
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async embed_query on the shared async HTTP client"""
+        embedding = self.query_embedding_cache.get(query)
+        metrics.inc("query.embedding_cache_hits" if embedding is not None else "query.embedding_cache_misses")
+        if embedding is None:
+            embedding = await _flights.ado(("embed", query), lambda: self._aembed(query))
+        return embedding
+    
+    async def _aembed(self, query: str) -> List[float]:
+        async with _embed_gate.aslot():
+            with metrics.span("query.embed"):
+                embedding = await self.embeddings.aembed_query(query)
+        self.query_embedding_cache.put(query, embedding)
+        return embedding
+    
+    def _prepare(self, wait: bool = True):
+        """Pick up index changes; wait=False (event loop) reloads the lexical index in the background"""
         if self.vectorstore is None:
             self.connect()
-        
-        # Similarity search
-        results = self.vectorstore.similarity_search(query, k=k)
-        
-        # Format results - convert all values to strings for MCP compatibility
-        formatted_results = []
-        for i, doc in enumerate(results):
-            formatted_results.append({
-                "rank": str(i + 1),
-                "content": doc.page_content,
-                "source": str(doc.metadata.get("source", "unknown")),
-                "page": str(doc.metadata.get("page", "unknown"))
-            })
-        
-        return formatted_results
+        self.lexical.refresh(wait=wait)
+        if self._cache_generation != index_generation():
+            self.invalidate_cache()
     
-    def query_with_scores(self, query: str, k: int = 5) -> List[Dict[str, str]]:
-        """Query with similarity scores
-        
+    def search_by_vector(self, embedding: List[float], k: int = 5, filter: Dict[str, Any] = None) -> List[Tuple[Document, float]]:
+        """Similarity search for a query vector, served from the result cache when possible
+
+        Concurrent misses for the same search share one vector-store call.
+        """
+        key = (embedding_key(embedding), k, freeze(filter))
+        results = self.result_cache.get(key)
+        metrics.inc("query.result_cache_hits" if results is not None else "query.result_cache_misses")
+        if results is None:
+            results = _flights.do(
+                ("search", self.partition) + key, lambda: self._search_gated(embedding, k, filter, key)
+            )
+        return results
+    
+    def _search_gated(self, embedding: List[float], k: int, filter: Dict[str, Any], key: tuple):
+        with _vector_gate.slot():
+            results = self._vector_search(embedding, k, filter)
+        self.result_cache.put(key, results)
+        return results
+    
+    def _vector_search(self, embedding: List[float], k: int, filter: Dict[str, Any]) -> List[Tuple[Document, float]]:
+        kwargs = {"filter": filter} if filter else {}
+        with metrics.span("query.vector_search"):
+            return self._remote_call(
+                lambda: self.vectorstore.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)
+            )
+    
+    def _remote_call(self, fn):
+        """Run a vector-store read under the Pinecone upstream policy (directly for the local index)"""
+        return self.remote.call(fn) if self.remote is not None else fn()
+    
+    def _degraded(self, query: str, k: int, filter: Dict[str, Any], error: UpstreamUnavailable) -> List[Tuple[Document, float]]:
+        """Lexical-only results while an upstream is unavailable; re-raises without a lexical index"""
+        if not len(self.lexical):
+            raise error
+        metrics.inc("query.degraded")
+        with metrics.span("query.lexical_search"):
+            return self.lexical.search(query, k=k, filter=filter)
+    
+    def _resolve_mode(self, query: str, mode: str = None) -> str:
+        mode = (mode or RETRIEVAL_MODE).lower()
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        if mode == "auto":
+            if not len(self.lexical):
+                return "vector"
+            return "symbol" if is_symbol_query(query) else "hybrid"
+        return mode
+    
+    def _lexical_first(self, query: str, k: int, filter: Dict[str, Any], mode: str) -> Tuple[str, Optional[List[Tuple[Document, float]]]]:
+        """Answer lexical and symbol queries from the inverted index, without an embedding call
+
+        Returns (mode, results); results is None when a vector search is still needed.
+        """
+        mode = self._resolve_mode(query, mode)
+        if mode in ("lexical", "symbol"):
+            with metrics.span("query.lexical_search"):
+                results = self.lexical.search(query, k=k, filter=filter)
+            if results or mode == "lexical":
+                metrics.inc(f"query.mode.{mode}")
+                return mode, results
+            # Unknown symbol: fall back to semantic search
+            metrics.inc("query.symbol_fallbacks")
+            mode = "vector"
+        metrics.inc(f"query.mode.{mode}")
+        return mode, None
+    
+    @staticmethod
+    def _vector_k(k: int, mode: str) -> int:
+        return max(k * HYBRID_CANDIDATES_FACTOR, 20) if mode == "hybrid" else k
+    
+    def _fuse(self, query: str, vector_results: List[Tuple[Document, float]], k: int, filter: Dict[str, Any], mode: str) -> List[Tuple[Document, float]]:
+        if mode != "hybrid":
+            return vector_results
+        with metrics.span("query.lexical_search"):
+            lexical_results = self.lexical.search(query, k=self._vector_k(k, mode), filter=filter)
+        with metrics.span("query.fuse"):
+            return reciprocal_rank_fusion([vector_results, lexical_results], k)
+    
+    @staticmethod
+    def _pool_k(k: int, diversity: float) -> int:
+        return max(k * MMR_CANDIDATES_FACTOR, 20) if diversity > 0 else k
+    
+    def diversify(
+        self, embedding: List[float], results: List[Tuple[Document, float]], k: int, diversity: float
+    ) -> List[Tuple[Document, float]]:
+        """Pick k of the candidate results by maximal marginal relevance (scores are kept)
+
+        Candidate embeddings come from the vector store by ID; candidates
+        without a stored vector are embedded again (normally an embedding
+        cache hit).
         """
+        if len(results) <= 1:
+            return results[:k]
+        with metrics.span("query.mmr"):
+            ids = [doc.id for doc, _ in results if doc.id]
+            with _vector_gate.slot():
+                stored = self._remote_call(lambda: fetch_vectors(self.vectorstore, ids))
+            missing = [doc.page_content for doc, _ in results if doc.id not in stored]
+            embedded = []
+            if missing:
+                with _embed_gate.slot():
+                    embedded = self.embeddings.embed_documents(missing)
+            embedded = iter(embedded)
+            matrix = np.array(
+                [stored[doc.id] if doc.id in stored else next(embedded) for doc, _ in results], dtype=np.float32
+            )
+            picked = maximal_marginal_relevance(np.asarray(embedding), matrix, k, diversity)
+            return [results[i] for i in picked]
+    
+    def search(
+        self, query: str, k: int = 5, filter: Dict[str, Any] = None, mode: str = None, diversity: float = 0.0
+    ) -> List[Tuple[Document, float]]:
+        """Search returning (Document, score) pairs
+
+        mode: "auto" (symbol lookups lexical-only, everything else hybrid),
+        "hybrid" (vector + BM25 fused with reciprocal rank fusion), "vector"
+        or "lexical". Defaults to RETRIEVAL_MODE. diversity > 0 fetches a
+        larger candidate pool and picks k of them with diversify().
+        """
+        self._prepare()
+        pool_k = self._pool_k(k, diversity)
+        mode, results = self._lexical_first(query, pool_k, filter, mode)
+        try:
+            if results is None:
+                vector_results = self.search_by_vector(self.embed_query(query), k=self._vector_k(pool_k, mode), filter=filter)
+                results = self._fuse(query, vector_results, pool_k, filter, mode)
+            if diversity > 0:
+                results = self.diversify(self.embed_query(query), results, k, diversity)
+        except UpstreamUnavailable as e:
+            results = self._degraded(query, k, filter, e)
+        return results
+    
+    async def asearch_by_vector(self, embedding: List[float], k: int = 5, filter: Dict[str, Any] = None) -> List[Tuple[Document, float]]:
+        """Async search_by_vector; cache hits return without leaving the event loop"""
+        key = (embedding_key(embedding), k, freeze(filter))
+        results = self.result_cache.get(key)
+        metrics.inc("query.result_cache_hits" if results is not None else "query.result_cache_misses")
+        if results is None:
+            results = await _flights.ado(
+                ("search", self.partition) + key, lambda: self._asearch_gated(embedding, k, filter, key)
+            )
+        return results
+    
+    async def _asearch_gated(self, embedding: List[float], k: int, filter: Dict[str, Any], key: tuple):
+        # Queued callers wait on the event loop, not in worker threads. The Pinecone client
+        # keeps its own urllib3 connection pool and the local index releases the GIL in numpy,
+        # so a worker thread is enough for the call itself
+        async with _vector_gate.aslot():
+            results = await asyncio.to_thread(self._vector_search, embedding, k, filter)
+        self.result_cache.put(key, results)
+        return results
+    
+    async def asearch(
+        self, query: str, k: int = 5, filter: Dict[str, Any] = None, mode: str = None, diversity: float = 0.0
+    ) -> List[Tuple[Document, float]]:
+        """Async version of search"""
         if self.vectorstore is None:
-            self.connect()
-        
-        # Similarity search with scores
-        results = self.vectorstore.similarity_search_with_score(query, k=k)
-        
-        # Format results
-        formatted_results = []
-        for i, (doc, score) in enumerate(results):
-            formatted_results.append({
-                "rank": str(i + 1),
-                "score": f"{score:.4f}",
-                "content": doc.page_content,
-                "source": str(doc.metadata.get("source", "unknown")),
-                "page": str(doc.metadata.get("page", "unknown"))
-            })
+            await asyncio.to_thread(self.connect)
+        self._prepare(wait=False)
+        pool_k = self._pool_k(k, diversity)
+        mode, results = self._lexical_first(query, pool_k, filter, mode)
+        try:
+            if results is None:
+                embedding = await self.aembed_query(query)
+                vector_results = await self.asearch_by_vector(embedding, k=self._vector_k(pool_k, mode), filter=filter)
+                results = self._fuse(query, vector_results, pool_k, filter, mode)
+            if diversity > 0:
+                # Fetching stored vectors is a network call on Pinecone
+                results = await asyncio.to_thread(self.diversify, await self.aembed_query(query), results, k, diversity)
+        except UpstreamUnavailable as e:
+            results = self._degraded(query, k, filter, e)
+        return results
+    
+    @staticmethod
+    def format_results(
+        results: List[Tuple[Document, float]],
+        with_scores: bool = False,
+        query: str = "",
+        max_tokens: int = 0,
+        snippets: bool = False,
+    ) -> List[Dict[str, str]]:
+        """Format results - convert all values to strings for MCP compatibility
+
+        Adjacent or overlapping chunks of the same page are merged into one
+        result, and the results are packed into max_tokens (QUERY_MAX_TOKENS
+        when 0), see packing.pack_results.
+        """
+        with metrics.span("query.format"):
+            return pack_results(
+                results, query=query, max_tokens=max_tokens or QUERY_MAX_TOKENS,
+                snippets=snippets, with_scores=with_scores,
+            )
+    
+    def query(
+        self, query: str, k: int = 5, mode: str = None, filter: Dict[str, Any] = None,
+        max_tokens: int = 0, snippets: bool = False, diversity: float = 0.0,
+    ) -> List[Dict[str, str]]:
+        """Query to get k most relevant chunks
+        """
+        metrics.inc("query.calls")
+        with request_deadline(QUERY_DEADLINE), metrics.span("query.total"):
+            results = self.search(query, k=k, filter=filter, mode=mode, diversity=diversity)
+            return self.format_results(results, query=query, max_tokens=max_tokens, snippets=snippets)
+    
+    def query_with_scores(
+        self, query: str, k: int = 5, mode: str = None, filter: Dict[str, Any] = None,
+        max_tokens: int = 0, snippets: bool = False, diversity: float = 0.0,
+    ) -> List[Dict[str, str]]:
+        """Query with similarity scores
         
-        return formatted_results
+        """
+        metrics.inc("query.calls")
+        with request_deadline(QUERY_DEADLINE), metrics.span("query.total"):
+            results = self.search(query, k=k, filter=filter, mode=mode, diversity=diversity)
+            return self.format_results(results, True, query, max_tokens, snippets)
+    
+    def _batch_plan(self, queries: List[str], k: int, mode: str, filter: Dict[str, Any] = None):
+        """Deduplicate queries and answer the lexical ones; returns (unique, modes, answered)"""
+        unique = list(dict.fromkeys(q for q in queries if q and q.strip()))
+        modes, answered = {}, {}
+        for q in unique:
+            modes[q], results = self._lexical_first(q, k, filter, mode)
+            if results is not None:
+                answered[q] = results
+        return unique, modes, answered
+    
+    def _cached_query_embeddings(self, queries: List[str]) -> Tuple[Dict[str, List[float]], List[str]]:
+        embeddings = {}
+        missing = []
+        for q in queries:
+            embedding = self.query_embedding_cache.get(q)
+            if embedding is None:
+                missing.append(q)
+            else:
+                embeddings[q] = embedding
+        return embeddings, missing
+    
+    def query_batch(
+        self, queries: List[str], k: int = 5, with_scores: bool = True, mode: str = None, filter: Dict[str, Any] = None,
+        max_tokens: int = 0, snippets: bool = False, diversity: float = 0.0,
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """Answer many queries in one pass, grouped per query
+
+        Identical queries are deduplicated, symbol lookups are answered
+        from the lexical index, all remaining uncached query embeddings are
+        fetched in a single embedding request, and the vector searches run
+        concurrently. max_tokens is the budget for the whole response,
+        shared evenly between the unique queries. With diversity every
+        query searches a larger pool that diversify() narrows down to k.
+        """
+        metrics.inc("query.batch_calls")
+        with request_deadline(QUERY_DEADLINE), metrics.span("query.batch_total"):
+            self._prepare()
+            pool_k = self._pool_k(k, diversity)
+            unique, modes, answered = self._batch_plan(queries, pool_k, mode, filter)
+            pending = [q for q in unique if q not in answered]
+            
+            try:
+                # MMR needs the embedding of lexical-only queries too
+                embeddings, missing = self._cached_query_embeddings(unique if diversity > 0 else pending)
+                if missing:
+                    with _embed_gate.slot(), metrics.span("query.embed"):
+                        vectors = self.embeddings.embed_documents(missing)
+                    for q, embedding in zip(missing, vectors):
+                        self.query_embedding_cache.put(q, embedding)
+                        embeddings[q] = embedding
+                
+                if pending:
+                    workers = min(QUERY_BATCH_WORKERS, len(pending))
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        results = executor.map(
+                            lambda q: self._fuse(
+                                q, self.search_by_vector(embeddings[q], k=self._vector_k(pool_k, modes[q]), filter=filter),
+                                pool_k, filter, modes[q],
+                            ),
+                            pending,
+                        )
+                        answered.update(zip(pending, results))
+                if diversity > 0:
+                    answered = {q: self.diversify(embeddings[q], answered[q], k, diversity) for q in unique}
+            except UpstreamUnavailable as e:
+                answered = self._degraded_batch(unique, answered, k, filter, diversity, e)
+            return self._format_batch(unique, answered, with_scores, max_tokens, snippets)
+    
+    def _degraded_batch(
+        self, unique: List[str], answered: Dict[str, List[Tuple[Document, float]]], k: int,
+        filter: Dict[str, Any], diversity: float, error: UpstreamUnavailable,
+    ) -> Dict[str, List[Tuple[Document, float]]]:
+        """Keep the finished answers and answer the rest lexically (see _degraded)"""
+        return {
+            q: answered[q] if q in answered and diversity <= 0 else self._degraded(q, k, filter, error)
+            for q in unique
+        }
+    
+    def _format_batch(
+        self, unique: List[str], answered: Dict[str, List[Tuple[Document, float]]],
+        with_scores: bool, max_tokens: int, snippets: bool,
+    ) -> Dict[str, List[Dict[str, str]]]:
+        budget = max_tokens or QUERY_MAX_TOKENS
+        share = max(1, budget // len(unique)) if budget and unique else 0
+        return {q: self.format_results(answered[q], with_scores, q, share, snippets) for q in unique}
+    
+    async def aquery(
+        self, query: str, k: int = 5, mode: str = None, filter: Dict[str, Any] = None,
+        max_tokens: int = 0, snippets: bool = False, diversity: float = 0.0,
+    ) -> List[Dict[str, str]]:
+        """Async version of query"""
+        metrics.inc("query.calls")
+        with request_deadline(QUERY_DEADLINE), metrics.span("query.total"):
+            results = await self.asearch(query, k=k, filter=filter, mode=mode, diversity=diversity)
+            return self.format_results(results, query=query, max_tokens=max_tokens, snippets=snippets)
+    
+    async def aquery_with_scores(
+        self, query: str, k: int = 5, mode: str = None, filter: Dict[str, Any] = None,
+        max_tokens: int = 0, snippets: bool = False, diversity: float = 0.0,
+    ) -> List[Dict[str, str]]:
+        """Async version of query_with_scores"""
+        metrics.inc("query.calls")
+        with request_deadline(QUERY_DEADLINE), metrics.span("query.total"):
+            results = await self.asearch(query, k=k, filter=filter, mode=mode, diversity=diversity)
+            return self.format_results(results, True, query, max_tokens, snippets)
+    
+    async def aquery_batch(
+        self, queries: List[str], k: int = 5, with_scores: bool = True, mode: str = None, filter: Dict[str, Any] = None,
+        max_tokens: int = 0, snippets: bool = False, diversity: float = 0.0,
+    ) -> Dict[str, List[Dict[str, str]]]:
+        """Async version of query_batch; the searches run as concurrent tasks"""
+        metrics.inc("query.batch_calls")
+        with request_deadline(QUERY_DEADLINE), metrics.span("query.batch_total"):
+            if self.vectorstore is None:
+                await asyncio.to_thread(self.connect)
+            self._prepare(wait=False)
+            pool_k = self._pool_k(k, diversity)
+            unique, modes, answered = self._batch_plan(queries, pool_k, mode, filter)
+            pending = [q for q in unique if q not in answered]
+            
+            semaphore = asyncio.Semaphore(QUERY_BATCH_WORKERS)
+            
+            async def run(q: str):
+                async with semaphore:
+                    vector_results = await self.asearch_by_vector(
+                        embeddings[q], k=self._vector_k(pool_k, modes[q]), filter=filter
+                    )
+                return self._fuse(q, vector_results, pool_k, filter, modes[q])
+            
+            try:
+                embeddings, missing = self._cached_query_embeddings(unique if diversity > 0 else pending)
+                if missing:
+                    async with _embed_gate.aslot():
+                        with metrics.span("query.embed"):
+                            vectors = await self.embeddings.aembed_documents(missing)
+                    for q, embedding in zip(missing, vectors):
+                        self.query_embedding_cache.put(q, embedding)
+                        embeddings[q] = embedding
+                
+                results = await asyncio.gather(*(run(q) for q in pending))
+                answered.update(zip(pending, results))
+                if diversity > 0:
+                    diversified = await asyncio.gather(*(
+                        asyncio.to_thread(self.diversify, embeddings[q], answered[q], k, diversity) for q in unique
+                    ))
+                    answered = dict(zip(unique, diversified))
+            except UpstreamUnavailable as e:
+                answered = self._degraded_batch(unique, answered, k, filter, diversity, e)
+            return self._format_batch(unique, answered, with_scores, max_tokens, snippets)
     
     def get_db_info(self) -> Dict[str, str]:
         """Get database information
@@ -96,24 +525,44 @@ class DocumentRetriever:
             if self.vectorstore is None:
                 self.connect()
             
-            return {
+            info = {
                 "status": "exists",
                 "index_name": self.index_name,
-                "message": "Connected to Pinecone index"
+                "namespace": self.namespace or "(default)",
+                "backend": VECTOR_STORE_BACKEND,
+                "retrieval_mode": RETRIEVAL_MODE,
+                "lexical_chunks": str(len(self.lexical)),
+                "message": f"Connected to {VECTOR_STORE_BACKEND} index"
             }
+            cache = get_embedding_cache()
+            if cache is not None:
+                for key, value in cache.stats().items():
+                    info[f"embedding_cache_{key}"] = value
+            for key, value in self.query_embedding_cache.stats().items():
+                info[f"query_embedding_cache_{key}"] = value
+            for key, value in self.result_cache.stats().items():
+                info[f"result_cache_{key}"] = value
+            try:
+                for key, value in index_stats(self.vectorstore).items():
+                    info[f"index_{key}"] = value
+            except Exception as e:
+                info["index_stats_error"] = str(e)
+            return info
         except Exception as e:
             return {"status": "error", "message": str(e)}
 
 
-# Singleton instance
-_retriever = None
+# One instance per namespace
+_retrievers: Dict[str, DocumentRetriever] = {}
+_retriever_lock = threading.Lock()
 
-def get_retriever() -> DocumentRetriever:
-    """Get or create retriever instance"""
-    global _retriever
-    if _retriever is None:
-        _retriever = DocumentRetriever()
-    return _retriever
+def get_retriever(namespace: str = None) -> DocumentRetriever:
+    """Get or create the retriever for a namespace (default: VECTOR_NAMESPACE)"""
+    namespace = namespace or VECTOR_NAMESPACE
+    with _retriever_lock:
+        if namespace not in _retrievers:
+            _retrievers[namespace] = DocumentRetriever(namespace=namespace)
+    return _retrievers[namespace]
 
 
 if __name__ == "__main__":
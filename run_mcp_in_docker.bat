@@ -1,6 +1,11 @@
 @echo off
 REM run_mcp_in_docker.bat - Wrapper script to run MCP server in Docker with stdio
+REM Prebuilt snapshots (python snapshot.py export) are served read-only with VECTOR_STORE_BACKEND=snapshot
+set SNAPSHOT_ARGS=
+if exist "%~dp0snapshots\" set SNAPSHOT_ARGS=-v "%~dp0snapshots:/app/snapshots:ro"
+
 docker run --rm -i ^
   --env-file "%~dp0.env" ^
+  %SNAPSHOT_ARGS% ^
   rag-mcp-server:latest ^
   python -u /app/main.py
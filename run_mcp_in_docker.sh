@@ -2,7 +2,14 @@
 # run_mcp_in_docker.sh - Wrapper script to run MCP server in Docker with stdio (Linux/macOS)
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
+# Prebuilt snapshots (python snapshot.py export) are served read-only with VECTOR_STORE_BACKEND=snapshot
+SNAPSHOT_ARGS=()
+if [ -d "${SCRIPT_DIR}/snapshots" ]; then
+  SNAPSHOT_ARGS=(-v "${SCRIPT_DIR}/snapshots:/app/snapshots:ro")
+fi
+
 docker run --rm -i \
   --env-file "${SCRIPT_DIR}/.env" \
+  "${SNAPSHOT_ARGS[@]}" \
   rag-mcp-server:latest \
   python -u /app/main.py
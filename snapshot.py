@@ -0,0 +1,542 @@
+# snapshot.py - Export/import the knowledge base as a compact, versioned, memory-mappable snapshot file
+#
+#   python snapshot.py export                      # -> snapshots/<index>[.<namespace>].ragsnap
+#   python snapshot.py import snapshots/x.ragsnap  # -> VECTOR_STORE_BACKEND (pinecone, local or snapshot)
+#   python snapshot.py info snapshots/x.ragsnap
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from embedding_cache import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL, make_embeddings
+from lexical_index import LexicalIndex, get_lexical_index, lexical_index_path
+from manifest import BuildManifest
+from vectorstore import (
+    VECTOR_NAMESPACE, VECTOR_STORE_BACKEND, condition_holds, finalize_vector_store, get_vector_store, iter_records,
+    partition_name, upsert_vectors,
+)
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "rag-mcp-server")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Snapshots are <partition>.ragsnap files in this folder (the snapshot backend serves them from here)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(SCRIPT_DIR, "snapshots"))
+# Parallel upsert requests when importing into Pinecone
+SNAPSHOT_IMPORT_WORKERS = int(os.getenv("SNAPSHOT_IMPORT_WORKERS", "8"))
+# Records per export fetch / Pinecone upsert, and per local-index write
+REMOTE_BATCH = 100
+LOCAL_BATCH = 8192
+
+# File layout (little-endian): a fixed preamble, 64-byte aligned raw sections, then a JSON
+# header listing every section's offset, dtype and shape. Strings are stored as a uint64
+# array of end offsets plus one UTF-8 blob, so row i is data[ends[i-1]:ends[i]].
+SNAPSHOT_MAGIC = b"RAGSNAP\0"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".ragsnap"
+_PREAMBLE = struct.Struct("<8sIIQQ")  # magic, version, flags, header offset, header length
+ALIGN = 64
+
+
+def snapshot_path(partition: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{partition}{SNAPSHOT_SUFFIX}")
+
+
+class SnapshotWriter:
+    """Streams sections into a new snapshot; the file appears atomically on close()
+
+    Sections may be appended to in any order (each is spooled to its own
+    temporary file), so an export never holds the whole index in memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(self._dir, exist_ok=True)
+        # name -> [spool file, dtype, row shape, rows]
+        self._parts: Dict[str, list] = {}
+        self._string_ends: Dict[str, int] = {}
+
+    def append(self, name: str, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        part = self._parts.get(name)
+        if part is None:
+            part = self._parts[name] = [tempfile.TemporaryFile(dir=self._dir), array.dtype.str, list(array.shape[1:]), 0]
+        elif part[1] != array.dtype.str or part[2] != list(array.shape[1:]):
+            raise ValueError(f"Snapshot section '{name}' changed dtype or shape")
+        part[0].write(array.tobytes())
+        part[3] += len(array)
+
+    def append_strings(self, name: str, strings: List[str]):
+        data = [s.encode("utf-8") for s in strings]
+        ends = self._string_ends.get(name, 0) + np.cumsum([len(d) for d in data], dtype=np.uint64)
+        if len(ends):
+            self._string_ends[name] = int(ends[-1])
+        self.append(f"{name}.ends", ends.astype(np.uint64))
+        self.append(f"{name}.data", np.frombuffer(b"".join(data), dtype=np.uint8))
+
+    def append_bytes(self, name: str, data: bytes):
+        self.append(name, np.frombuffer(data, dtype=np.uint8))
+
+    def close(self, header: Dict[str, Any]):
+        """Assemble the sections and header into the final file"""
+        tmp_path = self.path + ".tmp"
+        sections = {}
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(b"\0" * _PREAMBLE.size)
+                for name, (spool, dtype, shape, rows) in self._parts.items():
+                    f.write(b"\0" * (-f.tell() % ALIGN))
+                    sections[name] = {"offset": f.tell(), "dtype": dtype, "shape": [rows] + shape}
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, f, 16 * 2**20)
+                encoded = json.dumps({**header, "sections": sections}, ensure_ascii=False).encode("utf-8")
+                header_offset = f.tell()
+                f.write(encoded)
+                f.seek(0)
+                f.write(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, header_offset, len(encoded)))
+            os.replace(tmp_path, self.path)
+        finally:
+            self.abort()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def abort(self):
+        for spool, _, _, _ in self._parts.values():
+            spool.close()
+        self._parts = {}
+
+
+class Snapshot:
+    """Read-only view of a snapshot file
+
+    Opening reads the preamble and the JSON header only; every section is
+    a numpy view of one memory map of the file, so nothing is parsed or
+    copied until rows are actually used.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise ValueError(f"{path} is not a knowledge base snapshot")
+            magic, version, _, header_offset, header_length = _PREAMBLE.unpack(preamble)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path} is not a knowledge base snapshot")
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(f"{path} has snapshot format version {version}, expected {SNAPSHOT_VERSION}")
+            f.seek(header_offset)
+            self.header = json.loads(f.read(header_length).decode("utf-8"))
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        self.sections = {
+            name: np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=self._map, offset=spec["offset"])
+            for name, spec in self.header["sections"].items()
+        }
+        self.count = int(self.header["count"])
+        self.dimension = int(self.header["dimension"])
+        self.vectors = self.sections.get("vectors", np.zeros((0, self.dimension), dtype=np.float32))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def string(self, name: str, row: int) -> str:
+        ends, data = self.sections[f"{name}.ends"], self.sections[f"{name}.data"]
+        start = int(ends[row - 1]) if row else 0
+        return data[start:int(ends[row])].tobytes().decode("utf-8")
+
+    def strings(self, name: str, start: int = 0, stop: int = None) -> List[str]:
+        """Rows start..stop of a string column, decoded in one pass"""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return []
+        ends, data = self.sections[f"{name}.ends"], self.sections[f"{name}.data"]
+        base = int(ends[start - 1]) if start else 0
+        blob = data[base:int(ends[stop - 1])].tobytes()
+        bounds = [0] + (ends[start:stop].astype(np.int64) - base).tolist()
+        return [blob[bounds[i]:bounds[i + 1]].decode("utf-8") for i in range(stop - start)]
+
+    def metadata(self, row: int) -> dict:
+        return json.loads(self.string("metadata", row))
+
+    def blob(self, name: str) -> Optional[bytes]:
+        section = self.sections.get(name)
+        return None if section is None else section.tobytes()
+
+    def iter_records(self, batch_size: int = LOCAL_BATCH) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[dict]]]:
+        for start in range(0, self.count, batch_size):
+            stop = min(start + batch_size, self.count)
+            yield (
+                self.strings("ids", start, stop),
+                np.asarray(self.vectors[start:stop]),
+                self.strings("texts", start, stop),
+                [json.loads(m) for m in self.strings("metadata", start, stop)],
+            )
+
+    def info(self) -> Dict[str, str]:
+        info = {key: str(value) for key, value in self.header.items() if key != "sections"}
+        info["file_mb"] = f"{os.path.getsize(self.path) / 2**20:.1f}"
+        return info
+
+
+class SnapshotVectorStore(VectorStore):
+    """Read-only vector store served straight from a snapshot file
+
+    Search is exact: one matrix-vector product over the memory-mapped,
+    unit-length vectors, so scores are cosine similarities like the other
+    backends. ID lookups and per-field metadata columns for filters are
+    built on first use. Writes are refused; import the snapshot into a
+    local or Pinecone index to change it.
+    """
+
+    def __init__(self, path: str, embedding: Optional[Embeddings] = None):
+        self.snapshot = Snapshot(path)
+        self._embedding = embedding
+        self.dim = self.snapshot.dimension
+        self._lock = threading.Lock()
+        self._rows_by_id: Optional[Dict[str, int]] = None
+        # field -> (row codes, values); code -1 = missing or not filterable
+        self._columns: Dict[str, Tuple[np.ndarray, list]] = {}
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding
+
+    def __len__(self) -> int:
+        return len(self.snapshot)
+
+    def stats(self) -> Dict[str, str]:
+        """Vector count, dimension and snapshot details (values are strings for MCP)"""
+        return {
+            "vectors": str(len(self.snapshot)),
+            "dimension": str(self.dim),
+            "namespaces": "none",
+            "snapshot": os.path.basename(self.snapshot.path),
+            "snapshot_created_at": str(self.snapshot.header.get("created_at", "unknown")),
+            "snapshot_file_mb": f"{os.path.getsize(self.snapshot.path) / 2**20:.1f}",
+        }
+
+    def _read_only(self, *args, **kwargs):
+        raise ValueError(
+            "The snapshot backend is read-only; import the snapshot into a local or Pinecone index to write"
+        )
+
+    add_vectors = _read_only
+    delete = _read_only
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+        self._read_only()
+
+    def _row_ids(self) -> Dict[str, int]:
+        with self._lock:
+            if self._rows_by_id is None:
+                self._rows_by_id = {doc_id: row for row, doc_id in enumerate(self.snapshot.strings("ids"))}
+            return self._rows_by_id
+
+    def _column(self, field: str) -> Tuple[np.ndarray, list]:
+        with self._lock:
+            if field not in self._columns:
+                values, lookup = [], {}
+                codes = np.full(len(self.snapshot), -1, dtype=np.int32)
+                for row, metadata in enumerate(self.snapshot.strings("metadata")):
+                    value = json.loads(metadata).get(field)
+                    if isinstance(value, (str, int, float)):
+                        code = lookup.get(value)
+                        if code is None:
+                            code = lookup[value] = len(values)
+                            values.append(value)
+                        codes[row] = code
+                self._columns[field] = (codes, values)
+            return self._columns[field]
+
+    def _filter_rows(self, filter: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self.snapshot), dtype=bool)
+        for field, condition in filter.items():
+            codes, values = self._column(field)
+            matching = [code for code, value in enumerate(values) if condition_holds(value, condition)]
+            mask &= np.isin(codes, matching)
+        return np.flatnonzero(mask)
+
+    def _document(self, row: int) -> Document:
+        return Document(
+            id=self.snapshot.string("ids", row),
+            page_content=self.snapshot.string("texts", row),
+            metadata=self.snapshot.metadata(row),
+        )
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        if not len(self.snapshot) or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        filter = kwargs.get("filter")
+        rows = self._filter_rows(filter) if filter else None
+        scores = np.asarray(self.snapshot.vectors if rows is None else self.snapshot.vectors[rows]) @ query
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        hits = top if rows is None else rows[top]
+        return [(self._document(int(row)), float(scores[t])) for row, t in zip(hits, top)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        if self._embedding is None:
+            raise ValueError("SnapshotVectorStore needs an embedding model to search by text")
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        rows = self._row_ids()
+        return [self._document(rows[doc_id]) for doc_id in ids if doc_id in rows]
+
+    def get_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored (unit-length) vectors by ID; unknown IDs are left out"""
+        rows = self._row_ids()
+        return {doc_id: np.asarray(self.snapshot.vectors[rows[doc_id]]) for doc_id in ids if doc_id in rows}
+
+    def iter_records(self, batch_size: int = LOCAL_BATCH):
+        return self.snapshot.iter_records(batch_size)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs) -> "SnapshotVectorStore":
+        raise ValueError("Snapshots are created with `python snapshot.py export`")
+
+
+def check_embedding_model(snapshot: Snapshot):
+    """Refuse snapshots whose vectors the configured embedding model cannot query"""
+    model = snapshot.header.get("embedding_model")
+    if model and model != EMBEDDING_MODEL:
+        raise ValueError(f"{snapshot.path} was embedded with {model}, but this server uses {EMBEDDING_MODEL}")
+    if EMBEDDING_DIMENSIONS and snapshot.dimension != EMBEDDING_DIMENSIONS:
+        raise ValueError(
+            f"{snapshot.path} has {snapshot.dimension}-dimensional vectors, but EMBEDDING_DIMENSIONS={EMBEDDING_DIMENSIONS}"
+        )
+
+
+def install_lexical_index(snapshot: Snapshot, partition: str) -> bool:
+    """Write the snapshot's BM25 index for the partition unless an index at least as new exists"""
+    path = lexical_index_path(partition)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(snapshot.path):
+        return False
+    data = snapshot.blob("lexical")
+    if data is None:
+        return False
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    # Changes logged against the replaced index do not apply to the snapshot's
+    if os.path.exists(path + ".delta"):
+        os.remove(path + ".delta")
+    return True
+
+
+def open_snapshot_store(partition: str, embedding: Optional[Embeddings] = None) -> SnapshotVectorStore:
+    """Vector store for the snapshot backend: SNAPSHOT_DIR/<partition>.ragsnap plus its BM25 index"""
+    path = snapshot_path(partition)
+    if not os.path.exists(path):
+        raise ValueError(f"No snapshot for '{partition}' at {path}; run `python snapshot.py import <file>` first")
+    store = SnapshotVectorStore(path, embedding)
+    check_embedding_model(store.snapshot)
+    install_lexical_index(store.snapshot, partition)
+    return store
+
+
+def _lexical_bytes(partition: str, records: List[Tuple[List[str], List[str], List[dict]]]) -> bytes:
+    """The partition's saved BM25 index, or one built from the exported records if there is none"""
+    path = lexical_index_path(partition)
+    if os.path.exists(path):
+        # Fold pending notes from the delta log into the .npz first
+        index = get_lexical_index(partition)
+        index.refresh()
+        index.merge()
+        with open(path, "rb") as f:
+            return f.read()
+    with tempfile.TemporaryDirectory() as tmp:
+        index = LexicalIndex(os.path.join(tmp, "lexical.npz"))
+        for ids, texts, metadatas in records:
+            index.add(ids, texts, metadatas)
+        index.merge()
+        with open(index.path, "rb") as f:
+            return f.read()
+
+
+def _open_index(index_name: str, namespace: Optional[str], backend: str = None) -> VectorStore:
+    from builder import check_api_keys
+    check_api_keys()
+    return get_vector_store(index_name, make_embeddings(OPENAI_API_KEY), backend=backend, namespace=namespace)
+
+
+def export_snapshot(
+    index_name: str = PINECONE_INDEX_NAME, namespace: str = VECTOR_NAMESPACE, path: str = None, backend: str = None
+) -> Dict[str, str]:
+    """Write every record of one index partition (plus its BM25 index and build manifest) to a snapshot"""
+    backend = (backend or VECTOR_STORE_BACKEND).lower()
+    namespace = namespace or None
+    partition = partition_name(index_name, namespace)
+    path = path or snapshot_path(partition)
+    vectorstore = _open_index(index_name, namespace, backend)
+    start = time.perf_counter()
+
+    writer = SnapshotWriter(path)
+    count, dimension = 0, None
+    # Without a saved BM25 index one is rebuilt from these (texts only, no vectors)
+    lexical_missing = not os.path.exists(lexical_index_path(partition))
+    records = []
+    try:
+        for ids, vectors, texts, metadatas in iter_records(vectorstore, REMOTE_BATCH if backend == "pinecone" else LOCAL_BATCH):
+            if not ids:
+                continue
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            writer.append("vectors", (vectors / np.where(norms == 0, 1.0, norms)).astype(np.float32))
+            writer.append_strings("ids", ids)
+            writer.append_strings("texts", texts)
+            writer.append_strings("metadata", [json.dumps(m, ensure_ascii=False) for m in metadatas])
+            if lexical_missing:
+                records.append((ids, texts, metadatas))
+            count += len(ids)
+            dimension = vectors.shape[1]
+            print(f"Exported {count} vectors", end="\r", flush=True)
+        if not count:
+            raise ValueError(f"Index '{partition}' is empty, nothing to export")
+
+        writer.append_bytes("lexical", _lexical_bytes(partition, records))
+        manifest = BuildManifest(partition)
+        if os.path.exists(manifest.path):
+            with open(manifest.path, "rb") as f:
+                writer.append_bytes("manifest", f.read())
+        writer.close({
+            "index_name": index_name,
+            "namespace": namespace or "",
+            "count": count,
+            "dimension": dimension,
+            "embedding_model": EMBEDDING_MODEL,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "source_backend": backend,
+        })
+    except BaseException:
+        writer.abort()
+        raise
+
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(path) / 2**20
+    print(f"Exported {count} vectors ({dimension} dimensions) to {path}: {size_mb:.1f} MB in {elapsed:.1f}s")
+    return {"status": "success", "path": path, "vectors": str(count), "file_mb": f"{size_mb:.1f}"}
+
+
+def import_snapshot(
+    path: str, index_name: str = PINECONE_INDEX_NAME, namespace: str = VECTOR_NAMESPACE, backend: str = None,
+    workers: int = SNAPSHOT_IMPORT_WORKERS,
+) -> Dict[str, str]:
+    """Load a snapshot into an index partition, with its BM25 index and build manifest
+
+    backend "snapshot" just places the file where the snapshot backend
+    serves it from; "pinecone" runs `workers` parallel bulk upserts;
+    "local" writes the local index in large batches.
+    """
+    backend = (backend or VECTOR_STORE_BACKEND).lower()
+    namespace = namespace or None
+    partition = partition_name(index_name, namespace)
+    snapshot = Snapshot(path)
+    check_embedding_model(snapshot)
+    start = time.perf_counter()
+
+    if backend == "snapshot":
+        target = snapshot_path(partition)
+        if os.path.abspath(target) != os.path.abspath(path):
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            shutil.copyfile(path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+        snapshot = Snapshot(target)
+    else:
+        vectorstore = _open_index(index_name, namespace, backend)
+        batch_size = REMOTE_BATCH if backend == "pinecone" else LOCAL_BATCH
+        done = 0
+
+        def upsert(batch):
+            ids, vectors, texts, metadatas = batch
+            if backend == "pinecone":
+                vectors = vectors.tolist()
+            upsert_vectors(vectorstore, ids, vectors, texts, metadatas, batch_size=batch_size, resilient=True)
+            return len(ids)
+
+        # The local index serialises writes itself; parallel requests only pay off remotely
+        with ThreadPoolExecutor(max_workers=max(1, workers) if backend == "pinecone" else 1) as executor:
+            for written in executor.map(upsert, snapshot.iter_records(batch_size)):
+                done += written
+                print(f"Imported {done}/{len(snapshot)} vectors", end="\r", flush=True)
+        finalize_vector_store(vectorstore)
+
+    # Newer than the snapshot file, so the copy is always taken over
+    lexical_path = lexical_index_path(partition)
+    for stale in (lexical_path, lexical_path + ".delta"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    install_lexical_index(snapshot, partition)
+    get_lexical_index(partition).refresh()
+    manifest = snapshot.blob("manifest")
+    if manifest is not None:
+        manifest_path = BuildManifest(partition).path
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        with open(manifest_path, "wb") as f:
+            f.write(manifest)
+
+    elapsed = time.perf_counter() - start
+    print(f"Imported {len(snapshot)} vectors into {backend} index '{partition}' in {elapsed:.1f}s")
+    return {"status": "success", "backend": backend, "partition": partition, "vectors": str(len(snapshot))}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export or import a knowledge base snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write the index (vectors, text, metadata, BM25 index) to a snapshot")
+    export_parser.add_argument("--output", help=f"Snapshot file (default: {SNAPSHOT_DIR}/<index>[.<namespace>]{SNAPSHOT_SUFFIX})")
+    import_parser = commands.add_parser("import", help="Load a snapshot into the configured backend")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--workers", type=int, default=SNAPSHOT_IMPORT_WORKERS,
+                               help="Parallel upsert requests (Pinecone)")
+    for sub in (export_parser, import_parser):
+        sub.add_argument("--index", default=PINECONE_INDEX_NAME)
+        sub.add_argument("--namespace", default=VECTOR_NAMESPACE,
+                         help="Namespace to export from / import into (default: VECTOR_NAMESPACE)")
+        sub.add_argument("--backend", choices=("pinecone", "local", "snapshot"),
+                         help="Default: VECTOR_STORE_BACKEND")
+    info_parser = commands.add_parser("info", help="Print a snapshot's header")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_snapshot(args.index, args.namespace, args.output, args.backend)
+    elif args.command == "import":
+        import_snapshot(args.path, args.index, args.namespace, args.backend, args.workers)
+    else:
+        for key, value in Snapshot(args.path).info().items():
+            print(f"{key}: {value}")
@@ -0,0 +1,40 @@
+# conftest.py - Shared fixtures: offline settings and the fake OpenAI/Pinecone server
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level settings are read at import: keep every cache and index out of the checkout
+_TMP = tempfile.mkdtemp(prefix="ragmcp-tests-")
+os.environ.update(
+    OPENAI_API_KEY="test",
+    PINECONE_API_KEY="test",
+    EMBEDDING_CACHE_PATH="",
+    DEDUP_INDEX_PATH="",
+    OCR_CACHE_PATH="",
+    LEXICAL_INDEX_DIR=os.path.join(_TMP, "lexical"),
+    LOCAL_INDEX_DIR=os.path.join(_TMP, "local_index"),
+    BUILD_MANIFEST_DIR=os.path.join(_TMP, "manifests"),
+    SNAPSHOT_DIR=os.path.join(_TMP, "snapshots"),
+)
+
+FAKE_DIMENSIONS = 64
+
+
+@pytest.fixture
+def fake_server():
+    """A fresh fake server per test (faults are set through server.state)"""
+    from fake_server import start_fake_server
+
+    server = start_fake_server(dimensions=FAKE_DIMENSIONS)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fake_url(fake_server) -> str:
+    return f"http://127.0.0.1:{fake_server.server_port}"
@@ -0,0 +1,92 @@
+# test_ingest_engine.py - IngestEngine against the fake server: 429/Retry-After backoff and retries
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+from conftest import FAKE_DIMENSIONS
+from embedding_cache import make_embeddings
+from ingest_engine import AdaptiveLimiter, IngestEngine
+
+
+class Done:
+    def __init__(self, path: str):
+        self.path = path
+
+
+def chunks(n: int, source: str = "doc.txt"):
+    for i in range(n):
+        yield Document(id=f"{source}-{i}", page_content=f"MsgSendv chunk {i}", metadata={"source": source, "tokens": 10})
+    yield Done(source)
+
+
+def embeddings(fake_url: str):
+    # The engine does the retrying; tiktoken's BPE file is not available offline
+    return make_embeddings(
+        "test", dimensions=FAKE_DIMENSIONS, max_retries=0, base_url=f"{fake_url}/v1", check_embedding_ctx_length=False
+    )
+
+
+def run_engine(fake_url: str, n: int, **kwargs):
+    written = {}
+
+    def upsert(ids, vectors, texts, metadatas):
+        written.update(zip(ids, vectors))
+
+    engine = IngestEngine(embed=embeddings(fake_url).aembed_documents, upsert=upsert, **kwargs)
+    out = list(engine.run(chunks(n)))
+    return engine, out, written
+
+
+def test_engine_embeds_every_chunk_in_token_sized_batches(fake_url):
+    engine, out, written = run_engine(fake_url, 20, batch_tokens=40)
+    assert len(written) == 20
+    assert all(len(v) == FAKE_DIMENSIONS for v in written.values())
+    assert engine.stats.embed_requests == 5
+    # The file marker comes after the last batch of its chunks
+    assert isinstance(out[-1], Done)
+    assert sum(len(item[0]) for item in out[:-1]) == 20
+
+
+def test_engine_waits_for_retry_after_on_429(fake_server, fake_url):
+    fake_server.state.configure({"rate_limit_every": 2, "retry_after": 1})
+    # Request #1 goes through, so the engine's first request (#2) is rate limited
+    embeddings(fake_url).embed_documents(["warm up"])
+    start = time.perf_counter()
+    engine, _, written = run_engine(fake_url, 4, batch_tokens=1000)
+    elapsed = time.perf_counter() - start
+    assert len(written) == 4
+    assert engine.stats.rate_limited == 1
+    assert engine.stats.retries == 1
+    assert engine.stats.embed_requests == 1
+    # Retry-After is honoured with +-50% jitter
+    assert 0.5 <= elapsed < 2.5
+
+
+def test_engine_retry_counts_match_injected_faults(fake_server, fake_url):
+    fake_server.state.random.seed(7)
+    fake_server.state.configure({"rate_limit_every": 5, "retry_after": 0.1})
+    fake_server.state.configure({"error_rate": 0.2})
+    engine, _, written = run_engine(fake_url, 30, batch_tokens=20, max_retries=8)
+    assert len(written) == 30
+    assert engine.stats.rate_limited == fake_server.state.rate_limited > 0
+    assert engine.stats.retries == fake_server.state.rate_limited + fake_server.state.faults
+    assert engine.stats.embed_requests == 15
+
+
+def test_engine_gives_up_after_max_retries(fake_server, fake_url):
+    fake_server.state.configure({"down": True})
+    with pytest.raises(Exception) as info:
+        run_engine(fake_url, 2, max_retries=1)
+    assert getattr(info.value, "status_code", None) == 503
+    assert fake_server.state.faults == 2
+
+
+def test_limiter_halves_on_429_and_grows_back():
+    limiter = AdaptiveLimiter("embed", 8)
+    limiter.on_rate_limit(retry_after=None)
+    limiter.on_rate_limit(retry_after=None)
+    assert limiter.limit == 2
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter.limit == 3
@@ -0,0 +1,146 @@
+# test_resilience.py - Upstream policy against the fake server: retries, Retry-After, hedging, breaker, saturation
+import itertools
+import time
+
+import pytest
+
+from conftest import FAKE_DIMENSIONS
+from embedding_cache import make_embeddings
+from metrics import metrics
+from resilience import CircuitBreaker, Upstream, UpstreamUnavailable
+
+
+def client(fake_url: str):
+    # The policy does the retrying; tiktoken's BPE file is not available offline
+    return make_embeddings(
+        "test", dimensions=FAKE_DIMENSIONS, max_retries=0, base_url=f"{fake_url}/v1", check_embedding_ctx_length=False
+    )
+
+
+def upstream(name: str, **kwargs) -> Upstream:
+    kwargs.setdefault("hedge", False)
+    kwargs.setdefault("breaker", CircuitBreaker(name, failures=100))
+    return Upstream(name, **kwargs)
+
+
+def counter(name: str) -> float:
+    return metrics.counters.get(name, 0)
+
+
+def test_retry_counts_match_injected_faults(fake_server, fake_url, monkeypatch):
+    monkeypatch.setattr("resilience.RETRY_BASE_DELAY", 0.01)
+    fake_server.state.random.seed(3)
+    fake_server.state.configure({"error_rate": 0.3})
+    policy = upstream("test-retries", max_retries=8)
+    embeddings = client(fake_url)
+    for i in range(20):
+        assert len(policy.call(lambda: embeddings.embed_query(f"query {i}"))) == FAKE_DIMENSIONS
+    assert fake_server.state.faults > 0
+    assert counter("upstream.test-retries.retries") == fake_server.state.faults
+    assert counter("upstream.test-retries.failures") == fake_server.state.faults
+
+
+def test_retry_waits_for_retry_after(fake_server, fake_url):
+    fake_server.state.configure({"rate_limit_every": 2, "retry_after": 1})
+    embeddings = client(fake_url)
+    # Request #1 goes through, so the policy's first attempt (#2) is rate limited
+    embeddings.embed_query("warm up")
+    policy = upstream("test-retry-after")
+    start = time.perf_counter()
+    policy.call(lambda: embeddings.embed_query("query"))
+    elapsed = time.perf_counter() - start
+    assert fake_server.state.rate_limited == 1
+    assert counter("upstream.test-retry-after.retries") == 1
+    # Retry-After (not the 0.2s backoff) is honoured with +-50% jitter
+    assert 0.5 <= elapsed < 2.5
+
+
+def test_hedge_fires_after_p95_delay(fake_server, fake_url):
+    fake_server.state.configure({"latency": 0.01})
+    policy = upstream("test-hedge", hedge=True)
+    embeddings = client(fake_url)
+    for i in range(20):
+        policy.call(lambda: embeddings.embed_query(f"warm up {i}"))
+    delay = policy.hedge_delay()
+    assert delay is not None and delay < 0.5
+
+    # The first attempt stalls before reaching the server; the duplicate answers
+    attempts = itertools.count()
+    started = []
+
+    def stalled_once():
+        started.append(time.perf_counter())
+        if next(attempts) == 0:
+            time.sleep(1.0)
+        return embeddings.embed_query("query")
+
+    start = time.perf_counter()
+    assert len(policy.call(stalled_once)) == FAKE_DIMENSIONS
+    elapsed = time.perf_counter() - start
+    assert len(started) == 2
+    assert started[1] - start >= delay
+    assert elapsed < 1.0
+    assert counter("upstream.test-hedge.hedges") == 1
+    assert counter("upstream.test-hedge.hedge_wins") == 1
+
+
+def test_breaker_opens_and_lets_one_trial_through_after_cooldown(fake_server, fake_url):
+    policy = upstream("test-breaker", max_retries=0, breaker=CircuitBreaker("test-breaker", failures=3, cooldown=0.3))
+    embeddings = client(fake_url)
+    fake_server.state.configure({"down": True})
+    for _ in range(3):
+        with pytest.raises(UpstreamUnavailable):
+            policy.call(lambda: embeddings.embed_query("query"))
+    assert policy.breaker.state == "open"
+    assert fake_server.state.faults == 3
+
+    # Open: fails fast without reaching the server
+    with pytest.raises(UpstreamUnavailable, match="circuit open"):
+        policy.call(lambda: embeddings.embed_query("query"))
+    assert fake_server.state.faults == 3
+    assert counter("upstream.test-breaker.short_circuited") == 1
+
+    # After the cooldown one trial goes through; its failure re-opens the breaker
+    time.sleep(0.3)
+    with pytest.raises(UpstreamUnavailable):
+        policy.call(lambda: embeddings.embed_query("query"))
+    assert fake_server.state.faults == 4
+    assert policy.breaker.state == "open"
+
+    # A successful trial closes it again
+    fake_server.state.configure({"down": False})
+    time.sleep(0.3)
+    assert len(policy.call(lambda: embeddings.embed_query("query"))) == FAKE_DIMENSIONS
+    assert policy.breaker.state == "closed"
+
+
+def test_calls_fail_fast_while_abandoned_attempts_hold_workers(fake_server, fake_url):
+    fake_server.state.configure({"latency": 0.5})
+    policy = upstream("test-saturated", timeout=0.1, max_retries=0, max_running=2)
+    embeddings = client(fake_url)
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailable, match="timed out"):
+            policy.call(lambda: embeddings.embed_query("query"))
+    assert policy.running == 2
+
+    start = time.perf_counter()
+    with pytest.raises(UpstreamUnavailable, match="still running"):
+        policy.call(lambda: embeddings.embed_query("query"))
+    assert time.perf_counter() - start < 0.05
+    assert counter("upstream.test-saturated.saturated") == 1
+
+    # Once the abandoned attempts finish, calls go through again
+    deadline = time.monotonic() + 5
+    while policy.running and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # The rejected call never reached the server
+    assert fake_server.state.requests == 2
+    fake_server.state.configure({"latency": 0})
+    assert len(policy.call(lambda: embeddings.embed_query("query"))) == FAKE_DIMENSIONS
+
+
+def test_resilient_embeddings_pass_the_attempt_timeout_to_the_client(fake_url):
+    embeddings = make_embeddings("test", resilient=True, base_url=f"{fake_url}/v1")
+    openai = embeddings.embeddings.embeddings
+    assert openai.request_timeout == embeddings.upstream.timeout
+    assert openai.max_retries == 0
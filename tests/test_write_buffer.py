@@ -0,0 +1,124 @@
+# test_write_buffer.py - Write-behind buffer: background retries, duplicate checks, flush on shutdown
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+from langchain_core.documents import Document
+
+from write_buffer import WriteBuffer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Queues one note through the production setup (resilient embeddings, "openai" upstream policy)
+# and exits without flushing, leaving the write to the atexit handler
+QUEUE_AND_EXIT = textwrap.dedent("""
+    import asyncio
+    from builder import get_builder
+    from embedding_cache import ResilientEmbeddings
+    from fake_server import DeterministicEmbeddings
+    from resilience import get_upstream
+    from write_buffer import get_write_buffer
+
+    get_builder().embeddings = ResilientEmbeddings(DeterministicEmbeddings(64), get_upstream("openai"))
+    print(asyncio.run(get_write_buffer().add("A note queued just before shutdown", "shutdown_note"))["status"])
+""")
+
+COUNT_VECTORS = "from builder import get_builder; print(len(get_builder().connect()))"
+
+
+class StubBuilder:
+    """The part of DocumentBuilder the buffer uses; the first `failures` upserts fail"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.upserts = 0
+        self.written = {}
+        self.saved = []
+
+    def note_fingerprint(self, text_content: str) -> int:
+        # Stands in for the SQLite-backed lookup: slow enough for two adds to overlap
+        time.sleep(0.05)
+        return len(text_content)
+
+    def find_duplicate(self, fingerprint, pending=()):
+        for queued, doc_id, source in list(pending) + self.saved:
+            if queued == fingerprint:
+                return {"status": "duplicate", "duplicate_of": doc_id, "source": source}
+        return None
+
+    def _manual_chunks(self, text_content: str, source_name: str, metadata: dict = None):
+        return [Document(page_content=text_content, metadata={"source": source_name})], [f"{source_name}-0"]
+
+    @staticmethod
+    def _added(chunks, source_name: str) -> dict:
+        return {"status": "success", "chunks_added": str(len(chunks)), "source": source_name}
+
+    async def aupsert_chunks(self, chunks, ids):
+        self.upserts += 1
+        if self.upserts <= self.failures:
+            raise ConnectionError("upstream unavailable")
+        self.written.update(zip(ids, chunks))
+
+    def remember_note(self, fingerprint, ids, source_name: str):
+        self.saved.append((fingerprint, ids[0], source_name))
+
+
+def test_failed_background_flush_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr("write_buffer.FLUSH_RETRY_BASE_DELAY", 0.05)
+    builder = StubBuilder(failures=2)
+    buffer = WriteBuffer(builder, max_delay=0.05)
+
+    async def scenario():
+        assert (await buffer.add("a note", "note"))["status"] == "queued"
+        for _ in range(100):
+            if builder.written:
+                break
+            await asyncio.sleep(0.02)
+
+    asyncio.run(scenario())
+    assert builder.upserts == 3
+    assert list(builder.written) == ["note-0"]
+    assert len(buffer) == 0
+    assert builder.saved == [(6, "note-0", "note")]
+
+
+def test_concurrent_copies_of_a_note_are_queued_once():
+    builder = StubBuilder()
+    buffer = WriteBuffer(builder, max_delay=60)
+
+    async def scenario():
+        return await asyncio.gather(buffer.add("same note", "a"), buffer.add("same note", "b"))
+
+    results = asyncio.run(scenario())
+    assert sorted(result["status"] for result in results) == ["duplicate", "queued"]
+    assert len(buffer) == 1
+    assert buffer.duplicates == 1
+
+
+def run(code: str, env: dict) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120
+    )
+
+
+def test_queued_note_is_written_on_shutdown(tmp_path):
+    env = dict(
+        os.environ,
+        VECTOR_STORE_BACKEND="local",
+        LOCAL_INDEX_DIR=str(tmp_path / "local_index"),
+        LEXICAL_INDEX_DIR=str(tmp_path / "lexical"),
+        BUILD_MANIFEST_DIR=str(tmp_path / "manifests"),
+        WRITE_BUFFER_MAX_DELAY="60",
+    )
+    queued = run(QUEUE_AND_EXIT, env)
+    assert queued.returncode == 0, queued.stderr
+    assert queued.stdout.strip() == "queued"
+    assert "Flush on shutdown: Wrote 1 chunk(s)" in queued.stderr
+
+    # The next process sees the note
+    counted = run(COUNT_VECTORS, env)
+    assert counted.returncode == 0, counted.stderr
+    assert counted.stdout.strip().splitlines()[-1] == "1"
@@ -0,0 +1,38 @@
+# tokens.py - Token counting with the tokenizer used by the OpenAI embedding models
+from functools import lru_cache
+from typing import List
+
+ENCODING_NAME = "cl100k_base"
+# Texts averaging fewer characters than this are encoded sequentially
+BATCH_MIN_CHARS = 4096
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Return the tiktoken encoding, or None when tiktoken or its BPE file is unavailable"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        # Offline boxes may not be able to download the BPE ranks
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        # ~4 characters per token for English prose
+        return len(text) // 4 + 1
+    return len(encoding.encode_ordinary(text))
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    encoding = get_encoding()
+    if encoding is None:
+        return [len(t) // 4 + 1 for t in texts]
+    # encode_ordinary_batch submits one thread-pool task per text, which costs
+    # more than encoding a short string (e.g. the lines counted by chunker.py)
+    if sum(map(len, texts)) < BATCH_MIN_CHARS * len(texts):
+        encode = encoding.encode_ordinary
+        return [len(encode(t)) for t in texts]
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts)]
@@ -0,0 +1,239 @@
+# vectorstore.py - Pluggable vector store backends (Pinecone cloud or embedded local index)
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from dotenv import load_dotenv
+from metrics import metrics
+from resilience import get_upstream
+
+# Load environment variables from .env file
+load_dotenv()
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# "pinecone" (default), "local", or "snapshot" (read-only, served straight from a snapshot file)
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone").lower()
+# Local backend settings: one sub-folder per index name, "exact" or "ivf" search
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(SCRIPT_DIR, "local_index"))
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "exact").lower()
+LOCAL_IVF_NLIST = int(os.getenv("LOCAL_IVF_NLIST", "0"))
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+# Compressed first search stage ("none", "int8" or "binary") and candidates rescored per result
+LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none").lower()
+LOCAL_RESCORE_FACTOR = int(os.getenv("LOCAL_RESCORE_FACTOR", "40"))
+
+BACKENDS = ("pinecone", "local", "snapshot")
+
+# Default namespace (partition) for builds and queries; empty = the index's default namespace
+VECTOR_NAMESPACE = os.getenv("VECTOR_NAMESPACE", "")
+_NAMESPACE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+# Metadata fields the query tools filter on ("page" takes ranges)
+FILTER_FIELDS = ("source", "file_name", "type", "page")
+
+# Bumped on every write made through this process, so readers can drop cached results
+_index_generation = 0
+
+
+def mark_index_updated():
+    """Record that the index content changed (invalidates retriever result caches)"""
+    global _index_generation
+    _index_generation += 1
+
+
+def index_generation() -> int:
+    return _index_generation
+
+
+def _check_backend(backend: str) -> str:
+    backend = (backend or VECTOR_STORE_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{backend}', expected one of {BACKENDS}")
+    return backend
+
+
+def partition_name(index_name: str, namespace: Optional[str] = None) -> str:
+    """Name of one namespace of an index, used for its local files (index, lexical index, manifest)"""
+    if not namespace:
+        return index_name
+    if not _NAMESPACE.match(namespace):
+        raise ValueError(f"Invalid namespace '{namespace}': use 1-64 letters, digits, '_' or '-'")
+    return f"{index_name}.{namespace}"
+
+
+def build_filter(
+    source: str = None,
+    file_name: str = None,
+    type: str = None,
+    page_from: int = None,
+    page_to: int = None,
+) -> Optional[Dict[str, Any]]:
+    """Pinecone-style metadata filter from the query tool arguments (None when unfiltered)"""
+    filter = {}
+    for key, value in (("source", source), ("file_name", file_name), ("type", type)):
+        if value:
+            filter[key] = {"$eq": value}
+    page = {}
+    if page_from is not None:
+        page["$gte"] = page_from
+    if page_to is not None:
+        page["$lte"] = page_to
+    if page:
+        filter["page"] = page
+    return filter or None
+
+
+def condition_holds(value: Any, condition: Any) -> bool:
+    """Whether a metadata value satisfies one filter condition ({"$gte": 3}, {"$in": [...]}, or a plain value)"""
+    if not isinstance(condition, dict):
+        condition = {"$eq": condition}
+    for op, operand in condition.items():
+        check = _OPERATORS.get(op)
+        if check is None:
+            raise ValueError(f"Unsupported filter operator '{op}', expected one of {tuple(_OPERATORS)}")
+        try:
+            if not check(value, operand):
+                return False
+        except TypeError:
+            # Ranges never match values of another type (or missing ones)
+            return False
+    return True
+
+
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+}
+
+
+def get_vector_store(
+    index_name: str, embedding: Embeddings, backend: str = None, namespace: Optional[str] = None
+) -> VectorStore:
+    """Open the configured vector store for an existing index (and namespace)
+
+    Pinecone namespaces are native partitions of the index; the local
+    backend keeps each namespace in its own directory and the snapshot
+    backend reads each one from its own snapshot file (see snapshot.py).
+    """
+    backend = _check_backend(backend)
+    if backend == "snapshot":
+        from snapshot import open_snapshot_store
+        return open_snapshot_store(partition_name(index_name, namespace), embedding)
+    if backend == "local":
+        from local_index import LocalVectorStore
+        return LocalVectorStore(
+            index_dir=os.path.join(LOCAL_INDEX_DIR, partition_name(index_name, namespace)),
+            embedding=embedding,
+            mode=LOCAL_INDEX_MODE,
+            nlist=LOCAL_IVF_NLIST,
+            nprobe=LOCAL_IVF_NPROBE,
+            quantization=LOCAL_INDEX_QUANTIZATION,
+            rescore_factor=LOCAL_RESCORE_FACTOR,
+        )
+
+    from langchain_pinecone import PineconeVectorStore
+    partition_name(index_name, namespace)  # same namespace rules on every backend
+    return PineconeVectorStore(index_name=index_name, embedding=embedding, namespace=namespace or None)
+
+
+def finalize_vector_store(vectorstore: VectorStore):
+    """Post-build maintenance: retrain the IVF lists of a local index in ivf mode"""
+    if getattr(vectorstore, "mode", None) == "ivf":
+        vectorstore.build_ivf()
+
+
+def upsert_vectors(
+    vectorstore: VectorStore,
+    ids: List[str],
+    vectors: List[List[float]],
+    texts: List[str],
+    metadatas: List[dict],
+    batch_size: int = 100,
+    resilient: bool = False,
+):
+    """Upsert precomputed embeddings without re-embedding the texts
+
+    resilient=True sends Pinecone batches through the "pinecone" upstream
+    policy (timeouts, retries, circuit breaker); bulk ingestion leaves it
+    off because IngestEngine retries on its own.
+    """
+    with metrics.span("vector.upsert"):
+        _upsert_vectors(vectorstore, ids, vectors, texts, metadatas, batch_size, resilient)
+    metrics.inc("vectors.written", len(ids))
+
+
+def _upsert_vectors(vectorstore, ids, vectors, texts, metadatas, batch_size, resilient):
+    if hasattr(vectorstore, "add_vectors"):
+        vectorstore.add_vectors(ids, vectors, texts, metadatas)
+        return
+
+    # Pinecone: the text is stored in metadata under the store's text key
+    text_key = getattr(vectorstore, "_text_key", "text")
+    records = [
+        (doc_id, vector, {**metadata, text_key: text})
+        for doc_id, vector, text, metadata in zip(ids, vectors, texts, metadatas)
+    ]
+    namespace = getattr(vectorstore, "_namespace", None)
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        if resilient:
+            # Upserts by ID are idempotent, so they may be retried, but never hedged
+            get_upstream("pinecone").call(lambda: vectorstore.index.upsert(vectors=batch, namespace=namespace), hedge=False)
+        else:
+            vectorstore.index.upsert(vectors=batch, namespace=namespace)
+
+
+def fetch_vectors(vectorstore: VectorStore, ids: List[str]) -> Dict[str, List[float]]:
+    """Stored embeddings by vector ID (IDs missing from the index are left out)"""
+    if not ids:
+        return {}
+    if hasattr(vectorstore, "get_vectors"):
+        return vectorstore.get_vectors(ids)
+    response = vectorstore.index.fetch(ids=list(ids), namespace=getattr(vectorstore, "_namespace", None) or "")
+    return {doc_id: vector.values for doc_id, vector in response.vectors.items()}
+
+
+def iter_records(
+    vectorstore: VectorStore, batch_size: int = 100
+) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[dict]]]:
+    """Every stored record as batches of (ids, vectors, texts, metadatas), e.g. for snapshots
+
+    Pinecone IDs are enumerated with list(), which serverless indexes support.
+    """
+    if hasattr(vectorstore, "iter_records"):
+        yield from vectorstore.iter_records(batch_size)
+        return
+    namespace = getattr(vectorstore, "_namespace", None) or ""
+    text_key = getattr(vectorstore, "_text_key", "text")
+    for ids in vectorstore.index.list(namespace=namespace, limit=batch_size):
+        response = vectorstore.index.fetch(ids=ids, namespace=namespace)
+        found = [response.vectors[doc_id] for doc_id in ids if doc_id in response.vectors]
+        metadatas = [dict(vector.metadata or {}) for vector in found]
+        texts = [metadata.pop(text_key, "") for metadata in metadatas]
+        vectors = np.asarray([vector.values for vector in found], dtype=np.float32)
+        yield [vector.id for vector in found], vectors, texts, metadatas
+
+
+def index_stats(vectorstore: VectorStore) -> Dict[str, str]:
+    """Vector count, dimension and namespaces of an open index (values are strings)"""
+    if hasattr(vectorstore, "stats"):
+        return vectorstore.stats()
+
+    stats = vectorstore.index.describe_index_stats()
+    namespaces = stats.get("namespaces") or {}
+    info = {
+        "vectors": str(stats.get("total_vector_count", 0)),
+        "dimension": str(stats.get("dimension", "unknown")),
+        "namespaces": ", ".join(f"{name or '(default)'}={ns.get('vector_count', 0)}" for name, ns in namespaces.items()) or "none",
+    }
+    if stats.get("index_fullness") is not None:
+        info["index_fullness"] = f"{stats['index_fullness']:.2%}"
+    return info
@@ -0,0 +1,227 @@
+# write_buffer.py - Write-behind buffer that batches knowledge notes into one embedding + upsert
+import asyncio
+import atexit
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Flush once this many chunks are pending, or this many seconds after the first one (0 = write-through)
+WRITE_BUFFER_MAX_CHUNKS = int(os.getenv("WRITE_BUFFER_MAX_CHUNKS", "32"))
+WRITE_BUFFER_MAX_DELAY = float(os.getenv("WRITE_BUFFER_MAX_DELAY", "2.0"))
+# Backoff between background retries of a failed flush (seconds, doubling up to the max)
+FLUSH_RETRY_BASE_DELAY = 1.0
+FLUSH_RETRY_MAX_DELAY = 60.0
+
+
+class WriteBuffer:
+    """Collect chunks from add_knowledge_text and write them in batches
+
+    Notes are chunked as they arrive but embedded and upserted together
+    when the buffer fills up, when the oldest pending note reaches
+    max_delay, on an explicit flush() and at interpreter exit. Chunks with
+    the same ID are coalesced, so re-saving a note inside one window costs
+    a single write. A failed flush puts its chunks back and is retried in
+    the background with backoff.
+
+    A note's fingerprint is stored only once its flush succeeded; until
+    then near-duplicates are caught against the queued notes in memory.
+    """
+
+    def __init__(self, builder, max_chunks: int = WRITE_BUFFER_MAX_CHUNKS, max_delay: float = WRITE_BUFFER_MAX_DELAY):
+        self.builder = builder
+        self.max_chunks = max(1, max_chunks)
+        self.max_delay = max_delay
+        self.written = 0
+        self.flushes = 0
+        self.duplicates = 0
+        self.last_error: Optional[str] = None
+        self._pending: "OrderedDict[str, Document]" = OrderedDict()
+        # (fingerprint, chunk IDs, source) of queued notes, and of the notes being flushed
+        self._notes: List[Tuple[Optional[int], List[str], str]] = []
+        self._flushing: List[Tuple[Optional[int], List[str], str]] = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._add_lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _take(self) -> "OrderedDict[str, Document]":
+        with self._pending_lock:
+            batch, self._pending = self._pending, OrderedDict()
+            self._flushing, self._notes = self._notes, []
+            return batch
+
+    def _restore(self, batch: "OrderedDict[str, Document]"):
+        with self._pending_lock:
+            # Newer versions of a chunk (added while the flush ran) win
+            for doc_id, doc in batch.items():
+                self._pending.setdefault(doc_id, doc)
+            self._notes[:0], self._flushing = self._flushing, []
+
+    def _written(self):
+        """The flush succeeded: its notes now count as saved for duplicate checks"""
+        with self._pending_lock:
+            notes, self._flushing = self._flushing, []
+        for fingerprint, ids, source_name in notes:
+            self.builder.remember_note(fingerprint, ids, source_name)
+
+    def _queued(self) -> List[Tuple[int, str, str]]:
+        with self._pending_lock:
+            return [
+                (fingerprint, ids[0], source_name)
+                for fingerprint, ids, source_name in self._flushing + self._notes
+                if fingerprint is not None
+            ]
+
+    async def add(self, text_content: str, source_name: str = "manual_entry", metadata: dict = None) -> Dict[str, str]:
+        """Queue a note; returns once it is buffered (or written, when the buffer is full)"""
+        if not text_content or not text_content.strip():
+            return {"status": "error", "message": "Text content is empty"}
+
+        if self._add_lock is None:
+            self._add_lock = asyncio.Lock()
+        # The duplicate lookup reads SQLite, so it runs off the loop; the lock keeps two
+        # copies of a note from both passing the check before either is queued
+        async with self._add_lock:
+            fingerprint, duplicate = await asyncio.to_thread(self._check_duplicate, text_content)
+            if duplicate:
+                self.duplicates += 1
+                return duplicate
+            with metrics.span("write.chunk"):
+                chunks, ids = self.builder._manual_chunks(text_content, source_name, metadata)
+            metrics.inc("write.queued")
+            with self._pending_lock:
+                for doc_id, chunk in zip(ids, chunks):
+                    self._pending.pop(doc_id, None)
+                    self._pending[doc_id] = chunk
+                self._notes.append((fingerprint, ids, source_name))
+                pending = len(self._pending)
+
+        if pending >= self.max_chunks or self.max_delay <= 0:
+            result = await self.flush()
+            if result["status"] == "error":
+                # The chunks are back in the buffer; keep retrying them in the background
+                self._schedule()
+                return result
+            return self.builder._added(chunks, source_name)
+
+        self._schedule()
+        return {
+            "status": "queued",
+            "message": f"Queued {len(chunks)} chunk(s) from '{source_name}'; written within {self.max_delay:g}s or on flush_knowledge",
+            "chunks_added": str(len(chunks)),
+            "source": source_name,
+            "pending_chunks": str(pending),
+        }
+
+    def _check_duplicate(self, text_content: str) -> Tuple[Optional[int], Optional[Dict[str, str]]]:
+        """(fingerprint, duplicate response or None) of a note against saved and queued notes"""
+        fingerprint = self.builder.note_fingerprint(text_content)
+        return fingerprint, self.builder.find_duplicate(fingerprint, pending=self._queued())
+
+    def _schedule(self):
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        """Flush after max_delay; retry failed flushes with backoff until the buffer is empty"""
+        delay = self.max_delay
+        failures = 0
+        while True:
+            await asyncio.sleep(delay)
+            result = await self.flush()
+            if not len(self):
+                return
+            if result["status"] == "error":
+                failures += 1
+                delay = min(FLUSH_RETRY_MAX_DELAY, FLUSH_RETRY_BASE_DELAY * 2 ** (failures - 1))
+                print(f"Background flush failed: {result['message']}; retrying in {delay:g}s", file=sys.stderr)
+            else:
+                # Notes queued while the flush ran get their own window
+                failures = 0
+                delay = self.max_delay
+
+    async def flush(self) -> Dict[str, str]:
+        """Embed and upsert every pending chunk in one batch"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            batch = self._take()
+            if not batch:
+                return {"status": "success", "message": "Nothing to flush", "chunks_written": "0"}
+            try:
+                with metrics.span("write.flush"):
+                    await self.builder.aupsert_chunks(list(batch.values()), list(batch.keys()))
+            except Exception as e:
+                self._restore(batch)
+                self.last_error = str(e)
+                return {"status": "error", "message": f"Failed to flush: {str(e)}", "pending_chunks": str(len(self))}
+            await asyncio.to_thread(self._written)
+            return self._flushed(batch)
+
+    def flush_sync(self) -> Dict[str, str]:
+        """Blocking flush for shutdown, when the server's event loop is gone"""
+        batch = self._take()
+        if not batch:
+            return {"status": "success", "message": "Nothing to flush", "chunks_written": "0"}
+        try:
+            with metrics.span("write.flush"):
+                self.builder.upsert_chunks(list(batch.values()), list(batch.keys()))
+        except Exception as e:
+            self._restore(batch)
+            self.last_error = str(e)
+            return {"status": "error", "message": f"Failed to flush: {str(e)}", "pending_chunks": str(len(self))}
+        self._written()
+        return self._flushed(batch)
+
+    def _flushed(self, batch: "OrderedDict[str, Document]") -> Dict[str, str]:
+        self.written += len(batch)
+        self.flushes += 1
+        self.last_error = None
+        return {
+            "status": "success",
+            "message": f"Wrote {len(batch)} chunk(s) in one batch",
+            "chunks_written": str(len(batch)),
+        }
+
+    def stats(self) -> Dict[str, str]:
+        info = {
+            "pending_chunks": str(len(self)),
+            "chunks_written": str(self.written),
+            "flushes": str(self.flushes),
+            "duplicates_skipped": str(self.duplicates),
+        }
+        if self.last_error:
+            info["last_error"] = self.last_error
+        return info
+
+
+# Singleton instance
+_buffer = None
+
+def get_write_buffer() -> WriteBuffer:
+    """Get or create the write buffer on top of the long-lived builder"""
+    global _buffer
+    if _buffer is None:
+        from builder import get_builder
+        _buffer = WriteBuffer(get_builder())
+        atexit.register(flush_on_shutdown)
+    return _buffer
+
+
+def flush_on_shutdown():
+    """Write pending notes before the process exits (also registered with atexit)"""
+    if _buffer is not None and len(_buffer):
+        result = _buffer.flush_sync()
+        print(f"Flush on shutdown: {result['message']}", file=sys.stderr)